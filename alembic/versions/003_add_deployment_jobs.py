@@ -0,0 +1,45 @@
+"""Add deployment_jobs queue table
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('deployment_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('deployment_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('worker_id', sa.String(), nullable=True),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('enqueued_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['deployment_id'], ['deployments.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('deployment_id')
+    )
+    op.create_index(op.f('ix_deployment_jobs_id'), 'deployment_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_deployment_jobs_user_id'), 'deployment_jobs', ['user_id'], unique=False)
+    op.create_index('ix_deployment_jobs_status_enqueued_at', 'deployment_jobs', ['status', 'enqueued_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_deployment_jobs_status_enqueued_at', table_name='deployment_jobs')
+    op.drop_index(op.f('ix_deployment_jobs_user_id'), table_name='deployment_jobs')
+    op.drop_index(op.f('ix_deployment_jobs_id'), table_name='deployment_jobs')
+    op.drop_table('deployment_jobs')
@@ -0,0 +1,65 @@
+"""Move deployment logs to append-only deployment_log_chunks
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('deployment_log_chunks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('deployment_id', sa.Integer(), nullable=False),
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('byte_offset', sa.Integer(), nullable=False),
+        sa.Column('byte_length', sa.Integer(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['deployment_id'], ['deployments.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('deployment_id', 'seq', name='uq_deployment_log_chunks_deployment_seq')
+    )
+    
+    # Existing logs become the first chunk of each deployment, copied server-side
+    # so no log text passes through the migration process
+    byte_length = "octet_length(logs)" if op.get_bind().dialect.name == 'postgresql' else "length(CAST(logs AS BLOB))"
+    op.execute(
+        "INSERT INTO deployment_log_chunks (deployment_id, seq, byte_offset, byte_length, content) "
+        f"SELECT id, 0, 0, {byte_length}, logs FROM deployments WHERE logs IS NOT NULL AND logs <> ''"
+    )
+    
+    with op.batch_alter_table('deployments') as batch_op:
+        batch_op.drop_column('logs')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('deployments') as batch_op:
+        batch_op.add_column(sa.Column('logs', sa.Text(), nullable=True))
+    
+    # Concatenate each deployment's chunks back in order, server-side
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            "UPDATE deployments SET logs = chunks.logs FROM ("
+            "SELECT deployment_id, string_agg(content, '' ORDER BY seq) AS logs "
+            "FROM deployment_log_chunks GROUP BY deployment_id"
+            ") chunks WHERE deployments.id = chunks.deployment_id"
+        )
+    else:
+        op.execute(
+            "UPDATE deployments SET logs = (SELECT group_concat(content, '') FROM ("
+            "SELECT content FROM deployment_log_chunks "
+            "WHERE deployment_log_chunks.deployment_id = deployments.id ORDER BY seq"
+            ")) WHERE id IN (SELECT deployment_id FROM deployment_log_chunks)"
+        )
+    
+    op.drop_table('deployment_log_chunks')
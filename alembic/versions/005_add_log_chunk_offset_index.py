@@ -0,0 +1,29 @@
+"""Index deployment_log_chunks by byte offset for ranged reads
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_deployment_log_chunks_deployment_offset',
+        'deployment_log_chunks',
+        ['deployment_id', 'byte_offset'],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_deployment_log_chunks_deployment_offset', table_name='deployment_log_chunks')
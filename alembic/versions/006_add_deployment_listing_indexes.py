@@ -0,0 +1,33 @@
+"""Add indexes for keyset-paginated deployment listings
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_deployments_project_started_at_id',
+        'deployments',
+        ['project_id', 'started_at', 'id'],
+        unique=False
+    )
+    op.create_index('ix_deployments_started_at_id', 'deployments', ['started_at', 'id'], unique=False)
+    op.create_index(op.f('ix_projects_user_id'), 'projects', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_projects_user_id'), table_name='projects')
+    op.drop_index('ix_deployments_started_at_id', table_name='deployments')
+    op.drop_index('ix_deployments_project_started_at_id', table_name='deployments')
@@ -0,0 +1,38 @@
+"""Add deployment_archive table for retention
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('deployment_archive',
+        sa.Column('deployment_id', sa.Integer(), nullable=False),
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('archived_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint('deployment_id')
+    )
+    op.create_index(op.f('ix_deployment_archive_project_id'), 'deployment_archive', ['project_id'], unique=False)
+    op.create_index(op.f('ix_deployment_archive_user_id'), 'deployment_archive', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_deployment_archive_user_id'), table_name='deployment_archive')
+    op.drop_index(op.f('ix_deployment_archive_project_id'), table_name='deployment_archive')
+    op.drop_table('deployment_archive')
@@ -0,0 +1,66 @@
+"""Add deployment_daily_stats rollup table
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('deployment_daily_stats',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('deployment_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('duration_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('duration_sum', sa.Float(), server_default='0', nullable=False),
+        sa.Column('duration_sum_sq', sa.Float(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'project_id', 'day', 'status', name='uq_deployment_daily_stats_key')
+    )
+    op.create_index('ix_deployment_daily_stats_user_day', 'deployment_daily_stats', ['user_id', 'day'], unique=False)
+    op.create_index('ix_deployment_daily_stats_project_day', 'deployment_daily_stats', ['project_id', 'day'], unique=False)
+    op.create_index('ix_deployment_daily_stats_day', 'deployment_daily_stats', ['day'], unique=False)
+    
+    # Seed the rollup from existing (live and archived) deployments; from here
+    # on status transitions only apply deltas to it
+    if op.get_bind().dialect.name == 'postgresql':
+        day = "CAST(timezone('UTC', {0}.started_at) AS DATE)"
+        duration = "CAST(EXTRACT(EPOCH FROM {0}.completed_at - {0}.started_at) AS DOUBLE PRECISION)"
+    else:
+        day = "date({0}.started_at)"
+        duration = "(julianday({0}.completed_at) - julianday({0}.started_at)) * 86400.0"
+    op.execute(f"""
+        INSERT INTO deployment_daily_stats
+            (user_id, project_id, day, status, deployment_count, duration_count, duration_sum, duration_sum_sq)
+        SELECT user_id, project_id, day, status, count(*), count(duration),
+               coalesce(sum(duration), 0), coalesce(sum(duration * duration), 0)
+        FROM (
+            SELECT projects.user_id, d.project_id, {day.format('d')} AS day, d.status,
+                   {duration.format('d')} AS duration
+            FROM deployments d JOIN projects ON projects.id = d.project_id
+            UNION ALL
+            SELECT a.user_id, a.project_id, {day.format('a')}, a.status, {duration.format('a')}
+            FROM deployment_archive a
+        ) history
+        GROUP BY user_id, project_id, day, status
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_deployment_daily_stats_day', table_name='deployment_daily_stats')
+    op.drop_index('ix_deployment_daily_stats_project_day', table_name='deployment_daily_stats')
+    op.drop_index('ix_deployment_daily_stats_user_day', table_name='deployment_daily_stats')
+    op.drop_table('deployment_daily_stats')
@@ -0,0 +1,69 @@
+"""Add deployment_duration_bins for duration percentiles
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+import math
+
+from alembic import op
+import sqlalchemy as sa
+
+# DDSketch parameters the bins are written with (utils/sketches.py)
+RELATIVE_ACCURACY = 0.01
+MIN_INDEXABLE_VALUE = 1e-3
+
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('deployment_duration_bins',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('bin', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('project_id', 'day', 'bin', name='uq_deployment_duration_bins_key')
+    )
+    op.create_index('ix_deployment_duration_bins_user_day', 'deployment_duration_bins', ['user_id', 'day'], unique=False)
+    
+    # Seed the sketches from existing finished (live and archived) deployments:
+    # each duration lands in bin ceil(ln(duration) / ln(gamma))
+    log_gamma = math.log((1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY))
+    if op.get_bind().dialect.name == 'postgresql':
+        day = "CAST(timezone('UTC', {0}.started_at) AS DATE)"
+        duration = "CAST(EXTRACT(EPOCH FROM {0}.completed_at - {0}.started_at) AS DOUBLE PRECISION)"
+        floor_at = "GREATEST"
+    else:
+        day = "date({0}.started_at)"
+        duration = "(julianday({0}.completed_at) - julianday({0}.started_at)) * 86400.0"
+        floor_at = "max"
+    op.execute(f"""
+        INSERT INTO deployment_duration_bins (user_id, project_id, day, bin, count)
+        SELECT user_id, project_id, day,
+               CAST(ceil(ln({floor_at}(duration, {MIN_INDEXABLE_VALUE!r})) / {log_gamma!r}) AS INTEGER) AS bin,
+               count(*)
+        FROM (
+            SELECT projects.user_id, d.project_id, {day.format('d')} AS day, {duration.format('d')} AS duration
+            FROM deployments d JOIN projects ON projects.id = d.project_id
+            WHERE d.completed_at IS NOT NULL
+            UNION ALL
+            SELECT a.user_id, a.project_id, {day.format('a')}, {duration.format('a')}
+            FROM deployment_archive a
+            WHERE a.completed_at IS NOT NULL
+        ) history
+        GROUP BY user_id, project_id, day, bin
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_deployment_duration_bins_user_day', table_name='deployment_duration_bins')
+    op.drop_table('deployment_duration_bins')
@@ -0,0 +1,27 @@
+"""Add last_seen_at to users for active-user metrics
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Written in batches by the last-seen tracker; NULL until a user's first authenticated request
+    op.add_column('users', sa.Column('last_seen_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index('ix_users_last_seen_at', 'users', ['last_seen_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_last_seen_at', table_name='users')
+    op.drop_column('users', 'last_seen_at')
@@ -0,0 +1,25 @@
+"""Add heartbeat_at to deployment_jobs for stale-job recovery
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Refreshed by the worker running the job; stale heartbeats mean the worker died
+    op.add_column('deployment_jobs', sa.Column('heartbeat_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('deployment_jobs', 'heartbeat_at')
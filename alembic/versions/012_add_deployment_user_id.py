@@ -0,0 +1,41 @@
+"""Denormalize user_id onto deployments for per-user keyset listings
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('deployments', sa.Column('user_id', sa.Integer(), nullable=True))
+    
+    # Copy each deployment's owner from its project
+    op.execute(
+        "UPDATE deployments SET user_id = "
+        "(SELECT projects.user_id FROM projects WHERE projects.id = deployments.project_id)"
+    )
+    
+    op.alter_column('deployments', 'user_id', nullable=False)
+    op.create_foreign_key('fk_deployments_user_id', 'deployments', 'users', ['user_id'], ['id'])
+    op.create_index(
+        'ix_deployments_user_started_at_id',
+        'deployments',
+        ['user_id', 'started_at', 'id'],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_deployments_user_started_at_id', table_name='deployments')
+    op.drop_constraint('fk_deployments_user_id', 'deployments', type_='foreignkey')
+    op.drop_column('deployments', 'user_id')
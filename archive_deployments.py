@@ -0,0 +1,21 @@
+"""
+Script to apply the deployment retention policy.
+Moves finished deployments older than DEPLOY_RETENTION_DAYS, or beyond the
+latest DEPLOY_RETENTION_KEEP_LATEST per project, into deployment_archive.
+Run it periodically (e.g. from cron).
+"""
+from database import SessionLocal
+from utils.retention import archive_deployments
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        result = archive_deployments(db)
+        print(
+            f"🗄️  Archived {result['archived']} deployments in {result['batches']} batches "
+            f"(older than {result['retention_days']} days or beyond latest {result['keep_latest']} per project)"
+        )
+    except Exception as e:
+        print(f"❌ Error archiving deployments: {e}")
+    finally:
+        db.close()
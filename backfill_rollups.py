@@ -0,0 +1,16 @@
+"""
+Script to rebuild the deployment_daily_stats rollup from the deployments table.
+Run it once after migrating, or whenever the rollup needs to be recomputed.
+"""
+from database import SessionLocal
+from utils.rollups import backfill_daily_stats
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        rows = backfill_daily_stats(db)
+        print(f"📊 Rebuilt deployment_daily_stats with {rows} rows")
+    except Exception as e:
+        print(f"❌ Error rebuilding rollups: {e}")
+    finally:
+        db.close()
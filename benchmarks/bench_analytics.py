@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark user analytics: loading every Deployment row into Python vs the daily rollup.
+
+Usage: python benchmarks/bench_analytics.py [N ...]
+Seeds a throwaway SQLite database with N deployments (default 100000) for one
+user and reports latency and peak Python memory of each approach.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import User, Project, Deployment, DeploymentStatus
+from routers.analytics import _compute_user_analytics
+from utils.rollups import backfill_daily_stats
+
+PROJECTS = 20
+STATUSES = list(DeploymentStatus)
+
+
+def seed(db, n: int) -> User:
+    user = User(email="bench@example.com", hashed_password="x", is_active=True, is_admin=False)
+    db.add(user)
+    db.flush()
+    projects = [
+        Project(name=f"bench-{i}", github_url=f"https://github.com/bench/p{i}", user_id=user.id)
+        for i in range(PROJECTS)
+    ]
+    db.add_all(projects)
+    db.flush()
+
+    now = datetime.utcnow()
+    rows = []
+    for i in range(n):
+        started_at = now - timedelta(seconds=random.randint(0, 29 * 86400))
+        rows.append({
+            "project_id": projects[i % PROJECTS].id,
+            "status": random.choice(STATUSES),
+            "started_at": started_at,
+            "completed_at": started_at + timedelta(seconds=random.randint(5, 600))
+        })
+    db.execute(insert(Deployment), rows)
+    db.commit()
+    backfill_daily_stats(db)
+    return user
+
+
+def legacy_user_analytics(db, user: User, start: datetime, end: datetime) -> dict:
+    """The previous implementation: every matching row is materialized and looped over"""
+    deployments = db.query(Deployment).join(Project).filter(
+        Project.user_id == user.id,
+        Deployment.started_at.between(start, end)
+    ).all()
+    status_counts, durations, daily_trend = {}, [], {}
+    for deployment in deployments:
+        status_counts[deployment.status.value] = status_counts.get(deployment.status.value, 0) + 1
+        if deployment.completed_at and deployment.started_at:
+            durations.append((deployment.completed_at - deployment.started_at).total_seconds())
+        day = deployment.started_at.date().isoformat()
+        daily_trend[day] = daily_trend.get(day, 0) + 1
+    return {
+        "deployment_status": status_counts,
+        "avg": sum(durations) / len(durations) if durations else 0,
+        "daily_trend": daily_trend
+    }
+
+
+def measure(fn):
+    """Run fn and return (result, elapsed ms, peak traced memory in MiB)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / (1024 * 1024)
+
+
+def run(n: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+
+        db = Session()
+        user_id = seed(db, n).id
+        end = datetime.utcnow()
+        start = end - timedelta(days=30)
+
+        results = {}
+        db.expunge_all()
+        user = db.get(User, user_id)
+        legacy, *results["python loop"] = measure(lambda: legacy_user_analytics(db, user, start, end))
+        db.expunge_all()
+        user = db.get(User, user_id)
+        current, *results["daily rollup"] = measure(
+            lambda: _compute_user_analytics(db, user, start, end, start.isoformat(), end.isoformat())
+        )
+        db.close()
+        engine.dispose()
+
+    assert legacy["deployment_status"] == current["deployment_status"]
+    assert round(legacy["avg"], 2) == current["summary"]["avg_deployment_time_seconds"]
+
+    print(f"\nN = {n}")
+    for name, (elapsed, peak) in results.items():
+        print(f"  {name:<15} {elapsed:10.1f} ms  peak {peak:8.2f} MiB")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100000]
+    for size in sizes:
+        run(size)
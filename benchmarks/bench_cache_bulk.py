@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Benchmark N-key cache latency: one round trip per key vs bulk/pipelined calls.
+
+Usage: python benchmarks/bench_cache_bulk.py [N ...]
+Requires a reachable Redis at settings.REDIS_URL.
+"""
+import os
+import sys
+import time
+
+# Add the parent directory to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.cache import cache
+
+
+def timed(fn) -> float:
+    """Run fn once and return the elapsed time in milliseconds"""
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def run(n: int):
+    keys = [f"bench:project:{i}:stats" for i in range(n)]
+    values = {key: {"deployments": i, "success_rate": 99.5} for i, key in enumerate(keys)}
+
+    results = {
+        "set (loop)": timed(lambda: [cache.set(key, value, 60) for key, value in values.items()]),
+        "set_many": timed(lambda: cache.set_many(values, ttl=60)),
+        "get (loop)": timed(lambda: [cache.get(key) for key in keys]),
+        "get_many": timed(lambda: cache.get_many(keys)),
+        "delete (loop)": timed(lambda: [cache.delete(key) for key in keys]),
+    }
+    cache.set_many(values, ttl=60)
+    results["delete_many"] = timed(lambda: cache.delete_many(keys))
+
+    print(f"\nN = {n}")
+    for name, elapsed in results.items():
+        print(f"  {name:<14} {elapsed:10.2f} ms  ({elapsed / n * 1000:8.1f} µs/key)")
+
+
+if __name__ == "__main__":
+    if not cache.is_connected():
+        print("❌ Redis is not reachable, nothing to benchmark")
+        sys.exit(1)
+
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10, 100, 1000]
+    for size in sizes:
+        run(size)
@@ -16,6 +16,58 @@ class Settings(BaseSettings):
     FRONTEND_URL: str = os.getenv("FRONTEND_URL", "*")
     
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    
+    # Cache stampede protection
+    CACHE_EARLY_REFRESH_BETA: float = 1.0
+    CACHE_LOCK_TIMEOUT_SECONDS: int = 10
+    ANALYTICS_CACHE_TTL: int = 60
+    ENTITY_CACHE_TTL: int = 30
+    # Admin dashboards are served from snapshots refreshed on this interval (0 computes per request)
+    ADMIN_SNAPSHOT_INTERVAL_SECONDS: int = 30
+    # Rows fetched from the server-side cursor per batch when exporting
+    EXPORT_BATCH_SIZE: int = 1000
+    # Users' last-seen times are buffered in memory and written in one batch per interval
+    LAST_SEEN_FLUSH_INTERVAL_SECONDS: float = 30.0
+    # Ad-hoc admin analytics engine: "sql" queries the database, "columnar"
+    # answers from an in-memory NumPy snapshot (falls back to SQL without NumPy)
+    ANALYTICS_ENGINE: str = "sql"
+    ANALYTICS_COLUMNAR_REFRESH_SECONDS: int = 60
+    
+    # Redis connection resilience
+    CACHE_SOCKET_TIMEOUT: float = 0.5
+    CACHE_BREAKER_FAILURE_THRESHOLD: int = 3
+    CACHE_BREAKER_WINDOW_SECONDS: float = 10.0
+    CACHE_RECONNECT_BASE_BACKOFF_SECONDS: float = 1.0
+    CACHE_RECONNECT_MAX_BACKOFF_SECONDS: float = 60.0
+    
+    # Deployment worker pool
+    DEPLOY_WORKERS: int = 4
+    DEPLOY_MAX_CONCURRENT: int = 20
+    DEPLOY_MAX_CONCURRENT_PER_USER: int = 2
+    DEPLOY_POLL_INTERVAL_SECONDS: float = 1.0
+    # Running jobs heartbeat on this interval; one whose worker hasn't heartbeated
+    # for DEPLOY_JOB_TIMEOUT_SECONDS is requeued by the periodic stale-job sweep
+    DEPLOY_HEARTBEAT_INTERVAL_SECONDS: float = 10.0
+    DEPLOY_JOB_TIMEOUT_SECONDS: int = 60
+    DEPLOY_STEP_DELAY_SCALE: float = 1.0
+    # What a new trigger does with a project's not-yet-started deployment:
+    # "off" queues another one, "join" returns it, "supersede" cancels it
+    DEPLOY_COALESCE_MODE: str = "off"
+    
+    # Retention: finished deployments older than N days, or beyond the latest K
+    # per project, are moved to the compressed archive (0 disables either rule)
+    DEPLOY_RETENTION_DAYS: int = 90
+    DEPLOY_RETENTION_KEEP_LATEST: int = 100
+    DEPLOY_ARCHIVE_BATCH_SIZE: int = 500
+    
+    # Live log streaming
+    LOG_STREAM_POLL_INTERVAL_SECONDS: float = 0.5
+    LOG_STREAM_KEEPALIVE_SECONDS: float = 15.0
+    LOG_READ_MAX_BYTES: int = 1024 * 1024
+    
+    # Deployment event bus: "redis" fans out across workers, "memory" is process-local
+    EVENT_BUS_BACKEND: str = "redis"
+    
     APP_NAME: str = "Cloud Deploy API Gateway"
     VERSION: str = "1.0.0"
 
@@ -9,6 +9,7 @@ from models import User, RefreshToken
 from schemas import TokenData
 from config import settings
 from utils.security import verify_password
+from workers.activity import last_seen
 
 security = HTTPBearer()
 
@@ -36,6 +37,7 @@ def get_current_user(
         raise credentials_exception
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+    last_seen.touch(user.id)
     return user
 
 def require_admin(current_user: User = Depends(get_current_user)) -> User:
@@ -12,6 +12,9 @@ from routers.analytics import router as analytics_router
 from middleware.rate_limiter import rate_limit_middleware
 from middleware.request_logger import request_logger_middleware, error_handler_middleware
 from utils.logger import logger, setup_logger
+from workers.deployment_worker import worker_pool
+from workers.snapshotter import snapshotter
+from workers.activity import last_seen
 from schemas import HealthCheck
 
 @asynccontextmanager
@@ -25,8 +28,15 @@ async def lifespan(app: FastAPI):
     logger.info(f"📡 Database: {safe_url}")
     Base.metadata.create_all(bind=engine)
     logger.info("✅ Database tables created/verified")
+    if settings.DEPLOY_WORKERS > 0:
+        worker_pool.start()
+    snapshotter.start()
+    last_seen.start()
     yield
     logger.info("👋 Shutting down...")
+    last_seen.stop()
+    snapshotter.stop()
+    worker_pool.stop()
 
 app = FastAPI(
     title=settings.APP_NAME,
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Date, DateTime, Float, Boolean, ForeignKey, Text, LargeBinary, Index, UniqueConstraint, select
 from sqlalchemy.types import TypeDecorator
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship, validates
+from datetime import datetime
 import enum
 from database import Base
 
@@ -13,6 +14,8 @@ class User(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     is_active = Column(Boolean, default=True)
     is_admin = Column(Boolean, default=False, nullable=False)
+    # Flushed in batches by workers.activity.LastSeenTracker, so it lags by up to one interval
+    last_seen_at = Column(DateTime(timezone=True), nullable=True, index=True)
     projects = relationship("Project", back_populates="owner")
     refresh_tokens = relationship("RefreshToken", back_populates="user")
 
@@ -29,6 +32,20 @@ class DeploymentStatus(str, enum.Enum):
     FAILED = "failed"
     CANCELLED = "cancelled"
 
+# Statuses after which a deployment never changes again
+TERMINAL_DEPLOYMENT_STATUSES = (
+    DeploymentStatus.SUCCESS,
+    DeploymentStatus.FAILED,
+    DeploymentStatus.CANCELLED
+)
+
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
 # Custom TypeDecorator to handle Enum value mapping
 class ProjectStatusType(TypeDecorator):
     impl = String
@@ -58,13 +75,27 @@ class DeploymentStatusType(TypeDecorator):
             return DeploymentStatus(value)
         return value
 
+class JobStatusType(TypeDecorator):
+    impl = String
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, JobStatus):
+            return value.value
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None:
+            return JobStatus(value)
+        return value
+
 class Project(Base):
     __tablename__ = "projects"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     github_url = Column(String, nullable=False)
     status = Column(ProjectStatusType, default=ProjectStatus.ACTIVE)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     owner = relationship("User", back_populates="projects")
     deployments = relationship("Deployment", back_populates="project")
@@ -89,15 +120,134 @@ class Project(Base):
         else:
             return ProjectStatus.ACTIVE
 
+def _project_owner_id(context):
+    """Default a new deployment's user_id to its project's owner"""
+    return context.connection.execute(
+        select(Project.user_id).where(Project.id == context.get_current_parameters()["project_id"])
+    ).scalar()
+
 class Deployment(Base):
     __tablename__ = "deployments"
+    __table_args__ = (
+        # Keyset pagination on (started_at, id), per project, per user and overall
+        Index("ix_deployments_project_started_at_id", "project_id", "started_at", "id"),
+        Index("ix_deployments_user_started_at_id", "user_id", "started_at", "id"),
+        Index("ix_deployments_started_at_id", "started_at", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+    # Denormalized from projects.user_id so per-user listings page on their own index
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, default=_project_owner_id)
     status = Column(DeploymentStatusType, default=DeploymentStatus.PENDING)
-    logs = Column(Text, default="")
-    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Set client-side too so the value is stored at full precision in the same
+    # format the keyset cursor binds (SQLite's CURRENT_TIMESTAMP drops microseconds)
+    started_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
     completed_at = Column(DateTime(timezone=True), nullable=True)
     project = relationship("Project", back_populates="deployments")
+    log_chunks = relationship(
+        "DeploymentLogChunk",
+        back_populates="deployment",
+        order_by="DeploymentLogChunk.seq",
+        cascade="all, delete-orphan"
+    )
+
+    @property
+    def logs(self) -> str:
+        """Full log text, derived from the append-only log chunks"""
+        return "".join(chunk.content for chunk in self.log_chunks)
+
+class DeploymentLogChunk(Base):
+    """One append to a deployment's log; chunks are never rewritten"""
+    __tablename__ = "deployment_log_chunks"
+    id = Column(Integer, primary_key=True)
+    deployment_id = Column(Integer, ForeignKey("deployments.id"), nullable=False)
+    seq = Column(Integer, nullable=False)
+    byte_offset = Column(Integer, nullable=False)
+    byte_length = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    deployment = relationship("Deployment", back_populates="log_chunks")
+
+    __table_args__ = (
+        UniqueConstraint("deployment_id", "seq", name="uq_deployment_log_chunks_deployment_seq"),
+        Index("ix_deployment_log_chunks_deployment_offset", "deployment_id", "byte_offset"),
+    )
+
+class DeploymentJob(Base):
+    """Durable queue entry for a deployment, claimed by the worker pool"""
+    __tablename__ = "deployment_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    deployment_id = Column(Integer, ForeignKey("deployments.id"), nullable=False, unique=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    status = Column(JobStatusType, default=JobStatus.QUEUED, nullable=False)
+    worker_id = Column(String, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+    enqueued_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_deployment_jobs_status_enqueued_at", "status", "enqueued_at"),
+    )
+
+class DeploymentArchive(Base):
+    """
+    Finished deployment moved out of the hot tables by the retention policy.
+    Logs and job details are kept as zlib-compressed JSON in payload.
+    """
+    __tablename__ = "deployment_archive"
+    deployment_id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, nullable=False, index=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    status = Column(DeploymentStatusType, nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    archived_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+
+class DeploymentDailyStats(Base):
+    """
+    Rollup of deployments per (user, project, day, status), kept current on
+    every status transition. Each deployment is counted under its current
+    status on the day it started; durations are summed once it finishes.
+    """
+    __tablename__ = "deployment_daily_stats"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    project_id = Column(Integer, nullable=False)
+    day = Column(Date, nullable=False)
+    status = Column(DeploymentStatusType, nullable=False)
+    deployment_count = Column(Integer, default=0, nullable=False)
+    duration_count = Column(Integer, default=0, nullable=False)
+    duration_sum = Column(Float, default=0.0, nullable=False)
+    duration_sum_sq = Column(Float, default=0.0, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "project_id", "day", "status", name="uq_deployment_daily_stats_key"),
+        Index("ix_deployment_daily_stats_user_day", "user_id", "day"),
+        Index("ix_deployment_daily_stats_project_day", "project_id", "day"),
+        Index("ix_deployment_daily_stats_day", "day"),
+    )
+
+class DeploymentDurationBin(Base):
+    """
+    One bucket of the DDSketch of finished deployment durations for a
+    (project, day); sketches merge by summing counts per bin.
+    """
+    __tablename__ = "deployment_duration_bins"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    project_id = Column(Integer, nullable=False)
+    day = Column(Date, nullable=False)
+    bin = Column(Integer, nullable=False)
+    count = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("project_id", "day", "bin", name="uq_deployment_duration_bins_key"),
+        Index("ix_deployment_duration_bins_user_day", "user_id", "day"),
+    )
 
 class RefreshToken(Base):
     __tablename__ = "refresh_tokens"
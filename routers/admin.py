@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional
 from datetime import datetime, timedelta
 from database import get_db
-from models import User, Project, Deployment
+from models import User, Project, Deployment, DeploymentStatus, ProjectStatus
 from schemas import User as UserSchema, Project as ProjectSchema, Deployment as DeploymentSchema
 from dependencies import get_current_user, require_admin
 from config import settings
-from sqlalchemy import func
+from sqlalchemy import func, true
+from utils.cache import invalidate_project
+from utils.aggregates import count_if
+from workers.snapshotter import snapshotter
+from utils.rollups import delete_project_rollups
+from utils.retention import archive_deployments, delete_project_archive
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -113,29 +118,52 @@ def remove_admin(
 
 @router.get("/stats")
 def get_system_stats(
+    fresh: bool = False,
     db: Session = Depends(get_db),
     admin: User = Depends(require_admin)
 ):
-    """Get system statistics (admin only)"""
-    # User stats
-    total_users = db.query(User).count()
-    active_users = db.query(User).filter(User.is_active == True).count()
-    admin_users = db.query(User).filter(User.is_admin == True).count()
+    """Get system statistics (admin only), served from the periodic snapshot unless fresh=true"""
+    return snapshotter.get("admin:stats", db, fresh)
+
+def _compute_system_stats(db: Session) -> dict:
+    """Aggregate the system statistics payload"""
+    # Recent activity window (last 24 hours)
+    twenty_four_hours_ago = datetime.utcnow() - timedelta(hours=24)
     
-    # Project stats
-    total_projects = db.query(Project).count()
-    active_projects = db.query(Project).filter(Project.status == "active").count()
+    # User and project stats in one pass each, joined into a single row
+    user_stats = db.query(
+        func.count(User.id),
+        count_if(User.is_active == True),
+        count_if(User.is_admin == True),
+        count_if(User.created_at >= twenty_four_hours_ago)
+    ).subquery()
+    project_stats = db.query(
+        func.count(Project.id),
+        count_if(Project.status == ProjectStatus.ACTIVE)
+    ).subquery()
+    (
+        total_users,
+        active_users,
+        admin_users,
+        recent_users,
+        total_projects,
+        active_projects
+    ) = db.query(user_stats, project_stats).select_from(user_stats).join(project_stats, true()).one()
     
-    # Deployment stats
-    total_deployments = db.query(Deployment).count()
-    successful_deployments = db.query(Deployment).filter(Deployment.status == "success").count()
-    failed_deployments = db.query(Deployment).filter(Deployment.status == "failed").count()
-    pending_deployments = db.query(Deployment).filter(Deployment.status == "pending").count()
-    
-    # Recent activity (last 24 hours)
-    twenty_four_hours_ago = datetime.utcnow() - timedelta(hours=24)
-    recent_users = db.query(User).filter(User.created_at >= twenty_four_hours_ago).count()
-    recent_deployments = db.query(Deployment).filter(Deployment.started_at >= twenty_four_hours_ago).count()
+    # Deployment stats in one pass
+    (
+        total_deployments,
+        successful_deployments,
+        failed_deployments,
+        pending_deployments,
+        recent_deployments
+    ) = db.query(
+        func.count(Deployment.id),
+        count_if(Deployment.status == DeploymentStatus.SUCCESS),
+        count_if(Deployment.status == DeploymentStatus.FAILED),
+        count_if(Deployment.status == DeploymentStatus.PENDING),
+        count_if(Deployment.started_at >= twenty_four_hours_ago)
+    ).one()
     
     # Storage stats (simulated)
     total_storage_mb = total_projects * 100  # Simulated: 100MB per project
@@ -165,6 +193,8 @@ def get_system_stats(
         "timestamp": datetime.utcnow().isoformat()
     }
 
+snapshotter.register("admin:stats", _compute_system_stats)
+
 @router.get("/deployments", response_model=List[DeploymentSchema])
 def list_all_deployments(
     skip: int = 0,
@@ -174,7 +204,8 @@ def list_all_deployments(
     admin: User = Depends(require_admin)
 ):
     """List all deployments (admin only)"""
-    query = db.query(Deployment)
+    # Logs are assembled from chunks; load them for the whole page in one query
+    query = db.query(Deployment).options(selectinload(Deployment.log_chunks))
     if status:
         query = query.filter(Deployment.status == status)
     deployments = query.offset(skip).limit(limit).all()
@@ -208,6 +239,23 @@ def delete_project_admin(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Project not found"
         )
+    deployment_ids = [
+        deployment_id for (deployment_id,) in
+        db.query(Deployment.id).filter(Deployment.project_id == project_id).all()
+    ]
+    delete_project_archive(db, project_id)
+    delete_project_rollups(db, project_id)
     db.delete(project)
     db.commit()
+    invalidate_project(project_id, deployment_ids)
     return {"message": f"Project {project.name} deleted by admin"}
+
+@router.post("/retention/run")
+def run_retention(
+    retention_days: Optional[int] = Query(None, ge=0),
+    keep_latest: Optional[int] = Query(None, ge=0),
+    db: Session = Depends(get_db),
+    admin: User = Depends(require_admin)
+):
+    """Archive finished deployments outside the retention policy (admin only)"""
+    return archive_deployments(db, retention_days, keep_latest)
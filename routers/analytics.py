@@ -1,23 +1,48 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, and_
+from sqlalchemy import func, desc, and_, select, union_all
 from datetime import datetime, timedelta
 from typing import List, Optional
 from database import get_db
 from dependencies import get_current_user, require_admin
-from models import User, Project, Deployment, DeploymentStatus
+from models import User, Project, Deployment, DeploymentArchive, DeploymentStatus, DeploymentDailyStats, DeploymentDurationBin
 from utils.validation import validator
+from utils.cache import cache
+from utils.aggregates import (
+    DURATION_HISTOGRAM_EDGES, day_bucket, day_key, count_if, sum_if, duration_seconds, histogram_labels,
+    UTC, is_utc, local_time, naive_utc, resolve_timezone, time_bucket
+)
+from utils.rollups import utc_day
+from utils.sketches import duration_percentiles
+from utils.export import EXPORT_FORMATS, csv_stream, ndjson_stream, gzip_stream
+from utils.columnar import columnar_engine
+from workers.snapshotter import snapshotter
+from config import settings
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
+GRANULARITY_PATTERN = "^(hour|day|week|month)$"
+
+def _timezone_or_400(tz: str):
+    try:
+        return resolve_timezone(tz)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/user/stats")
 def get_user_analytics(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    granularity: str = Query("day", pattern=GRANULARITY_PATTERN),
+    tz: str = "UTC",
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get analytics for the current user"""
+    """Get analytics for the current user; the trend is bucketed by granularity in time zone tz"""
+    zone = _timezone_or_400(tz)
+    cache_key = f"analytics:user:{current_user.id}:{start_date}:{end_date}:{granularity}:{tz}"
+    
     # Set default date range (last 30 days)
     if not end_date:
         end_date = datetime.utcnow().isoformat()
@@ -33,46 +58,136 @@ def get_user_analytics(
     start = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
     end = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
     
+    return cache.get_or_compute(
+        cache_key,
+        lambda: _compute_user_analytics(db, current_user, start, end, start_date, end_date, granularity, zone),
+        ttl=settings.ANALYTICS_CACHE_TTL
+    )
+
+def _rollup_summary(stats) -> dict:
+    """Status counts, daily counts and mean duration from a filtered rollup query"""
+    status_counts = {
+        status.value: count
+        for status, count in stats.with_entities(
+            DeploymentDailyStats.status, func.sum(DeploymentDailyStats.deployment_count)
+        ).group_by(DeploymentDailyStats.status).all()
+        if count
+    }
+    daily_counts = {
+        day_key(day): count
+        for day, count in stats.with_entities(
+            DeploymentDailyStats.day, func.sum(DeploymentDailyStats.deployment_count)
+        ).group_by(DeploymentDailyStats.day).order_by(DeploymentDailyStats.day).all()
+        if count
+    }
+    duration_sum, duration_count = stats.with_entities(
+        func.sum(DeploymentDailyStats.duration_sum), func.sum(DeploymentDailyStats.duration_count)
+    ).one()
+    return {
+        "status_counts": status_counts,
+        "daily_counts": daily_counts,
+        "avg_duration": duration_sum / duration_count if duration_count else 0
+    }
+
+def _deployment_trend(
+    db: Session,
+    stats,
+    deployments,
+    start: datetime,
+    end: datetime,
+    granularity: str,
+    tz
+) -> dict:
+    """
+    Deployment counts per time bucket, bucketed in SQL. Day, week and month
+    buckets in UTC are folded from the filtered daily rollup (stats); hourly
+    or non-UTC buckets count the filtered deployments query directly, which
+    ix_deployments_project_started_at_id serves as a range scan per project.
+    """
+    if granularity != "hour" and is_utc(tz):
+        bucket = time_bucket(db, DeploymentDailyStats.day, granularity)
+        rows = stats.with_entities(
+            bucket, func.sum(DeploymentDailyStats.deployment_count)
+        ).group_by(bucket).order_by(bucket).all()
+    else:
+        bucket = time_bucket(db, local_time(db, Deployment.started_at, tz, start, end), granularity)
+        rows = deployments.filter(
+            Deployment.started_at.between(start, end)
+        ).with_entities(
+            bucket, func.count(Deployment.id)
+        ).group_by(bucket).order_by(bucket).all()
+    return {
+        "granularity": granularity,
+        "timezone": tz.key,
+        "buckets": {key: count for key, count in rows if count}
+    }
+
+def _compute_user_analytics(
+    db: Session,
+    current_user: User,
+    start: datetime,
+    end: datetime,
+    start_date: str,
+    end_date: str,
+    granularity: str = "day",
+    tz=UTC
+) -> dict:
+    """Aggregate the user analytics payload for a validated date range"""
     # Get user's projects
-    projects = db.query(Project).filter(
+    projects_in_range = db.query(Project).filter(
         Project.user_id == current_user.id,
         Project.created_at.between(start, end)
-    ).all()
+    )
     
-    # Get deployments for user's projects
-    deployments = db.query(Deployment).join(Project).filter(
-        Project.user_id == current_user.id,
-        Deployment.started_at.between(start, end)
-    ).all()
+    # Deployment count per project, aggregated once and joined to the project list
+    deployment_counts = db.query(
+        DeploymentDailyStats.project_id,
+        func.sum(DeploymentDailyStats.deployment_count).label("deployment_count")
+    ).filter(
+        DeploymentDailyStats.user_id == current_user.id
+    ).group_by(DeploymentDailyStats.project_id).subquery()
     
-    # Calculate statistics
-    total_projects = len(projects)
-    total_deployments = len(deployments)
+    projects = projects_in_range.outerjoin(
+        deployment_counts, deployment_counts.c.project_id == Project.id
+    ).with_entities(
+        Project.id,
+        Project.name,
+        Project.status,
+        func.coalesce(deployment_counts.c.deployment_count, 0)
+    ).order_by(Project.id).limit(10).all()  # Limit to 10 projects
+    
+    # Deployment statistics come from the daily rollup, one row per day and status
+    user_stats = db.query(DeploymentDailyStats).filter(
+        DeploymentDailyStats.user_id == current_user.id,
+        DeploymentDailyStats.day.between(utc_day(start), utc_day(end))
+    )
+    rollup = _rollup_summary(user_stats)
+    status_counts = rollup["status_counts"]
+    daily_trend = rollup["daily_counts"]
+    avg_deployment_time = rollup["avg_duration"]
+    trend = _deployment_trend(
+        db,
+        user_stats,
+        db.query(Deployment).join(Project).filter(Project.user_id == current_user.id),
+        naive_utc(start),
+        naive_utc(end),
+        granularity,
+        tz
+    )
+    
+    # Duration percentiles from the merged daily sketches
+    percentiles = duration_percentiles(db.query(DeploymentDurationBin).filter(
+        DeploymentDurationBin.user_id == current_user.id,
+        DeploymentDurationBin.day.between(utc_day(start), utc_day(end))
+    ))
     
-    # Deployment status breakdown
-    status_counts = {}
-    for deployment in deployments:
-        status = deployment.status.value
-        status_counts[status] = status_counts.get(status, 0) + 1
+    # Calculate statistics
+    total_projects = projects_in_range.count()
+    total_deployments = sum(status_counts.values())
         
     # Success rate
     successful_deployments = status_counts.get('success', 0)
     success_rate = (successful_deployments / total_deployments * 100) if total_deployments > 0 else 0
-    
-    # Average deployment time
-    deployment_times = []
-    for deployment in deployments:
-        if deployment.completed_at and deployment.started_at:
-            duration = (deployment.completed_at - deployment.started_at).total_seconds()
-            deployment_times.append(duration)
-            
-    avg_deployment_time = sum(deployment_times) / len(deployment_times) if deployment_times else 0
-    
-    # Daily deployment trend
-    daily_trend = {}
-    for deployment in deployments:
-        date_str = deployment.started_at.date().isoformat()
-        daily_trend[date_str] = daily_trend.get(date_str, 0) + 1
         
     return {
         "period": {
@@ -84,58 +199,63 @@ def get_user_analytics(
             "total_projects": total_projects,
             "total_deployments": total_deployments,
             "success_rate": round(success_rate, 2),
-            "avg_deployment_time_seconds": round(avg_deployment_time, 2)
+            "avg_deployment_time_seconds": round(avg_deployment_time, 2),
+            **{f"{name}_deployment_time_seconds": value for name, value in percentiles.items()}
         },
         "deployment_status": status_counts,
         "daily_trend": daily_trend,
+        "trend": trend,
         "projects": [
             {
-                "id": p.id,
-                "name": p.name,
-                "status": p.status.value,
-                "deployment_count": len(p.deployments)
+                "id": project_id,
+                "name": name,
+                "status": project_status.value,
+                "deployment_count": deployment_count
             }
-            for p in projects[:10]  # Limit to 10 projects
+            for project_id, name, project_status, deployment_count in projects
         ]
     }
 
 @router.get("/admin/overview")
 def get_admin_overview(
+    fresh: bool = False,
     db: Session = Depends(get_db),
     admin: User = Depends(require_admin)
 ):
-    """Get admin overview analytics"""
-    # Total statistics
-    total_users = db.query(User).count()
-    total_projects = db.query(Project).count()
-    total_deployments = db.query(Deployment).count()
-    
-    # Active users (last 30 days)
+    """Get admin overview analytics, served from the periodic snapshot unless fresh=true"""
+    return snapshotter.get("admin:overview", db, fresh)
+
+def _compute_admin_overview(db: Session) -> dict:
+    """Aggregate the admin overview payload"""
     thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    active_users = db.query(User).filter(
-        User.created_at >= thirty_days_ago
-    ).count()
-    
-    # Deployment success rate
-    successful_deployments = db.query(Deployment).filter(
-        Deployment.status == DeploymentStatus.SUCCESS
-    ).count()
-    success_rate = (successful_deployments / total_deployments * 100) if total_deployments > 0 else 0
-    
-    # Monthly growth
+    one_day_ago = datetime.utcnow() - timedelta(days=1)
     current_month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     last_month_start = (current_month_start - timedelta(days=1)).replace(day=1)
     
-    # New users this month
-    new_users_this_month = db.query(User).filter(
-        User.created_at >= current_month_start
-    ).count()
+    # User counts in one pass (conditional aggregation), project total alongside;
+    # activity comes from last_seen_at, written in batches by the last-seen tracker
+    (
+        total_users,
+        daily_active_users,
+        monthly_active_users,
+        new_users_this_month,
+        new_users_last_month,
+        total_projects
+    ) = db.query(
+        func.count(User.id),
+        count_if(User.last_seen_at >= one_day_ago),
+        count_if(User.last_seen_at >= thirty_days_ago),
+        count_if(User.created_at >= current_month_start),
+        count_if((User.created_at >= last_month_start) & (User.created_at < current_month_start)),
+        db.query(func.count(Project.id)).scalar_subquery()
+    ).one()
     
-    # New users last month
-    new_users_last_month = db.query(User).filter(
-        User.created_at >= last_month_start,
-        User.created_at < current_month_start
-    ).count()
+    # Deployment totals from the daily rollup
+    total_deployments, successful_deployments = db.query(
+        func.coalesce(func.sum(DeploymentDailyStats.deployment_count), 0),
+        sum_if(DeploymentDailyStats.status == DeploymentStatus.SUCCESS, DeploymentDailyStats.deployment_count)
+    ).one()
+    success_rate = (successful_deployments / total_deployments * 100) if total_deployments > 0 else 0
     
     user_growth = (
         ((new_users_this_month - new_users_last_month) / new_users_last_month * 100)
@@ -149,24 +269,28 @@ def get_admin_overview(
         func.count(Project.id).label('project_count')
     ).join(Project).group_by(User.id).order_by(desc('project_count')).limit(10).all()
     
-    # Deployment trend (last 7 days)
+    # Deployment trend (last 7 days), newest first
+    today = datetime.utcnow().date()
+    daily_counts = dict(
+        db.query(
+            DeploymentDailyStats.day, func.sum(DeploymentDailyStats.deployment_count)
+        ).filter(
+            DeploymentDailyStats.day >= today - timedelta(days=6)
+        ).group_by(DeploymentDailyStats.day).all()
+    )
     deployment_trend = {}
     for i in range(7):
-        date = datetime.utcnow() - timedelta(days=i)
-        date_str = date.date().isoformat()
-        start_of_day = date.replace(hour=0, minute=0, second=0, microsecond=0)
-        end_of_day = date.replace(hour=23, minute=59, second=59, microsecond=999999)
-        
-        daily_deployments = db.query(Deployment).filter(
-            Deployment.started_at.between(start_of_day, end_of_day)
-        ).count()
-        deployment_trend[date_str] = daily_deployments
+        day = today - timedelta(days=i)
+        deployment_trend[day.isoformat()] = daily_counts.get(day, 0)
         
     return {
         "timestamp": datetime.utcnow().isoformat(),
         "overview": {
             "total_users": total_users,
-            "active_users_last_30_days": active_users,
+            "active_users_last_30_days": monthly_active_users,
+            "daily_active_users": daily_active_users,
+            "monthly_active_users": monthly_active_users,
+            "dau_mau_ratio": round(daily_active_users / monthly_active_users * 100, 2) if monthly_active_users else 0,
             "total_projects": total_projects,
             "total_deployments": total_deployments,
             "deployment_success_rate": round(success_rate, 2)
@@ -187,15 +311,99 @@ def get_admin_overview(
         "deployment_trend_last_7_days": deployment_trend
     }
 
+snapshotter.register("admin:overview", _compute_admin_overview)
+
+@router.get("/admin/deployments")
+def get_admin_deployment_breakdown(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    top: int = Query(10, ge=1, le=100),
+    engine: Optional[str] = Query(None, pattern="^(sql|columnar)$"),
+    db: Session = Depends(get_db),
+    admin: User = Depends(require_admin)
+):
+    """
+    Ad-hoc deployment breakdown across all users: status counts, top projects
+    and users, daily trend and duration histogram. engine overrides
+    ANALYTICS_ENGINE; "columnar" requires NumPy.
+    """
+    if engine == "columnar" and not columnar_engine.available:
+        raise HTTPException(status_code=400, detail="Columnar engine requires NumPy")
+    engine = engine or settings.ANALYTICS_ENGINE
+    
+    if engine == "columnar" and columnar_engine.available:
+        result = columnar_engine.deployment_breakdown(db, start_date, end_date, top)
+    else:
+        engine = "sql"
+        result = _sql_deployment_breakdown(db, start_date, end_date, top)
+    return {"engine": engine, **result}
+
+def _sql_deployment_breakdown(
+    db: Session,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    top: int
+) -> dict:
+    """SQL path for the admin deployment breakdown"""
+    base = db.query(Deployment)
+    if start is not None:
+        base = base.filter(Deployment.started_at >= start)
+    if end is not None:
+        base = base.filter(Deployment.started_at < end)
+    
+    status_counts = dict(
+        base.with_entities(Deployment.status, func.count(Deployment.id)).group_by(Deployment.status).all()
+    )
+    
+    deployment_count = func.count(Deployment.id).label("deployments")
+    top_projects = base.with_entities(Deployment.project_id, deployment_count).group_by(
+        Deployment.project_id
+    ).order_by(desc("deployments"), Deployment.project_id).limit(top).all()
+    top_users = base.join(Project).with_entities(Project.user_id, deployment_count).group_by(
+        Project.user_id
+    ).order_by(desc("deployments"), Project.user_id).limit(top).all()
+    
+    day = day_bucket(Deployment.started_at)
+    daily_counts = base.with_entities(day, func.count(Deployment.id)).group_by(day).order_by(day).all()
+    
+    # Histogram buckets and mean duration in one pass over finished deployments;
+    # durations are rounded to milliseconds so bucket edges aren't lost to float error
+    duration = func.round(duration_seconds(db), 3)
+    edges = DURATION_HISTOGRAM_EDGES
+    bucket_conditions = [duration < edges[1]] + [
+        (duration >= low) & (duration < high) for low, high in zip(edges[1:], edges[2:])
+    ] + [duration >= edges[-1]]
+    histogram_row = base.filter(Deployment.completed_at.isnot(None)).with_entities(
+        func.avg(duration), *(count_if(condition) for condition in bucket_conditions)
+    ).one()
+    avg_duration = histogram_row[0]
+    
+    return {
+        "total_deployments": sum(status_counts.values()),
+        "status_counts": {status.value: count for status, count in status_counts.items()},
+        "top_projects": [
+            {"project_id": project_id, "deployments": count} for project_id, count in top_projects
+        ],
+        "top_users": [
+            {"user_id": user_id, "deployments": count} for user_id, count in top_users
+        ],
+        "daily_trend": {day_key(bucket): count for bucket, count in daily_counts},
+        "duration_histogram": dict(zip(histogram_labels(), histogram_row[1:])),
+        "avg_duration_seconds": round(avg_duration, 2) if avg_duration is not None else 0
+    }
+
 @router.get("/project/{project_id}")
 def get_project_analytics(
     project_id: int,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    granularity: str = Query("month", pattern=GRANULARITY_PATTERN),
+    tz: str = "UTC",
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get analytics for a specific project"""
+    """Get analytics for a specific project; the trend is bucketed by granularity in time zone tz"""
+    zone = _timezone_or_400(tz)
     # Check if project exists and user has access
     project = db.query(Project).filter(
         Project.id == project_id,
@@ -220,41 +428,51 @@ def get_project_analytics(
     start = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
     end = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
     
-    # Get project deployments in date range
-    deployments = db.query(Deployment).filter(
-        Deployment.project_id == project_id,
-        Deployment.started_at.between(start, end)
-    ).order_by(Deployment.started_at.desc()).all()
-    
-    # Calculate statistics
-    total_deployments = len(deployments)
+    # Deployment statistics come from the daily rollup, one row per day and status
+    project_stats = db.query(DeploymentDailyStats).filter(
+        DeploymentDailyStats.project_id == project_id,
+        DeploymentDailyStats.day.between(utc_day(start), utc_day(end))
+    )
+    rollup = _rollup_summary(project_stats)
+    status_counts = rollup["status_counts"]
+    avg_deployment_time = rollup["avg_duration"]
+    trend = _deployment_trend(
+        db,
+        project_stats,
+        db.query(Deployment).filter(Deployment.project_id == project_id),
+        naive_utc(start),
+        naive_utc(end),
+        granularity,
+        zone
+    )
     
-    # Deployment status breakdown
-    status_counts = {}
-    deployment_durations = []
+    # Duration percentiles from the merged daily sketches
+    percentiles = duration_percentiles(db.query(DeploymentDurationBin).filter(
+        DeploymentDurationBin.project_id == project_id,
+        DeploymentDurationBin.day.between(utc_day(start), utc_day(end))
+    ))
     
-    for deployment in deployments:
-        status = deployment.status.value
-        status_counts[status] = status_counts.get(status, 0) + 1
-        
-        if deployment.completed_at and deployment.started_at:
-            duration = (deployment.completed_at - deployment.started_at).total_seconds()
-            deployment_durations.append(duration)
+    # Calculate statistics
+    total_deployments = sum(status_counts.values())
             
     # Success rate
     successful_deployments = status_counts.get('success', 0)
     success_rate = (successful_deployments / total_deployments * 100) if total_deployments > 0 else 0
     
-    # Average deployment time
-    avg_deployment_time = sum(deployment_durations) / len(deployment_durations) if deployment_durations else 0
+    # Monthly deployment count (UTC), kept alongside the requested trend
+    if granularity == "month" and is_utc(zone):
+        monthly_deployments = trend["buckets"]
+    else:
+        monthly_deployments = _deployment_trend(
+            db, project_stats, None, start, end, "month", UTC
+        )["buckets"]
     
-    # Monthly deployment count
-    monthly_deployments = {}
-    for deployment in deployments:
-        month_key = deployment.started_at.strftime("%Y-%m")
-        monthly_deployments[month_key] = monthly_deployments.get(month_key, 0) + 1
-        
     # Recent deployments (last 5)
+    deployments = db.query(Deployment).filter(
+        Deployment.project_id == project_id,
+        Deployment.started_at.between(start, end)
+    ).order_by(Deployment.started_at.desc(), Deployment.id.desc()).limit(5).all()
+        
     recent_deployments = [
         {
             "id": d.id,
@@ -266,7 +484,7 @@ def get_project_analytics(
                 if d.completed_at and d.started_at else None
             )
         }
-        for d in deployments[:5]
+        for d in deployments
     ]
     
     return {
@@ -284,9 +502,68 @@ def get_project_analytics(
             "total_deployments": total_deployments,
             "success_rate": round(success_rate, 2),
             "avg_deployment_time_seconds": round(avg_deployment_time, 2),
+            **{f"{name}_deployment_time_seconds": value for name, value in percentiles.items()},
             "failed_deployments": status_counts.get('failed', 0)
         },
         "deployment_status": status_counts,
         "monthly_trend": monthly_deployments,
+        "trend": trend,
         "recent_deployments": recent_deployments
     }
+
+EXPORT_COLUMNS = ["id", "project_id", "project_name", "status", "started_at", "completed_at"]
+
+@router.get("/export/deployments")
+def export_deployments(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+    project_id: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Stream the user's deployment history as CSV or NDJSON, including
+    deployments the retention policy moved to the archive.
+    
+    Rows come from a server-side cursor in EXPORT_BATCH_SIZE batches and are
+    encoded (and optionally gzipped) batch by batch, so memory stays flat
+    regardless of how many deployments are exported.
+    """
+    def history(model, id_column, owner_column):
+        part = select(
+            id_column.label("id"),
+            model.project_id,
+            Project.name.label("project_name"),
+            model.status,
+            model.started_at,
+            model.completed_at
+        ).join(Project, Project.id == model.project_id).where(owner_column == current_user.id)
+        if project_id is not None:
+            part = part.where(model.project_id == project_id)
+        if start_date is not None:
+            part = part.where(model.started_at >= start_date)
+        if end_date is not None:
+            part = part.where(model.started_at < end_date)
+        return part
+    
+    rows = union_all(
+        history(Deployment, Deployment.id, Project.user_id),
+        history(DeploymentArchive, DeploymentArchive.deployment_id, DeploymentArchive.user_id)
+    ).subquery()
+    query = select(rows).order_by(rows.c.started_at, rows.c.id)
+    
+    def batches():
+        result = db.execute(query.execution_options(yield_per=settings.EXPORT_BATCH_SIZE))
+        for batch in result.partitions():
+            yield batch
+    
+    encode = csv_stream if format == "csv" else ndjson_stream
+    body = encode(EXPORT_COLUMNS, batches())
+    headers = {"Content-Disposition": f'attachment; filename="deployments.{format}"'}
+    if gzip:
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    
+    return StreamingResponse(body, media_type=EXPORT_FORMATS[format], headers=headers)
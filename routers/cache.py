@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
+from datetime import datetime
 from database import get_db
 from dependencies import get_current_user, require_admin
 from utils.cache import cache
@@ -15,9 +16,17 @@ def get_cache_stats(
     stats = cache.get_stats()
     return {
         "cache": stats,
-        "timestamp": "2024-01-01T00:00:00Z"  # Would use actual timestamp
+        "timestamp": datetime.utcnow().isoformat()
     }
 
+@router.post("/stats/reset")
+def reset_cache_stats(
+    admin: User = Depends(require_admin)
+):
+    """Reset application-side cache statistics (admin only)"""
+    cache.metrics.reset()
+    return {"message": "Cache statistics reset"}
+
 @router.post("/clear")
 def clear_cache(
     pattern: str = "*",
@@ -68,9 +77,9 @@ def delete_cache_key(
 @router.get("/health")
 def cache_health_check():
     """Check cache health"""
-    is_healthy = cache.is_connected()
+    health = cache.get_health()
     return {
-        "status": "healthy" if is_healthy else "unhealthy",
-        "connected": is_healthy,
+        "status": "healthy" if health["connected"] else "unhealthy",
+        **health,
         "service": "redis"
     }
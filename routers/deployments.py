@@ -1,63 +1,90 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, selectinload
+from typing import Optional
 from datetime import datetime
 import asyncio
-import random
+import json
+import re
 
 from database import get_db
-from models import Deployment, Project, User, DeploymentStatus
-from schemas import Deployment as DeploymentSchema, DeploymentCreate
+from models import Deployment, Project, User, DeploymentStatus, TERMINAL_DEPLOYMENT_STATUSES
+from schemas import (
+    Deployment as DeploymentSchema,
+    DeploymentCreate,
+    DeploymentPage,
+    BulkDeploymentCreate,
+    BulkDeploymentResult
+)
 from dependencies import get_current_user
+from utils.cache import cache, deployment_cache_key, project_cache_key, invalidate_project
+from config import settings
+from utils.deployment_logs import (
+    first_log_chunk,
+    read_chunks,
+    format_sse,
+    log_position,
+    read_since,
+    read_byte_range,
+    read_text_range,
+    read_tail,
+    decode_text_range,
+    tail_lines
+)
+from utils.retention import get_archived_deployment
+from utils.pagination import filter_deployments, paginate_deployments
+from utils.events import event_bus, user_deployments_channel
+from workers.deployment_worker import (
+    worker_pool,
+    enqueue_deployment,
+    cancel_job,
+    cancellation_registry,
+    set_deployment_status,
+    notify_deployment_status,
+    find_coalescable_deployments,
+    supersede_deployments
+)
 
 router = APIRouter(prefix="/deployments", tags=["deployments"])
 
+COALESCE_MODE_PATTERN = "^(off|join|supersede)$"
 
-async def simulate_deployment(deployment_id: int, db: Session):
-    """Simulate deployment process in background"""
-    await asyncio.sleep(2)  # Initial delay
-    
-    # Get deployment
-    deployment = db.query(Deployment).filter(Deployment.id == deployment_id).first()
-    if not deployment:
-        return
-    
-    # Simulate building
-    deployment.status = DeploymentStatus.BUILDING
-    deployment.logs = "Starting build process...\n"
-    db.commit()
-    
-    await asyncio.sleep(3)
-    deployment.logs += "✓ Dependencies installed\n"
-    deployment.logs += "✓ Building application...\n"
-    db.commit()
-    
-    # Simulate deploying
-    deployment.status = DeploymentStatus.DEPLOYING
-    deployment.logs += "✓ Build completed successfully\n"
-    deployment.logs += "Starting deployment...\n"
-    db.commit()
-    
-    await asyncio.sleep(2)
-    
-    # Randomly succeed or fail
-    if random.random() > 0.2:  # 80% success rate
-        deployment.status = DeploymentStatus.SUCCESS
-        deployment.logs += "✓ Deployment completed successfully!\n"
-    else:
-        deployment.status = DeploymentStatus.FAILED
-        deployment.logs += "✗ Deployment failed: Build timeout\n"
-    
-    deployment.completed_at = datetime.utcnow()
-    db.commit()
 
+@router.get("/", response_model=DeploymentPage)
+def list_deployments(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    status_filter: Optional[DeploymentStatus] = Query(None, alias="status"),
+    started_after: Optional[datetime] = None,
+    started_before: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """List the user's deployments across all projects, newest first, one cursor page at a time"""
+    query = db.query(Deployment).filter(Deployment.user_id == current_user.id)
+    query = filter_deployments(query, status_filter, started_after, started_before)
+    try:
+        items, next_cursor = paginate_deployments(query, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
 
 @router.post("/projects/{project_id}/deploy", response_model=DeploymentSchema, status_code=status.HTTP_201_CREATED)
 def trigger_deployment(
     project_id: int,
-    background_tasks: BackgroundTasks,
+    response: Response,
+    coalesce: Optional[str] = Query(None, pattern=COALESCE_MODE_PATTERN),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    """
+    Queue a deployment of the project.
+    
+    With coalescing (?coalesce= or DEPLOY_COALESCE_MODE), a deployment that is
+    still waiting in the queue is either returned as-is ("join", 200) or
+    cancelled in favour of the new one ("supersede").
+    """
     # Check if project exists and belongs to user
     project = db.query(Project).filter(
         Project.id == project_id,
@@ -70,61 +97,435 @@ def trigger_deployment(
             detail="Project not found"
         )
     
+    mode = coalesce or settings.DEPLOY_COALESCE_MODE
+    pending = []
+    if mode != "off":
+        pending = find_coalescable_deployments(db, [project_id]).get(project_id, [])
+        if mode == "join" and pending:
+            response.status_code = status.HTTP_200_OK
+            return pending[-1]
+    
     # Create deployment record
     deployment = Deployment(
         project_id=project_id,
-        status=DeploymentStatus.PENDING,
-        logs="Deployment queued...\n"
+        user_id=current_user.id,
+        status=DeploymentStatus.PENDING
     )
     
     db.add(deployment)
+    db.flush()
+    db.add(first_log_chunk(deployment.id, "Deployment queued...\n"))
+    
+    # Queue the deployment in the same transaction so it can't be lost, and
+    # cancel the ones it supersedes before any worker can claim them
+    enqueue_deployment(db, deployment, current_user.id)
+    superseded = supersede_deployments(db, pending, deployment.id) if mode == "supersede" else []
     db.commit()
     db.refresh(deployment)
-    
-    # Start background deployment simulation
-    background_tasks.add_task(simulate_deployment, deployment.id, db)
+    for old_deployment, previous_status in superseded:
+        notify_deployment_status(old_deployment, previous_status)
+    invalidate_project(project_id)
+    worker_pool.wake()
     
     return deployment
 
 
+@router.post("/bulk", response_model=BulkDeploymentResult, status_code=status.HTTP_201_CREATED)
+def trigger_bulk_deployment(
+    request: BulkDeploymentCreate,
+    response: Response,
+    coalesce: Optional[str] = Query(None, pattern=COALESCE_MODE_PATTERN),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Deploy several projects at once.
+    
+    Ownership is checked with one query, all deployments, log chunks and jobs
+    are inserted in batches within a single transaction, and each requested
+    project gets a result: "queued" with its deployment, "joined" with the
+    waiting deployment it coalesced into, or "not_found". The response is
+    200 instead of 201 when nothing new was queued.
+    """
+    project_ids = list(dict.fromkeys(request.project_ids))
+    
+    owned = {
+        project_id for (project_id,) in db.query(Project.id).filter(
+            Project.id.in_(project_ids),
+            Project.user_id == current_user.id
+        ).all()
+    }
+    
+    mode = coalesce or settings.DEPLOY_COALESCE_MODE
+    pending = find_coalescable_deployments(db, owned) if mode != "off" and owned else {}
+    joined = {
+        project_id: deployments[-1].id
+        for project_id, deployments in pending.items()
+    } if mode == "join" else {}
+    
+    deployments = [
+        Deployment(project_id=project_id, user_id=current_user.id, status=DeploymentStatus.PENDING)
+        for project_id in project_ids if project_id in owned and project_id not in joined
+    ]
+    if deployments:
+        db.add_all(deployments)
+        db.flush()
+        db.add_all([first_log_chunk(d.id, "Deployment queued...\n") for d in deployments])
+        superseded = []
+        for deployment in deployments:
+            enqueue_deployment(db, deployment, current_user.id)
+            if mode == "supersede":
+                superseded += supersede_deployments(db, pending.get(deployment.project_id, []), deployment.id)
+        db.commit()
+        
+        for old_deployment, previous_status in superseded:
+            notify_deployment_status(old_deployment, previous_status)
+        cache.delete_many([project_cache_key(d.project_id) for d in deployments])
+        worker_pool.wake()
+    
+    deployment_ids = [d.id for d in deployments] + list(joined.values())
+    by_project = {
+        deployment.project_id: deployment
+        for deployment in db.query(Deployment).options(
+            selectinload(Deployment.log_chunks)
+        ).filter(Deployment.id.in_(deployment_ids)).all()
+    } if deployment_ids else {}
+    
+    results = []
+    for project_id in project_ids:
+        if project_id in joined:
+            item_status = "joined"
+        elif project_id in by_project:
+            item_status = "queued"
+        else:
+            item_status = "not_found"
+        results.append({
+            "project_id": project_id,
+            "status": item_status,
+            "deployment": by_project.get(project_id)
+        })
+    
+    queued = sum(1 for item in results if item["status"] == "queued")
+    if not queued:
+        response.status_code = status.HTTP_200_OK
+    return {
+        "queued": queued,
+        "results": results
+    }
+
+
+@router.get("/events")
+async def stream_deployment_events(
+    request: Request,
+    project_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Push deployment status transitions for the current user's projects as
+    server-sent "status" events, optionally filtered to one project.
+    """
+    user_id = current_user.id
+    # The stream never touches the database: hand the connection back to the
+    # pool now rather than when the response ends
+    await run_in_threadpool(db.close)
+    
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    def on_event(event: dict):
+        if project_id is None or event.get("project_id") == project_id:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+    
+    unsubscribe = event_bus.subscribe(user_deployments_channel(user_id), on_event)
+    
+    async def event_stream():
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), timeout=settings.LOG_STREAM_KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(json.dumps(event), event="status")
+        finally:
+            unsubscribe()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/{deployment_id}", response_model=DeploymentSchema)
 def get_deployment(
     deployment_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    # Cache-aside: pollers are served from cache until a write invalidates it
+    cached = cache.get(deployment_cache_key(deployment_id))
+    if cached is not None and cached["user_id"] == current_user.id:
+        return cached["data"]
+    
     deployment = db.query(Deployment).join(Project).filter(
         Deployment.id == deployment_id,
         Project.user_id == current_user.id
     ).first()
     
+    # Deployments moved out by the retention policy are read back from the archive
+    if deployment is None:
+        deployment = get_archived_deployment(db, deployment_id, current_user.id)
+    
     if not deployment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Deployment not found"
         )
     
-    return deployment
+    data = DeploymentSchema.model_validate(deployment).model_dump(mode="json")
+    cache.set(
+        deployment_cache_key(deployment_id),
+        {"user_id": current_user.id, "data": data},
+        settings.ENTITY_CACHE_TTL
+    )
+    return data
+
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_range(range_header: str, size: int):
+    """Resolve a single HTTP byte range to [start, end), or None if unsatisfiable"""
+    match = _RANGE_PATTERN.match(range_header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size
+    else:
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+    if start >= size or start >= end:
+        return None
+    return start, end
+
+
+def _range_response(range_header: str, size: int, read_bytes) -> Response:
+    """206 (or 416) response for a Range header; read_bytes(start, end) returns bytes [start, end)"""
+    byte_range = _parse_range(range_header, size)
+    if byte_range is None:
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    start, end = byte_range
+    end = min(end, start + settings.LOG_READ_MAX_BYTES)
+    return Response(
+        content=read_bytes(start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type="text/plain; charset=utf-8",
+        headers={
+            "Content-Range": f"bytes {start}-{end - 1}/{size}",
+            "Accept-Ranges": "bytes"
+        }
+    )
+
+
+def _archived_log_response(
+    logs: str,
+    since: Optional[int],
+    offset: Optional[int],
+    limit: Optional[int],
+    tail: Optional[int],
+    range_header: Optional[str]
+):
+    """The log reads for an archived deployment, served from its complete stored log"""
+    data = logs.encode("utf-8")
+    size = len(data)
+    if range_header:
+        return _range_response(range_header, size, lambda start, end: data[start:end])
+    if since is not None:
+        # Chunk sequence numbers aren't kept in the archive
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Archived deployment logs can't be read by sequence; use offset, tail or Range"
+        )
+    if tail is not None:
+        text = tail_lines(logs, tail)
+        next_offset = size
+    else:
+        start = offset or 0
+        result = decode_text_range(
+            data[start:start + min(limit or settings.LOG_READ_MAX_BYTES, settings.LOG_READ_MAX_BYTES)],
+            start
+        )
+        text, next_offset = result["logs"], min(result["offset"], size)
+    return {
+        "logs": text,
+        "size": size,
+        "next_cursor": {"since": None, "offset": next_offset},
+        "complete": next_offset >= size
+    }
 
 
 @router.get("/{deployment_id}/logs")
 def get_deployment_logs(
     deployment_id: int,
+    since: Optional[int] = Query(None, ge=0),
+    offset: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    tail: Optional[int] = Query(None, ge=1),
+    range_header: Optional[str] = Header(None, alias="Range"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    deployment = db.query(Deployment).join(Project).filter(
+    """
+    Read a deployment's log, whole or in part.
+    
+    - since: chunks after this sequence number
+    - offset/limit: up to limit bytes starting at byte offset
+    - tail: the last N lines
+    - Range header: raw bytes with a 206 Partial Content response
+    
+    The response carries next_cursor (since/offset) to continue from.
+    Archived deployments are read from the archive, except by since.
+    """
+    deployment = db.query(Deployment.id).join(Project).filter(
         Deployment.id == deployment_id,
         Project.user_id == current_user.id
     ).first()
     
     if not deployment:
+        archived = get_archived_deployment(db, deployment_id, current_user.id)
+        if archived is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Deployment not found"
+            )
+        return _archived_log_response(archived["logs"], since, offset, limit, tail, range_header)
+    
+    last_seq, size = log_position(db, deployment_id)
+    
+    if range_header:
+        return _range_response(
+            range_header, size, lambda start, end: read_byte_range(db, deployment_id, start, end)
+        )
+    
+    if since is not None:
+        result = read_since(db, deployment_id, since)
+        logs = result["logs"]
+        next_cursor = {
+            "since": result["since"],
+            "offset": result["offset"] if result["offset"] is not None else size
+        }
+    elif tail is not None:
+        logs = read_tail(db, deployment_id, tail)
+        next_cursor = {"since": last_seq, "offset": size}
+    else:
+        start = offset or 0
+        result = read_text_range(
+            db,
+            deployment_id,
+            start,
+            min(limit or settings.LOG_READ_MAX_BYTES, settings.LOG_READ_MAX_BYTES)
+        )
+        logs = result["logs"]
+        next_offset = min(result["offset"], size)
+        next_cursor = {
+            "since": last_seq if next_offset >= size else None,
+            "offset": next_offset
+        }
+    
+    return {
+        "logs": logs,
+        "size": size,
+        "next_cursor": next_cursor,
+        "complete": next_cursor["offset"] is not None and next_cursor["offset"] >= size
+    }
+
+
+def _poll_log_chunks(db: Session, deployment_id: int, after_seq: int):
+    """Read the deployment status, then any chunks written after after_seq"""
+    # Status first: a terminal status is committed together with the final
+    # chunk, so every chunk is visible once the terminal status is.
+    deployment_status = db.query(Deployment.status).filter(
+        Deployment.id == deployment_id
+    ).scalar()
+    chunks = read_chunks(db, deployment_id, after_seq)
+    # End the read transaction so the next poll sees new commits
+    db.rollback()
+    return deployment_status, chunks
+
+
+@router.get("/{deployment_id}/logs/stream")
+async def stream_deployment_logs(
+    deployment_id: int,
+    request: Request,
+    after_seq: Optional[int] = None,
+    last_event_id: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Tail a deployment's log as server-sent events.
+    
+    Each chunk is sent as a "log" event whose id is its sequence number, so
+    clients resume with ?after_seq= or the Last-Event-ID header. The stream
+    ends with an "end" event once the deployment reaches a terminal status.
+    """
+    owned = await run_in_threadpool(
+        lambda: db.query(Deployment.id).join(Project).filter(
+            Deployment.id == deployment_id,
+            Project.user_id == current_user.id
+        ).first()
+    )
+    if not owned:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Deployment not found"
         )
     
-    return {"logs": deployment.logs}
+    if after_seq is None:
+        after_seq = int(last_event_id) if last_event_id and last_event_id.isdigit() else -1
+    
+    async def event_stream():
+        cursor = after_seq
+        idle = 0.0
+        while not await request.is_disconnected():
+            deployment_status, chunks = await run_in_threadpool(
+                _poll_log_chunks, db, deployment_id, cursor
+            )
+            for seq, content in chunks:
+                cursor = seq
+                yield format_sse(content, event="log", event_id=seq)
+            
+            if chunks:
+                idle = 0.0
+                continue
+            if deployment_status is None or deployment_status in TERMINAL_DEPLOYMENT_STATUSES:
+                yield format_sse(
+                    json.dumps({"status": deployment_status.value if deployment_status else None}),
+                    event="end"
+                )
+                return
+            
+            if idle >= settings.LOG_STREAM_KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield ": keepalive\n\n"
+            await asyncio.sleep(settings.LOG_STREAM_POLL_INTERVAL_SECONDS)
+            idle += settings.LOG_STREAM_POLL_INTERVAL_SECONDS
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @router.post("/{deployment_id}/cancel")
@@ -145,16 +546,23 @@ def cancel_deployment(
         )
     
     # Only allow cancellation if deployment is still running
-    if deployment.status in [DeploymentStatus.SUCCESS, DeploymentStatus.FAILED, DeploymentStatus.CANCELLED]:
+    if deployment.status in TERMINAL_DEPLOYMENT_STATUSES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Cannot cancel deployment with status: {deployment.status}"
         )
     
-    deployment.status = DeploymentStatus.CANCELLED
-    deployment.completed_at = datetime.utcnow()
-    deployment.logs += "\n✗ Deployment cancelled by user\n"
-    
-    db.commit()
+    # Cancelling the job frees its concurrency slot; the conditional status
+    # write keeps the worker from overwriting CANCELLED afterwards
+    cancel_job(db, deployment.id)
+    if not set_deployment_status(
+        db, deployment, DeploymentStatus.CANCELLED, "\n✗ Deployment cancelled by user\n"
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cannot cancel deployment with status: {deployment.status}"
+        )
+    cancellation_registry.request_cancel(deployment.id)
+    worker_pool.wake()
     
     return {"message": "Deployment cancelled successfully"}
@@ -1,10 +1,14 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
 from datetime import datetime
 import psutil
 import os
 
 from schemas import HealthCheck
 from config import settings
+from database import get_db
+from utils.cache import cache
+from workers.deployment_worker import worker_pool
 
 router = APIRouter(prefix="/health", tags=["health"])
 
@@ -71,3 +75,16 @@ def liveness_probe():
         "status": "alive",
         "timestamp": datetime.utcnow().isoformat()
     }
+
+
+@router.get("/metrics")
+def metrics(db: Session = Depends(get_db)):
+    """Application metrics for scraping"""
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "cache": {
+            "connected": cache.is_connected(),
+            "namespaces": cache.get_namespace_stats()
+        },
+        "deployment_queue": worker_pool.get_stats(db)
+    }
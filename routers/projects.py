@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional
+from datetime import datetime
 from database import get_db
-from models import Project, User, ProjectStatus
-from schemas import ProjectCreate, Project as ProjectSchema, ProjectWithDeployments
+from models import Project, User, ProjectStatus, Deployment, DeploymentStatus
+from schemas import ProjectCreate, Project as ProjectSchema, ProjectWithDeployments, DeploymentPage
 from dependencies import get_current_user
 from utils.validation import validator
+from utils.cache import cache, project_cache_key, invalidate_project
+from utils.rollups import delete_project_rollups
+from utils.retention import delete_project_archive
+from utils.pagination import filter_deployments, paginate_deployments
+from config import settings
 
 router = APIRouter(prefix="/projects", tags=["projects"])
 
@@ -60,7 +66,14 @@ def get_project(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    project = db.query(Project).filter(
+    # Cache-aside: pollers are served from cache until a write invalidates it
+    cached = cache.get(project_cache_key(project_id))
+    if cached is not None and cached["user_id"] == current_user.id:
+        return cached["data"]
+    
+    project = db.query(Project).options(
+        selectinload(Project.deployments).selectinload(Deployment.log_chunks)
+    ).filter(
         Project.id == project_id,
         Project.user_id == current_user.id
     ).first()
@@ -69,7 +82,46 @@ def get_project(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Project not found"
         )
-    return project
+    
+    data = ProjectWithDeployments.model_validate(project).model_dump(mode="json")
+    cache.set(
+        project_cache_key(project_id),
+        {"user_id": project.user_id, "data": data},
+        settings.ENTITY_CACHE_TTL
+    )
+    return data
+
+@router.get("/{project_id}/deployments", response_model=DeploymentPage)
+def list_project_deployments(
+    project_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    status_filter: Optional[DeploymentStatus] = Query(None, alias="status"),
+    started_after: Optional[datetime] = None,
+    started_before: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """List a project's deployments, newest first, one cursor page at a time"""
+    project = db.query(Project.id).filter(
+        Project.id == project_id,
+        Project.user_id == current_user.id
+    ).first()
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found"
+        )
+    
+    query = filter_deployments(
+        db.query(Deployment).filter(Deployment.project_id == project_id),
+        status_filter, started_after, started_before
+    )
+    try:
+        items, next_cursor = paginate_deployments(query, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
 
 @router.put("/{project_id}", response_model=ProjectSchema)
 def update_project(
@@ -103,6 +155,7 @@ def update_project(
     project.github_url = str(project_update.github_url)
     db.commit()
     db.refresh(project)
+    invalidate_project(project.id)
     return project
 
 @router.delete("/{project_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -120,6 +173,13 @@ def delete_project(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Project not found"
         )
+    deployment_ids = [
+        deployment_id for (deployment_id,) in
+        db.query(Deployment.id).filter(Deployment.project_id == project_id).all()
+    ]
+    delete_project_archive(db, project_id)
+    delete_project_rollups(db, project_id)
     db.delete(project)
     db.commit()
+    invalidate_project(project_id, deployment_ids)
     return None
@@ -82,6 +82,33 @@ class Deployment(DeploymentBase):
     class Config:
         from_attributes = True
 
+class DeploymentSummary(DeploymentBase):
+    """Deployment without its logs, for listings"""
+    id: int
+    project_id: int
+    status: DeploymentStatus
+    started_at: datetime
+    completed_at: Optional[datetime]
+
+    class Config:
+        from_attributes = True
+
+class DeploymentPage(BaseModel):
+    items: List[DeploymentSummary]
+    next_cursor: Optional[str] = None
+
+class BulkDeploymentCreate(BaseModel):
+    project_ids: List[int] = Field(..., min_length=1, max_length=100)
+
+class BulkDeploymentItem(BaseModel):
+    project_id: int
+    status: str  # "queued", "joined" or "not_found"
+    deployment: Optional[Deployment] = None
+
+class BulkDeploymentResult(BaseModel):
+    queued: int
+    results: List[BulkDeploymentItem]
+
 # --- Project Schemas (Extended) ---
 class ProjectWithDeployments(Project):
     deployments: List[Deployment] = []
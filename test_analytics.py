@@ -0,0 +1,448 @@
+import csv
+import io
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+from test_api_complete import client, test_db, test_user, TestingSessionLocal, engine
+from test_deployments import reset_rate_limiter, auth_headers, pool, project_id
+from config import settings
+from models import Deployment, DeploymentDailyStats, DeploymentDurationBin, DeploymentStatus, User
+from utils.aggregates import local_time, resolve_timezone, time_bucket
+from utils.columnar import ColumnarEngine, DeploymentColumns, columnar_engine
+from utils.retention import archive_deployments
+from utils.rollups import backfill_daily_stats
+from utils.sketches import DDSketch
+from workers.activity import last_seen
+from workers.deployment_worker import set_deployment_status
+from workers.snapshotter import DashboardSnapshotter
+
+def add_deployments(project_id, specs):
+    """Insert deployments given (status, started_at, duration_seconds or None) and rebuild the rollup"""
+    db = TestingSessionLocal()
+    for status, started_at, duration in specs:
+        db.add(Deployment(
+            project_id=project_id,
+            status=status,
+            started_at=started_at,
+            completed_at=started_at + timedelta(seconds=duration) if duration is not None else None
+        ))
+    db.commit()
+    backfill_daily_stats(db)
+    db.close()
+
+@contextmanager
+def count_queries():
+    """Collect the SQL statements executed inside the block"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+@pytest.fixture
+def seeded(project_id):
+    today = datetime.utcnow() - timedelta(seconds=1)
+    yesterday = today - timedelta(days=1)
+    add_deployments(project_id, [
+        (DeploymentStatus.SUCCESS, yesterday, 30),
+        (DeploymentStatus.SUCCESS, yesterday, 50),
+        (DeploymentStatus.FAILED, today, 10),
+        (DeploymentStatus.BUILDING, today, None),
+        (DeploymentStatus.SUCCESS, today - timedelta(days=90), 1000),
+    ])
+    return {"project_id": project_id, "today": today.date().isoformat(), "yesterday": yesterday.date().isoformat()}
+
+def test_user_analytics_aggregates(client, auth_headers, seeded):
+    """Test user analytics status counts, average duration and daily trend"""
+    data = client.get("/analytics/user/stats", headers=auth_headers).json()
+
+    assert data["summary"]["total_projects"] == 1
+    assert data["summary"]["total_deployments"] == 4
+    assert data["summary"]["success_rate"] == 50.0
+    assert data["summary"]["avg_deployment_time_seconds"] == 30.0
+    assert data["summary"]["p50_deployment_time_seconds"] == pytest.approx(30, rel=0.01)
+    assert 30 <= data["summary"]["p99_deployment_time_seconds"] <= 50.5
+    assert data["deployment_status"] == {"success": 2, "failed": 1, "building": 1}
+    assert data["daily_trend"] == {seeded["yesterday"]: 2, seeded["today"]: 2}
+
+def test_user_analytics_query_count_is_constant(client, auth_headers, project_id):
+    """Test the project list doesn't issue a query per project"""
+    now = datetime.utcnow() - timedelta(seconds=1)
+    add_deployments(project_id, [(DeploymentStatus.SUCCESS, now, 5)] * 3)
+    with count_queries() as statements:
+        first = client.get("/analytics/user/stats", headers=auth_headers).json()
+
+    for i in range(4):
+        other = client.post(
+            "/projects",
+            json={"name": f"Project {i}", "github_url": f"https://github.com/user/project-{i}"},
+            headers=auth_headers
+        ).json()["id"]
+        add_deployments(other, [(DeploymentStatus.FAILED, now, 5)] * (i + 1))
+    with count_queries() as more_statements:
+        data = client.get("/analytics/user/stats", headers=auth_headers).json()
+
+    assert first["projects"][0]["deployment_count"] == 3
+    assert [p["deployment_count"] for p in data["projects"]] == [3, 1, 2, 3, 4]
+    assert data["summary"]["total_projects"] == 5
+    assert len(more_statements) == len(statements)
+
+def rollup_rows(db):
+    return sorted(
+        (row.project_id, row.day, row.status.value, row.deployment_count, row.duration_count, row.duration_sum)
+        for row in db.query(DeploymentDailyStats).all()
+        if row.deployment_count
+    )
+
+def test_trend_granularity_and_timezone(client, auth_headers, project_id):
+    """Test trend buckets per granularity, in UTC and across a DST change in another zone"""
+    add_deployments(project_id, [
+        (DeploymentStatus.SUCCESS, datetime(2026, 3, 7, 23, 30), 10),
+        (DeploymentStatus.SUCCESS, datetime(2026, 3, 8, 1, 15), 10),
+        (DeploymentStatus.FAILED, datetime(2026, 3, 8, 8, 0), 10),  # after New York moves to EDT
+        (DeploymentStatus.SUCCESS, datetime(2026, 3, 9, 3, 0), 10),
+    ])
+    period = {"start_date": "2026-03-01T00:00:00", "end_date": "2026-03-31T00:00:00"}
+
+    def trend(path, **params):
+        response = client.get(path, params={**period, **params}, headers=auth_headers)
+        assert response.status_code == 200
+        return response.json()["trend"]["buckets"]
+
+    project_path = f"/analytics/project/{project_id}"
+    assert trend(project_path) == {"2026-03": 4}
+    assert trend(project_path, granularity="day") == {"2026-03-07": 1, "2026-03-08": 2, "2026-03-09": 1}
+    assert trend(project_path, granularity="week") == {"2026-03-02": 3, "2026-03-09": 1}
+    assert trend(project_path, granularity="day", tz="America/New_York") == {"2026-03-07": 2, "2026-03-08": 2}
+    assert trend(project_path, granularity="week", tz="America/New_York") == {"2026-03-02": 4}
+    assert trend("/analytics/user/stats", granularity="hour", tz="America/New_York") == {
+        "2026-03-07T18:00": 1, "2026-03-07T20:00": 1, "2026-03-08T04:00": 1, "2026-03-08T23:00": 1
+    }
+
+    data = client.get(project_path, params={**period, "granularity": "hour"}, headers=auth_headers).json()
+    assert data["monthly_trend"] == {"2026-03": 4}
+    assert client.get(project_path, params={"tz": "Mars/Olympus"}, headers=auth_headers).status_code == 400
+
+def test_postgres_buckets_convert_timestamptz_once():
+    """Test PostgreSQL local-time buckets apply the zone to the timestamptz column directly"""
+    class PostgresBind:
+        dialect = postgresql.dialect()
+
+    class PostgresSession:
+        def get_bind(self):
+            return PostgresBind()
+
+    db = PostgresSession()
+    bucket = time_bucket(db, local_time(db, Deployment.started_at, resolve_timezone("America/New_York"), None, None), "day")
+    sql = str(bucket.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    assert "timezone('America/New_York', deployments.started_at)" in sql
+    assert "'UTC'" not in sql
+
+def test_rollup_is_maintained_on_transitions(client, auth_headers, project_id, pool):
+    """Test the incrementally maintained rollup matches a backfill from scratch"""
+    ids = [
+        client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers).json()["id"]
+        for _ in range(3)
+    ]
+    assert pool.run_once()
+    client.post(f"/deployments/{ids[1]}/cancel", headers=auth_headers)
+
+    db = TestingSessionLocal()
+    incremental = rollup_rows(db)
+    bins = sorted((b.day, b.bin, b.count) for b in db.query(DeploymentDurationBin).all())
+    assert sum(count for _, _, count in bins) == 2
+    backfill_daily_stats(db)
+    rebuilt = rollup_rows(db)
+    # SQLite date functions keep milliseconds, so backfilled durations may differ slightly
+    assert [row[:5] for row in rebuilt] == [row[:5] for row in incremental]
+    assert [row[5] for row in rebuilt] == pytest.approx([row[5] for row in incremental], abs=0.01)
+    db.close()
+
+    assert sorted((b.day, b.bin, b.count) for b in db.query(DeploymentDurationBin).all()) == bins
+    statuses = {row[2]: row[3] for row in incremental}
+    assert statuses["pending"] == 1 and statuses["cancelled"] == 1
+    data = client.get(f"/analytics/project/{project_id}", headers=auth_headers).json()
+    assert data["summary"]["total_deployments"] == 3
+    assert data["deployment_status"]["cancelled"] == 1
+    assert [d["id"] for d in data["recent_deployments"]] == sorted(ids, reverse=True)
+
+def test_stale_status_transition_keeps_rollup_consistent(client, auth_headers, project_id):
+    """Test a writer holding a stale status retries from the actual one"""
+    deployment_id = client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers).json()["id"]
+    stale = TestingSessionLocal()
+    stale_deployment = stale.get(Deployment, deployment_id)
+    assert stale_deployment.status == DeploymentStatus.PENDING
+
+    worker = TestingSessionLocal()
+    assert set_deployment_status(worker, worker.get(Deployment, deployment_id), DeploymentStatus.BUILDING)
+    worker.close()
+
+    assert set_deployment_status(stale, stale_deployment, DeploymentStatus.CANCELLED)
+    stale.close()
+
+    db = TestingSessionLocal()
+    assert {row[2]: row[3] for row in rollup_rows(db)} == {"cancelled": 1}
+    db.close()
+
+def test_backfill_keeps_archived_history(seeded):
+    """Test rebuilding the rollup after archiving still counts the archived deployments"""
+    db = TestingSessionLocal()
+    before = rollup_rows(db)
+    bins = sorted((b.day, b.bin, b.count) for b in db.query(DeploymentDurationBin).all())
+    assert archive_deployments(db, retention_days=30, keep_latest=0)["archived"] == 1
+    backfill_daily_stats(db)
+    assert [row[:5] for row in rollup_rows(db)] == [row[:5] for row in before]
+    assert sorted((b.day, b.bin, b.count) for b in db.query(DeploymentDurationBin).all()) == bins
+    db.close()
+
+@pytest.fixture
+def admin_headers(auth_headers, test_user):
+    db = TestingSessionLocal()
+    db.query(User).filter(User.email == test_user["email"]).update({"is_admin": True})
+    db.commit()
+    db.close()
+    return auth_headers
+
+def test_admin_stats_use_single_pass_queries(client, admin_headers, seeded):
+    """Test admin stats and overview values and their query counts (auth lookup included)"""
+    with count_queries() as statements:
+        stats = client.get("/admin/stats?fresh=true", headers=admin_headers).json()
+    assert len(statements) <= 3
+    assert stats["users"] == {"total": 1, "active": 1, "admins": 1, "recent_24h": 1}
+    assert stats["projects"] == {"total": 1, "active": 1}
+    assert stats["deployments"]["total"] == 5
+    assert (stats["deployments"]["successful"], stats["deployments"]["failed"], stats["deployments"]["pending"]) == (3, 1, 0)
+    assert stats["deployments"]["recent_24h"] == 2
+
+    with count_queries() as statements:
+        overview = client.get("/analytics/admin/overview?fresh=true", headers=admin_headers).json()
+    assert len(statements) <= 5
+    assert overview["overview"]["total_users"] == 1
+    assert overview["overview"]["total_projects"] == 1
+    assert overview["overview"]["total_deployments"] == 5
+    assert overview["overview"]["deployment_success_rate"] == 60.0
+    assert overview["deployment_trend_last_7_days"][seeded["today"]] == 2
+    assert overview["deployment_trend_last_7_days"][seeded["yesterday"]] == 2
+    assert len(overview["deployment_trend_last_7_days"]) == 7
+
+def test_admin_deployment_list_loads_logs_in_one_query(client, admin_headers, seeded):
+    """Test the admin deployment list doesn't load log chunks per deployment (auth lookup included)"""
+    with count_queries() as statements:
+        deployments = client.get("/admin/deployments", headers=admin_headers).json()
+    assert len(deployments) == 5
+    assert len(statements) <= 3
+
+def test_admin_dashboards_serve_snapshots(client, admin_headers, seeded):
+    """Test admin dashboards reuse the stored snapshot until fresh=true is requested"""
+    first = client.get("/admin/stats?fresh=true", headers=admin_headers).json()
+    assert first["staleness_seconds"] < 1
+
+    with count_queries() as statements:
+        cached = client.get("/admin/stats", headers=admin_headers).json()
+    assert len(statements) == 1  # the auth lookup only
+    assert cached["generated_at"] == first["generated_at"]
+    assert cached["staleness_seconds"] >= 0
+
+    add_deployments(seeded["project_id"], [(DeploymentStatus.SUCCESS, datetime.utcnow(), 1)])
+    assert client.get("/admin/stats", headers=admin_headers).json()["deployments"]["total"] == 5
+    assert client.get("/admin/stats?fresh=true", headers=admin_headers).json()["deployments"]["total"] == 6
+
+def test_last_seen_is_written_behind(client, admin_headers):
+    """Test requests only buffer last-seen times, and flushes feed DAU/MAU"""
+    db = TestingSessionLocal()
+    last_seen.flush(db)
+    other = User(email="other@example.com", hashed_password="x")
+    db.add(other)
+    db.commit()
+
+    with count_queries() as statements:
+        assert client.get("/projects", headers=admin_headers).status_code == 200
+    assert not any(statement.lstrip().upper().startswith("UPDATE USERS") for statement in statements)
+
+    last_seen.touch(other.id, datetime.utcnow() - timedelta(days=10))
+    assert last_seen.pending_count == 2
+    with count_queries() as statements:
+        assert last_seen.flush(db) == 2
+    assert len([statement for statement in statements if statement.lstrip().upper().startswith("UPDATE")]) == 1
+
+    overview = client.get("/analytics/admin/overview?fresh=true", headers=admin_headers).json()["overview"]
+    assert overview["daily_active_users"] == 1
+    assert overview["monthly_active_users"] == overview["active_users_last_30_days"] == 2
+    assert overview["dau_mau_ratio"] == 50.0
+
+    # An older timestamp never overwrites a newer one
+    last_seen.touch(other.id, datetime.utcnow() - timedelta(days=40))
+    last_seen.flush(db)
+    db.refresh(other)
+    assert datetime.utcnow() - other.last_seen_at.replace(tzinfo=None) < timedelta(days=11)
+    db.close()
+
+def test_snapshotter_refreshes_in_background():
+    """Test the background thread keeps recomputing registered snapshots"""
+    calls = []
+
+    def compute(db):
+        calls.append(1)
+        return {"calls": len(calls)}
+
+    snapshots = DashboardSnapshotter(session_factory=TestingSessionLocal, interval=0.05)
+    snapshots.register("test", compute)
+    snapshots.start()
+    time.sleep(0.3)
+    snapshots.stop()
+
+    assert not snapshots.running
+    assert len(calls) >= 2
+    payload = snapshots.get("test", None)
+    assert payload["calls"] == len(calls)
+    assert "generated_at" in payload
+
+def test_snapshot_reads_never_stampede():
+    """Test concurrent reads compute a missing snapshot once and refresh a stale one once, in the background"""
+    calls = []
+    refreshing, release = threading.Event(), threading.Event()
+
+    def compute(db):
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.1)  # slow first computation while every reader arrives
+        else:
+            refreshing.set()
+            release.wait(5)
+        return {"calls": len(calls)}
+
+    snapshots = DashboardSnapshotter(session_factory=TestingSessionLocal, interval=0.05)
+    snapshots.register("test", compute)
+
+    def read_concurrently():
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(snapshots.get("test", None)["calls"])) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    assert read_concurrently() == [1] * 8
+    time.sleep(0.15)  # older than STALE_AFTER_INTERVALS intervals
+    assert read_concurrently() == [1] * 8  # served stale, not recomputed inline
+    refresher = snapshots.refresh_in_background("test")
+    assert refreshing.wait(5)
+    assert len(calls) == 2
+    release.set()
+    refresher.join(5)
+    assert snapshots.get("test", None)["calls"] == 2
+
+def test_ddsketch_quantiles_within_relative_accuracy():
+    """Test merged sketches answer quantiles within the relative accuracy"""
+    values = [0.5 * 1.01 ** i for i in range(1000)]
+    first, second = DDSketch(), DDSketch()
+    for i, value in enumerate(values):
+        (first if i % 2 else second).add(value)
+    first.merge(second)
+
+    assert first.count == len(values)
+    for q in (0.5, 0.9, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(first.quantile(q) - exact) <= 0.01 * exact
+    assert DDSketch().quantile(0.5) is None
+
+def test_columnar_engine_matches_sql_path(client, admin_headers, seeded):
+    """Test the NumPy columnar engine returns the same breakdown as SQL"""
+    pytest.importorskip("numpy")
+    other = client.post("/projects", json={"name": "Other", "github_url": "https://github.com/test/other"}, headers=admin_headers).json()
+    now = datetime.utcnow() - timedelta(seconds=1)
+    add_deployments(other["id"], [(DeploymentStatus.SUCCESS, now, 200)] * 4 + [(DeploymentStatus.CANCELLED, now, 2000)])
+    columnar_engine.invalidate()
+
+    for params in ({}, {"start_date": (now - timedelta(days=30)).isoformat(), "top": 1}):
+        sql = client.get("/analytics/admin/deployments", params={**params, "engine": "sql"}, headers=admin_headers).json()
+        columnar = client.get("/analytics/admin/deployments", params={**params, "engine": "columnar"}, headers=admin_headers).json()
+        assert (sql.pop("engine"), columnar.pop("engine")) == ("sql", "columnar")
+        columnar.pop("snapshot_at")
+        assert columnar == sql
+
+    assert sql["total_deployments"] == 9
+    assert sql["top_projects"] == [{"project_id": other["id"], "deployments": 5}]
+    assert sql["daily_trend"] == {seeded["yesterday"]: 2, seeded["today"]: 7}
+    assert sql["duration_histogram"] == {
+        "0-30": 1, "30-60": 2, "60-120": 0, "120-300": 4, "300-600": 0, "600-1800": 0, "1800+": 1
+    }
+
+def test_columnar_snapshot_reloads_in_background(seeded, monkeypatch):
+    """Test a stale snapshot keeps being served while a single background thread reloads it"""
+    pytest.importorskip("numpy")
+    engine = ColumnarEngine(session_factory=TestingSessionLocal, refresh_interval=3600)
+    snapshot = engine.columns()
+    assert len(snapshot) == 5
+    add_deployments(seeded["project_id"], [(DeploymentStatus.SUCCESS, datetime.utcnow(), 5)])
+
+    loading, release = threading.Event(), threading.Event()
+    load = DeploymentColumns.load
+    def slow_load(db):
+        loading.set()
+        release.wait(5)
+        return load(db)
+    monkeypatch.setattr(DeploymentColumns, "load", slow_load)
+
+    engine.refresh_interval = 0
+    assert engine.columns() is snapshot
+    assert loading.wait(5)
+    refresher = engine.refresh_in_background()
+    assert engine.columns() is snapshot
+    assert engine.refresh_in_background() is refresher
+    release.set()
+    refresher.join(5)
+
+    engine.refresh_interval = 3600
+    assert len(engine.columns()) == 6
+
+def test_export_deployments_streams_csv_and_ndjson(client, auth_headers, seeded, monkeypatch):
+    """Test exports cover every deployment across batches, in both formats and gzipped"""
+    monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 2)
+
+    response = client.get("/analytics/export/deployments", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 5
+    assert [row["status"] for row in rows][0] == "success"
+    assert rows[0]["project_name"] == "Test Project"
+
+    response = client.get(
+        "/analytics/export/deployments",
+        params={"format": "ndjson", "gzip": "true", "start_date": (datetime.utcnow() - timedelta(days=30)).isoformat()},
+        headers=auth_headers
+    )
+    assert response.headers["content-encoding"] == "gzip"
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert len(records) == 4
+    assert {record["status"] for record in records} == {"success", "failed", "building"}
+    assert records[-1]["completed_at"] is None
+
+def test_export_includes_archived_deployments(client, auth_headers, seeded, monkeypatch):
+    """Test the export keeps deployments the retention policy moved to the archive, in started_at order"""
+    monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 2)
+    before = list(csv.DictReader(io.StringIO(client.get("/analytics/export/deployments", headers=auth_headers).text)))
+
+    db = TestingSessionLocal()
+    assert archive_deployments(db, retention_days=30, keep_latest=0)["archived"] == 1
+    db.close()
+
+    response = client.get("/analytics/export/deployments", headers=auth_headers)
+    assert list(csv.DictReader(io.StringIO(response.text))) == before
+    response = client.get(
+        "/analytics/export/deployments", params={"start_date": (datetime.utcnow() - timedelta(days=30)).isoformat()},
+        headers=auth_headers
+    )
+    assert len(list(csv.DictReader(io.StringIO(response.text)))) == 4
@@ -0,0 +1,388 @@
+import fnmatch
+import math
+import queue
+import random
+import threading
+import time
+import pytest
+import redis
+from config import settings
+from utils.cache import CacheManager, CacheEntry, CircuitBreaker, should_refresh_early
+
+
+class FakeRedis:
+    """Dict-backed stand-in for the Redis client that counts round trips"""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.round_trips = 0
+        self.subscribers = []
+        self._lock = threading.RLock()
+
+    def _alive(self, key):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def _call(self):
+        with self._lock:
+            self.round_trips += 1
+
+    def ping(self):
+        self._call()
+        return True
+
+    def get(self, key):
+        self._call()
+        with self._lock:
+            return self.data[key] if self._alive(key) else None
+
+    def mget(self, keys):
+        self._call()
+        with self._lock:
+            return [self.data[key] if self._alive(key) else None for key in keys]
+
+    def set(self, key, value, ex=None, nx=False):
+        self._call()
+        with self._lock:
+            if nx and self._alive(key):
+                return None
+            self.data[key] = value
+            self.expires.pop(key, None)
+            if ex:
+                self.expires[key] = time.time() + ex
+            return True
+
+    def setex(self, key, ttl, value):
+        return self.set(key, value, ex=ttl)
+
+    def delete(self, *keys):
+        self._call()
+        with self._lock:
+            deleted = sum(1 for key in keys if self._alive(key))
+            for key in keys:
+                self.data.pop(key, None)
+                self.expires.pop(key, None)
+            return deleted
+
+    def exists(self, key):
+        self._call()
+        with self._lock:
+            return int(self._alive(key))
+
+    def ttl(self, key):
+        self._call()
+        with self._lock:
+            if not self._alive(key):
+                return -2
+            expires_at = self.expires.get(key)
+            return -1 if expires_at is None else int(round(expires_at - time.time()))
+
+    def keys(self, pattern):
+        self._call()
+        with self._lock:
+            return [key for key in list(self.data) if self._alive(key) and fnmatch.fnmatchcase(key, pattern)]
+
+    def incrby(self, key, amount):
+        self._call()
+        with self._lock:
+            value = int(self.data.get(key, 0)) + amount
+            self.data[key] = value
+            return value
+
+    def eval(self, script, numkeys, key, token):
+        # Only the lock release script is used: delete the key if we still own it
+        self._call()
+        with self._lock:
+            if self._alive(key) and self.data[key] == token:
+                return self.delete(key)
+            return 0
+
+    def info(self):
+        self._call()
+        return {}
+
+    def pipeline(self, transaction=False):
+        return FakePipeline(self)
+
+    def publish(self, channel, message):
+        self._call()
+        with self._lock:
+            subscribers = list(self.subscribers)
+        for pubsub in subscribers:
+            pubsub.deliver(channel, message)
+        return len(subscribers)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+
+class FakePubSub:
+    """Pattern subscription on FakeRedis, delivering published messages in order"""
+
+    def __init__(self, client):
+        self.client = client
+        self.patterns = []
+        self.messages = queue.Queue()
+
+    def psubscribe(self, *patterns):
+        self.patterns += patterns
+        with self.client._lock:
+            self.client.subscribers.append(self)
+
+    def deliver(self, channel, data):
+        if any(fnmatch.fnmatchcase(channel, pattern) for pattern in self.patterns):
+            self.messages.put({"type": "pmessage", "channel": channel, "data": data})
+
+    def get_message(self, timeout=0.0):
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        with self.client._lock:
+            if self in self.client.subscribers:
+                self.client.subscribers.remove(self)
+
+
+class FakePipeline:
+    """Buffers commands and runs them against FakeRedis as one round trip"""
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self.client._lock:
+            round_trips = self.client.round_trips
+            results = [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+            self.client.round_trips = round_trips + 1
+        self.commands = []
+        return results
+
+
+def connect_fake_redis(manager: CacheManager) -> FakeRedis:
+    """Point a cache manager at a fresh FakeRedis with a closed breaker"""
+    fake = FakeRedis()
+    manager.redis_client = fake
+    manager.breaker = CircuitBreaker()
+    return fake
+
+def test_should_refresh_early():
+    """Test probabilistic early refresh around the expiry time"""
+    now = time.time()
+    fresh = CacheEntry("value", delta=0.01, expires_at=now + 3600)
+    expired = CacheEntry("value", delta=0.01, expires_at=now - 1)
+
+    assert not should_refresh_early(fresh, beta=1.0, now=now)
+    assert should_refresh_early(expired, beta=1.0, now=now)
+
+def test_get_or_compute_single_flight():
+    """Test concurrent callers share a single computation"""
+    manager = CacheManager()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"total": 42}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(manager.get_or_compute("test:key", compute, ttl=60)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [{"total": 42}] * 8
+    if not manager.is_connected():
+        assert len(calls) == 1
+
+def test_get_or_compute_propagates_errors():
+    """Test errors in the computation reach every waiting caller"""
+    manager = CacheManager()
+
+    def compute():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        manager.get_or_compute("test:error", compute, ttl=60)
+
+def test_bulk_operations():
+    """Test get_many/set_many/delete_many round trip (or degrade when offline)"""
+    manager = CacheManager()
+    values = {"test:bulk:1": 1, "test:bulk:2": {"a": 2}}
+
+    stored = manager.set_many(values, ttl={"test:bulk:1": 60, "test:bulk:2": None})
+    if not manager.is_connected():
+        assert stored is False
+        assert manager.get_many(values) == {}
+        assert manager.delete_many(values) == 0
+        return
+
+    assert manager.get_many(list(values) + ["test:bulk:missing"]) == values
+    with manager.pipeline() as pipe:
+        pipe.ttl("test:bulk:1")
+    assert manager.delete_many(values) == 2
+
+def test_bulk_operations_pipeline_one_round_trip():
+    """Test each bulk operation costs one Redis round trip, with per-key TTLs"""
+    manager = CacheManager()
+    fake = connect_fake_redis(manager)
+    values = {"test:bulk:1": 1, "test:bulk:2": {"a": 2}, "other:bulk:3": [3]}
+
+    def round_trips(operation):
+        before = fake.round_trips
+        result = operation()
+        assert fake.round_trips - before == 1
+        return result
+
+    assert round_trips(lambda: manager.set_many(values, ttl={"test:bulk:1": 60, "test:bulk:2": None}))
+    assert fake.ttl("test:bulk:1") == 60
+    assert fake.ttl("test:bulk:2") == -1
+    assert round_trips(lambda: manager.get_many(list(values) + ["test:bulk:missing"])) == values
+    assert round_trips(lambda: manager.delete_many(list(values) + ["test:bulk:missing"])) == 3
+    assert fake.data == {}
+
+    stats = manager.get_namespace_stats()
+    assert (stats["test"]["sets"], stats["test"]["hits"], stats["test"]["misses"]) == (2, 2, 1)
+    assert (stats["test"]["deletes"], stats["other"]["deletes"]) == (2, 1)
+    assert "evictions" not in stats["test"]  # explicit deletes, not TTL or memory evictions
+    assert stats["other"]["latency_ms"]["get_many"]["count"] == 1
+
+def test_get_or_compute_single_flight_across_processes():
+    """Test only one caller computes under contention, even across managers sharing Redis"""
+    fake = FakeRedis()
+    managers = [CacheManager(), CacheManager()]
+    for manager in managers:
+        manager.redis_client = fake
+        manager.breaker = CircuitBreaker()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"total": 42}
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda manager=managers[i % 2]: results.append(manager.get_or_compute("test:key", compute, ttl=60))
+        )
+        for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [{"total": 42}] * 8
+    assert len(calls) == 1
+    assert not fake.exists("lock:test:key")
+    assert managers[0].get_or_compute("test:key", compute, ttl=60) == {"total": 42}
+    assert len(calls) == 1
+
+def test_get_or_compute_refreshes_early_with_xfetch_probability():
+    """Test a cached entry is recomputed early with probability exp(-remaining / (delta * beta))"""
+    manager = CacheManager()
+    connect_fake_redis(manager)
+    random.seed(1234)
+    remaining, delta, beta, trials = 1.0, 1.0, 1.0, 2000
+
+    refreshed = 0
+    for _ in range(trials):
+        manager.set("test:xfetch", CacheEntry("stale", delta=delta, expires_at=time.time() + remaining), 60)
+        if manager.get_or_compute("test:xfetch", lambda: "fresh", ttl=60, beta=beta) == "fresh":
+            refreshed += 1
+
+    assert abs(refreshed / trials - math.exp(-remaining / (delta * beta))) < 0.05
+
+def test_namespace_metrics():
+    """Test per-namespace counters and latency histograms"""
+    manager = CacheManager()
+    manager.metrics.incr("analytics", "hits")
+    manager.metrics.incr("analytics", "misses", 3)
+    manager.metrics.observe("analytics", "get", 0.2)
+    manager.metrics.observe("analytics", "get", 5000)
+
+    stats = manager.get_namespace_stats()["analytics"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert stats["hit_rate"] == 0.25
+    assert stats["latency_ms"]["get"]["count"] == 2
+    assert stats["latency_ms"]["get"]["buckets"]["le_0.5"] == 1
+    assert stats["latency_ms"]["get"]["buckets"]["le_inf"] == 1
+
+def test_circuit_breaker_opens_after_threshold():
+    """Test the breaker fails fast after repeated failures and closes on reset"""
+    breaker = CircuitBreaker(failure_threshold=3, window=10)
+    assert breaker.allow()
+
+    assert not breaker.record_failure(ConnectionError("refused"))
+    assert not breaker.record_failure(ConnectionError("refused"))
+    assert breaker.record_failure(ConnectionError("refused"))
+    assert not breaker.allow()
+    assert breaker.snapshot()["state"] == "open"
+    assert breaker.snapshot()["trips"] == 1
+
+    breaker.record_success()
+    assert breaker.allow()
+    assert breaker.snapshot()["last_error"] == "refused"
+
+def test_reconnect_probes_go_through_the_breaker(monkeypatch):
+    """Test failed reconnect probes reopen the breaker and a successful one closes it and installs the client"""
+    monkeypatch.setattr(settings, "CACHE_RECONNECT_BASE_BACKOFF_SECONDS", 0.01)
+    monkeypatch.setattr(settings, "CACHE_RECONNECT_MAX_BACKOFF_SECONDS", 0.02)
+    manager = CacheManager()
+    probes = []
+
+    class FlakyRedis(FakeRedis):
+        def ping(self):
+            probes.append((manager.breaker.state, manager.breaker.opened_at))
+            if len(probes) <= 3:
+                raise redis.ConnectionError("refused")
+            return True
+
+    monkeypatch.setattr(manager, "_create_client", FlakyRedis)
+    manager.breaker.trip(redis.ConnectionError("refused"))
+    manager._start_reconnect()
+    manager._reconnect_thread.join(5)
+
+    assert [state for state, _ in probes] == ["half_open"] * 4
+    opened = [opened_at for _, opened_at in probes]
+    assert opened == sorted(opened) and len(set(opened)) == 4  # every failed probe reopened it
+    assert isinstance(manager.redis_client, FlakyRedis)
+    health = manager.get_health()
+    assert health["connected"]
+    assert health["circuit_breaker"]["state"] == "closed"
+    assert health["circuit_breaker"]["opened_at"] is None
+    assert health["circuit_breaker"]["trips"] == 1
+    assert health["reconnect_backoff_seconds"] == 0.0
+
+def test_unreachable_redis_fails_fast():
+    """Test an unreachable Redis opens the breaker instead of blocking each call"""
+    manager = CacheManager()
+    if manager.is_connected():
+        pytest.skip("Redis is reachable")
+
+    health = manager.get_health()
+    assert health["circuit_breaker"]["state"] in ("open", "half_open")
+    assert health["reconnecting"]
+
+    start = time.time()
+    for _ in range(100):
+        assert manager.get("test:offline") is None
+    assert time.time() - start < 0.5
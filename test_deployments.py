@@ -0,0 +1,619 @@
+import asyncio
+import pickle
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, event, text, tuple_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+from test_api_complete import client, test_db, test_user, TestingSessionLocal, engine
+from config import settings
+from database import Base
+from middleware.rate_limiter import rate_limiter
+from routers.deployments import stream_deployment_events
+from test_cache import FakeRedis
+from utils.cache import CacheMetrics, CircuitBreaker, cache, deployment_cache_key, project_cache_key
+from models import User, Deployment, DeploymentArchive, DeploymentJob, DeploymentLogChunk, DeploymentStatus, JobStatus
+from utils.retention import archive_deployments
+from utils.events import InMemoryEventBus, event_bus, user_deployments_channel
+from workers.deployment_worker import (
+    DeploymentWorkerPool, cancellation_registry, claim_lock_statement, claim_next_job, set_deployment_status
+)
+
+@pytest.fixture(autouse=True)
+def reset_rate_limiter():
+    rate_limiter.requests.clear()
+    yield
+    rate_limiter.requests.clear()
+
+@pytest.fixture
+def auth_headers(test_user):
+    return {"Authorization": f"Bearer {test_user['tokens']['access_token']}"}
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(cache, "redis_client", fake)
+    monkeypatch.setattr(cache, "breaker", CircuitBreaker())
+    monkeypatch.setattr(cache, "metrics", CacheMetrics())
+    return fake
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(settings, "DEPLOY_STEP_DELAY_SCALE", 0)
+    return DeploymentWorkerPool(session_factory=TestingSessionLocal, workers=0)
+
+@pytest.fixture
+def project_id(client, auth_headers):
+    project_data = {
+        "name": "Test Project",
+        "github_url": "https://github.com/user/test-project"
+    }
+    response = client.post("/projects", json=project_data, headers=auth_headers)
+    assert response.status_code == 201
+    return response.json()["id"]
+
+def test_get_project_and_deployment(client, auth_headers, project_id, pool):
+    """Test project and deployment reads reflect writes"""
+    response = client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers)
+    assert response.status_code == 201
+    deployment_id = response.json()["id"]
+    assert pool.run_once()
+
+    response = client.get(f"/projects/{project_id}", headers=auth_headers)
+    assert response.status_code == 200
+    assert [d["id"] for d in response.json()["deployments"]] == [deployment_id]
+
+    response = client.get(f"/deployments/{deployment_id}", headers=auth_headers)
+    assert response.status_code == 200
+    status = response.json()["status"]
+
+    response = client.put(
+        f"/projects/{project_id}",
+        json={"name": "Renamed Project", "github_url": "https://github.com/user/test-project"},
+        headers=auth_headers
+    )
+    assert response.status_code == 200
+    response = client.get(f"/projects/{project_id}", headers=auth_headers)
+    assert response.json()["name"] == "Renamed Project"
+    assert response.json()["deployments"][0]["status"] == status
+
+def test_cached_reads_are_hits_until_a_write(client, auth_headers, project_id, pool, fake_redis):
+    """Test project and deployment reads are served from cache and evicted by every write"""
+    user_id = client.get("/users/me", headers=auth_headers).json()["id"]
+    deployment_id = client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers).json()["id"]
+    project_url, project_key = f"/projects/{project_id}", project_cache_key(project_id)
+    deployment_url, deployment_key = f"/deployments/{deployment_id}", deployment_cache_key(deployment_id)
+
+    def read_twice(url, key):
+        first = client.get(url, headers=auth_headers).json()
+        namespace = key.split(":")[0]
+        hits = cache.get_namespace_stats()[namespace]["hits"]
+        assert client.get(url, headers=auth_headers).json() == first
+        assert cache.get_namespace_stats()[namespace]["hits"] == hits + 1
+        assert pickle.loads(fake_redis.data[key]) == {"user_id": user_id, "data": first}
+        return first
+
+    assert read_twice(project_url, project_key)["deployments"][0]["status"] == "pending"
+    assert read_twice(deployment_url, deployment_key)["status"] == "pending"
+
+    # Status changes (the worker's run) evict the deployment and the project embedding it
+    assert pool.run_once()
+    assert project_key not in fake_redis.data and deployment_key not in fake_redis.data
+    assert read_twice(deployment_url, deployment_key)["status"] in ("success", "failed")
+
+    read_twice(project_url, project_key)
+    client.put(
+        project_url,
+        json={"name": "Renamed Project", "github_url": "https://github.com/user/test-project"},
+        headers=auth_headers
+    )
+    assert project_key not in fake_redis.data
+    assert read_twice(project_url, project_key)["name"] == "Renamed Project"
+
+    redeploy_id = client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers).json()["id"]
+    assert project_key not in fake_redis.data
+    assert len(read_twice(project_url, project_key)["deployments"]) == 2
+
+    read_twice(f"/deployments/{redeploy_id}", deployment_cache_key(redeploy_id))
+    client.post(f"/deployments/{redeploy_id}/cancel", headers=auth_headers)
+    assert project_key not in fake_redis.data and deployment_cache_key(redeploy_id) not in fake_redis.data
+
+    empty_id = client.post(
+        "/projects", json={"name": "Empty", "github_url": "https://github.com/user/empty"}, headers=auth_headers
+    ).json()["id"]
+    read_twice(f"/projects/{empty_id}", project_cache_key(empty_id))
+    assert client.delete(f"/projects/{empty_id}", headers=auth_headers).status_code == 204
+    assert project_cache_key(empty_id) not in fake_redis.data
+    assert cache.get_namespace_stats()["project"]["deletes"] == 5  # one per eviction above
+
+def test_cached_reads_are_private(client, auth_headers, project_id, fake_redis):
+    """Test another user can't read a project or deployment from its owner's cache entry"""
+    deployment_id = client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers).json()["id"]
+    client.get(f"/projects/{project_id}", headers=auth_headers)
+    client.get(f"/deployments/{deployment_id}", headers=auth_headers)
+    cached = {key: fake_redis.data[key] for key in (project_cache_key(project_id), deployment_cache_key(deployment_id))}
+
+    other = {"email": "other@example.com", "password": "OtherPassword123!"}
+    client.post("/auth/register", json=other)
+    token = client.post("/auth/login", json=other).json()["access_token"]
+    other_headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get(f"/projects/{project_id}", headers=other_headers).status_code == 404
+    assert client.get(f"/deployments/{deployment_id}", headers=other_headers).status_code == 404
+    assert {key: fake_redis.data[key] for key in cached} == cached
+
+def test_deployment_queue_runs_job(client, auth_headers, project_id, pool):
+    """Test triggered deployments are queued durably and run by a worker"""
+    response = client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers)
+    assert response.json()["status"] == "pending"
+    deployment_id = response.json()["id"]
+
+    db = TestingSessionLocal()
+    job = db.query(DeploymentJob).filter(DeploymentJob.deployment_id == deployment_id).first()
+    assert job.status == JobStatus.QUEUED
+    db.close()
+
+    assert pool.run_once()
+    assert not pool.run_once()
+
+    response = client.get(f"/deployments/{deployment_id}", headers=auth_headers)
+    assert response.json()["status"] in ("success", "failed")
+    assert response.json()["completed_at"] is not None
+
+    db = TestingSessionLocal()
+    job = db.query(DeploymentJob).filter(DeploymentJob.deployment_id == deployment_id).first()
+    assert job.status == JobStatus.DONE
+    assert job.attempts == 1
+    stats = pool.get_stats(db)
+    db.close()
+    assert stats["queued"] == 0
+    assert stats["claimed"] == 1
+    assert stats["completed"] == 1
+
+def test_deployment_queue_per_user_limit(client, auth_headers, project_id, pool):
+    """Test a user's running jobs are capped by the per-user limit"""
+    for _ in range(2):
+        client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers)
+
+    db = TestingSessionLocal()
+    first = claim_next_job(db, "worker-a", max_concurrent=10, max_per_user=1)
+    assert first is not None
+    assert claim_next_job(db, "worker-b", max_concurrent=10, max_per_user=1) is None
+    assert claim_next_job(db, "worker-b", max_concurrent=10, max_per_user=2) is not None
+    db.close()
+
+def test_capped_users_do_not_starve_others(test_db, pool):
+    """Test a user at their limit with a long backlog doesn't block another user's job"""
+    db = TestingSessionLocal()
+    db.add_all(
+        [DeploymentJob(deployment_id=1, user_id=1, status=JobStatus.RUNNING)]
+        + [DeploymentJob(deployment_id=2 + i, user_id=1, status=JobStatus.QUEUED) for i in range(25)]
+        + [DeploymentJob(deployment_id=100, user_id=2, status=JobStatus.QUEUED)]
+    )
+    db.commit()
+    job = claim_next_job(db, "worker-a", max_concurrent=20, max_per_user=1)
+    assert (job.user_id, job.deployment_id) == (2, 100)
+    assert claim_next_job(db, "worker-a", max_concurrent=20, max_per_user=1) is None
+    db.close()
+
+def test_concurrent_claims_respect_limits(tmp_path):
+    """Test workers claiming at once never push past the global or per-user limits"""
+    claims_engine = create_engine(f"sqlite:///{tmp_path / 'claims.db'}", connect_args={"timeout": 30})
+    Base.metadata.create_all(bind=claims_engine)
+    Session = sessionmaker(bind=claims_engine)
+    db = Session()
+    db.add_all(
+        DeploymentJob(deployment_id=i, user_id=i % 3, status=JobStatus.QUEUED)
+        for i in range(30)
+    )
+    db.commit()
+    db.close()
+
+    start = threading.Barrier(12)
+    def claim(worker):
+        session = Session()
+        start.wait()
+        try:
+            while claim_next_job(session, f"worker-{worker}", max_concurrent=4, max_per_user=2):
+                pass
+        finally:
+            session.close()
+    threads = [threading.Thread(target=claim, args=(i,)) for i in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    db = Session()
+    running = db.query(DeploymentJob).filter(DeploymentJob.status == JobStatus.RUNNING).all()
+    assert len(running) == 4
+    assert max(Counter(job.user_id for job in running).values()) <= 2
+    db.close()
+    claims_engine.dispose()
+
+def test_claims_take_advisory_lock_on_postgres():
+    """Test claims on PostgreSQL are serialized by a transaction-scoped advisory lock"""
+    db = sessionmaker(bind=create_engine("postgresql://"))()
+    assert "pg_advisory_xact_lock" in str(claim_lock_statement(db).compile(dialect=postgresql.dialect()))
+    assert claim_lock_statement(TestingSessionLocal()) is None
+
+def test_stale_jobs_are_requeued_and_rerun(client, auth_headers, project_id, pool):
+    """Test a job orphaned mid-build is swept back to the queue and then completes"""
+    deployment_id = client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers).json()["id"]
+
+    db = TestingSessionLocal()
+    job = claim_next_job(db, "dead-worker", max_concurrent=10, max_per_user=2)
+    assert set_deployment_status(db, db.get(Deployment, deployment_id), DeploymentStatus.BUILDING)
+    assert pool.sweep() == 0  # still heartbeating recently
+
+    db.query(DeploymentJob).filter(DeploymentJob.id == job.id).update({
+        "heartbeat_at": datetime.utcnow() - timedelta(seconds=settings.DEPLOY_JOB_TIMEOUT_SECONDS + 1)
+    })
+    db.commit()
+    assert pool.sweep() == 1
+    db.expire_all()
+    assert db.get(Deployment, deployment_id).status == DeploymentStatus.PENDING
+    assert db.get(DeploymentJob, job.id).status == JobStatus.QUEUED
+    db.close()
+
+    assert pool.run_once()
+    assert client.get(f"/deployments/{deployment_id}", headers=auth_headers).json()["status"] in ("success", "failed")
+    db = TestingSessionLocal()
+    job = db.query(DeploymentJob).filter(DeploymentJob.deployment_id == deployment_id).one()
+    assert (job.status, job.attempts) == (JobStatus.DONE, 2)
+    db.close()
+
+def test_cancel_queued_deployment(client, auth_headers, project_id, pool):
+    """Test cancelling a queued deployment removes it from the queue"""
+    response = client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers)
+    deployment_id = response.json()["id"]
+
+    response = client.post(f"/deployments/{deployment_id}/cancel", headers=auth_headers)
+    assert response.status_code == 200
+    assert not pool.run_once()
+
+    response = client.get(f"/deployments/{deployment_id}", headers=auth_headers)
+    assert response.json()["status"] == "cancelled"
+
+def test_logs_are_appended_as_chunks(client, auth_headers, project_id, pool):
+    """Test deployment logs are stored as ordered append-only chunks"""
+    response = client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers)
+    deployment_id = response.json()["id"]
+    assert pool.run_once()
+
+    db = TestingSessionLocal()
+    chunks = db.query(DeploymentLogChunk).filter(
+        DeploymentLogChunk.deployment_id == deployment_id
+    ).order_by(DeploymentLogChunk.seq).all()
+    assert [chunk.seq for chunk in chunks] == list(range(len(chunks)))
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.byte_offset == previous.byte_offset + previous.byte_length
+    db.close()
+
+    response = client.get(f"/deployments/{deployment_id}/logs", headers=auth_headers)
+    logs = response.json()["logs"]
+    assert logs == "".join(chunk.content for chunk in chunks)
+    assert logs.startswith("Deployment queued...\nStarting build process...\n")
+
+def test_stream_logs_until_terminal(client, auth_headers, project_id, pool):
+    """Test the SSE tail sends every chunk, resumes by sequence and ends on terminal status"""
+    response = client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers)
+    deployment_id = response.json()["id"]
+    assert pool.run_once()
+
+    response = client.get(f"/deployments/{deployment_id}/logs/stream", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [event for event in response.text.split("\n\n") if event]
+    assert events[0].startswith("id: 0\nevent: log\ndata: Deployment queued...")
+    assert events[-1].startswith("event: end\ndata: ")
+    log_events = events[:-1]
+
+    response = client.get(
+        f"/deployments/{deployment_id}/logs/stream",
+        headers={**auth_headers, "Last-Event-ID": "1"}
+    )
+    resumed = [event for event in response.text.split("\n\n") if event]
+    assert resumed[:-1] == log_events[2:]
+
+def test_ranged_log_reads(client, auth_headers, project_id, pool):
+    """Test since, offset/limit, tail and Range reads of deployment logs"""
+    response = client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers)
+    deployment_id = response.json()["id"]
+    assert pool.run_once()
+    url = f"/deployments/{deployment_id}/logs"
+
+    full = client.get(url, headers=auth_headers).json()
+    logs = full["logs"]
+    encoded = logs.encode("utf-8")
+    assert full["complete"]
+    assert full["size"] == len(encoded)
+
+    response = client.get(url, params={"since": 0}, headers=auth_headers).json()
+    assert response["logs"] == logs[len("Deployment queued...\n"):]
+    assert response["next_cursor"]["offset"] == len(encoded)
+    assert client.get(url, params={"since": response["next_cursor"]["since"]}, headers=auth_headers).json()["logs"] == ""
+
+    # Page through with a small byte limit; multi-byte characters are never split
+    pages, offset = [], 0
+    while True:
+        page = client.get(url, params={"offset": offset, "limit": 10}, headers=auth_headers).json()
+        pages.append(page["logs"])
+        offset = page["next_cursor"]["offset"]
+        if page["complete"]:
+            break
+    assert "".join(pages) == logs
+
+    tail = client.get(url, params={"tail": 2}, headers=auth_headers).json()["logs"]
+    assert tail == "".join(logs.splitlines(keepends=True)[-2:])
+
+    response = client.get(url, headers={**auth_headers, "Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.content == encoded[:10]
+    assert response.headers["content-range"] == f"bytes 0-9/{len(encoded)}"
+
+    response = client.get(url, headers={**auth_headers, "Range": "bytes=-5"})
+    assert response.content == encoded[-5:]
+
+    response = client.get(url, headers={**auth_headers, "Range": f"bytes={len(encoded)}-"})
+    assert response.status_code == 416
+
+    # An offset past the end reads nothing and hands back a cursor at the end, not beyond it
+    past_end = client.get(url, params={"offset": len(encoded) + 100}, headers=auth_headers).json()
+    assert past_end["logs"] == ""
+    assert past_end["next_cursor"]["offset"] == len(encoded)
+    assert past_end["complete"]
+
+    for params in ({"offset": -5, "limit": 10}, {"limit": -1}, {"limit": 0}, {"tail": 0}, {"since": -1}):
+        assert client.get(url, params=params, headers=auth_headers).status_code == 422
+
+def test_status_transitions_are_published(client, auth_headers, project_id, pool, test_user):
+    """Test every status transition is pushed on the owner's event channel"""
+    user_id = client.get("/users/me", headers=auth_headers).json()["id"]
+    events = []
+    unsubscribe = event_bus.subscribe(user_deployments_channel(user_id), events.append)
+    try:
+        first = client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers).json()
+        assert pool.run_once()
+        second = client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers).json()
+        client.post(f"/deployments/{second['id']}/cancel", headers=auth_headers)
+    finally:
+        unsubscribe()
+
+    first_statuses = [e["status"] for e in events if e["deployment_id"] == first["id"]]
+    assert first_statuses[:2] == ["building", "deploying"]
+    assert first_statuses[2] in ("success", "failed")
+    assert [
+        (e["previous_status"], e["status"]) for e in events if e["deployment_id"] == second["id"]
+    ] == [("pending", "cancelled")]
+
+def test_status_stream_releases_db_connection(test_db, test_user):
+    """Test the status stream hands its session's connection back before streaming"""
+    db = TestingSessionLocal()
+    user = db.query(User).filter(User.email == test_user["email"]).one()
+    assert db.in_transaction()
+
+    async def open_stream():
+        response = await stream_deployment_events(request=None, project_id=None, db=db, current_user=user)
+        assert not db.in_transaction()
+        assert await response.body_iterator.__anext__() == ": connected\n\n"
+        await response.body_iterator.aclose()
+
+    subscribers = event_bus.subscriber_count()
+    asyncio.run(open_stream())
+    assert event_bus.subscriber_count() == subscribers
+
+def test_in_memory_event_bus():
+    """Test the in-memory bus delivers to subscribers until they unsubscribe"""
+    bus = InMemoryEventBus()
+    received = []
+    unsubscribe = bus.subscribe("channel", received.append)
+    bus.publish("channel", {"n": 1})
+    bus.publish("other", {"n": 2})
+    unsubscribe()
+    bus.publish("channel", {"n": 3})
+    assert received == [{"n": 1}]
+    assert bus.subscriber_count() == 0
+
+def test_bulk_deployment(client, auth_headers, project_id, pool):
+    """Test bulk trigger queues owned projects and reports the rest"""
+    other = client.post(
+        "/projects",
+        json={"name": "Other Project", "github_url": "https://github.com/user/other"},
+        headers=auth_headers
+    ).json()["id"]
+
+    response = client.post(
+        "/deployments/bulk",
+        json={"project_ids": [project_id, 9999, other, project_id]},
+        headers=auth_headers
+    )
+    assert response.status_code == 201
+    data = response.json()
+    assert data["queued"] == 2
+    assert [(r["project_id"], r["status"]) for r in data["results"]] == [
+        (project_id, "queued"), (9999, "not_found"), (other, "queued")
+    ]
+    assert data["results"][0]["deployment"]["logs"] == "Deployment queued...\n"
+    assert data["results"][1]["deployment"] is None
+
+    db = TestingSessionLocal()
+    assert db.query(DeploymentJob).filter(DeploymentJob.status == JobStatus.QUEUED).count() == 2
+    db.close()
+    assert pool.run_once() and pool.run_once()
+    assert not pool.run_once()
+
+    # Nothing created: every project unknown, or joined onto a waiting deployment
+    response = client.post("/deployments/bulk", json={"project_ids": [9999]}, headers=auth_headers)
+    assert (response.status_code, response.json()["queued"]) == (200, 0)
+    client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers)
+    response = client.post(
+        "/deployments/bulk", params={"coalesce": "join"}, json={"project_ids": [project_id]}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert [r["status"] for r in response.json()["results"]] == ["joined"]
+
+def test_coalesce_join_and_supersede(client, auth_headers, project_id, pool):
+    """Test join reuses a queued deployment and supersede cancels it"""
+    first = client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers)
+    assert first.status_code == 201
+
+    joined = client.post(f"/deployments/projects/{project_id}/deploy?coalesce=join", headers=auth_headers)
+    assert joined.status_code == 200
+    assert joined.json()["id"] == first.json()["id"]
+
+    bulk = client.post(
+        "/deployments/bulk?coalesce=join",
+        json={"project_ids": [project_id]},
+        headers=auth_headers
+    ).json()
+    assert bulk["queued"] == 0
+    assert bulk["results"][0]["status"] == "joined"
+    assert bulk["results"][0]["deployment"]["id"] == first.json()["id"]
+
+    second = client.post(f"/deployments/projects/{project_id}/deploy?coalesce=supersede", headers=auth_headers)
+    assert second.status_code == 201
+    assert second.json()["id"] != first.json()["id"]
+
+    old = client.get(f"/deployments/{first.json()['id']}", headers=auth_headers).json()
+    assert old["status"] == "cancelled"
+    assert f"Superseded by deployment #{second.json()['id']}" in old["logs"]
+
+    assert pool.run_once()
+    assert not pool.run_once()
+
+def test_superseded_job_is_never_claimed(client, auth_headers, project_id, pool, monkeypatch):
+    """Test a worker woken by a superseding trigger claims the new job, not the cancelled one"""
+    import routers.deployments
+
+    class WakeRunsWorker:
+        def wake(self):
+            pool.run_once()
+
+    first = client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers).json()
+    monkeypatch.setattr(routers.deployments, "worker_pool", WakeRunsWorker())
+    second = client.post(f"/deployments/projects/{project_id}/deploy?coalesce=supersede", headers=auth_headers).json()
+
+    db = TestingSessionLocal()
+    jobs = {job.deployment_id: job.status for job in db.query(DeploymentJob).all()}
+    db.close()
+    assert jobs == {first["id"]: JobStatus.CANCELLED, second["id"]: JobStatus.DONE}
+    assert client.get(f"/deployments/{first['id']}", headers=auth_headers).json()["status"] == "cancelled"
+
+def test_cancel_running_deployment(client, auth_headers, project_id, pool, monkeypatch):
+    """Test cancelling a running deployment stops its worker and frees the slot"""
+    monkeypatch.setattr(settings, "DEPLOY_STEP_DELAY_SCALE", 5)
+    deployment_id = client.post(
+        f"/deployments/projects/{project_id}/deploy", headers=auth_headers
+    ).json()["id"]
+
+    worker = threading.Thread(target=pool.run_once)
+    worker.start()
+    deadline = time.time() + 5
+    while not cancellation_registry.is_running(deployment_id) and time.time() < deadline:
+        time.sleep(0.01)
+    assert cancellation_registry.is_running(deployment_id)
+
+    start = time.time()
+    response = client.post(f"/deployments/{deployment_id}/cancel", headers=auth_headers)
+    assert response.status_code == 200
+    worker.join(5)
+    assert not worker.is_alive()
+    assert time.time() - start < 2
+
+    data = client.get(f"/deployments/{deployment_id}", headers=auth_headers).json()
+    assert data["status"] == "cancelled"
+    db = TestingSessionLocal()
+    assert db.query(DeploymentJob).filter(DeploymentJob.deployment_id == deployment_id).one().status == JobStatus.CANCELLED
+    db.close()
+    assert pool.metrics.snapshot()["cancelled"] == 1
+    assert client.post(f"/deployments/{deployment_id}/cancel", headers=auth_headers).status_code == 400
+
+def test_keyset_pagination(client, auth_headers, project_id):
+    """Test deployment listings page by cursor without gaps or repeats"""
+    ids = [
+        client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers).json()["id"]
+        for _ in range(5)
+    ]
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get(f"/projects/{project_id}/deployments", params=params, headers=auth_headers).json()
+        seen += [item["id"] for item in page["items"]]
+        assert "logs" not in (page["items"] or [{}])[0]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == sorted(ids, reverse=True)
+
+    mine = client.get("/deployments/", params={"status": "pending"}, headers=auth_headers).json()
+    assert [item["id"] for item in mine["items"]] == sorted(ids, reverse=True)
+    assert client.get("/deployments/", params={"status": "success"}, headers=auth_headers).json()["items"] == []
+    assert client.get(
+        "/deployments/", params={"started_before": "2000-01-01T00:00:00Z"}, headers=auth_headers
+    ).json()["items"] == []
+
+    assert client.get("/deployments/", params={"cursor": "bogus"}, headers=auth_headers).status_code == 400
+    assert client.get("/projects/9999/deployments", headers=auth_headers).status_code == 404
+
+def test_user_listing_pages_on_user_index(client, auth_headers, project_id):
+    """Test the per-user listing is a range scan of the (user_id, started_at, id) index"""
+    deployment_id = client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers).json()["id"]
+    db = TestingSessionLocal()
+    deployment = db.get(Deployment, deployment_id)
+    assert deployment.user_id == deployment.project.user_id
+
+    query = db.query(Deployment.id).filter(Deployment.user_id == deployment.user_id).filter(
+        tuple_(Deployment.started_at, Deployment.id) < tuple_(deployment.started_at, deployment.id)
+    ).order_by(Deployment.started_at.desc(), Deployment.id.desc()).limit(3)
+    sql = str(query.statement.compile(db.get_bind(), compile_kwargs={"literal_binds": True}))
+    plan = " ".join(row[-1] for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+    assert "ix_deployments_user_started_at_id" in plan
+    assert "TEMP B-TREE" not in plan
+    db.close()
+
+def test_retention_archives_old_deployments(client, auth_headers, project_id, pool):
+    """Test retention moves deployments to the archive and reads fall back to it"""
+    ids = []
+    for _ in range(3):
+        ids.append(client.post(f"/deployments/projects/{project_id}/deploy", headers=auth_headers).json()["id"])
+        assert pool.run_once()
+
+    db = TestingSessionLocal()
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        result = archive_deployments(db, retention_days=0, keep_latest=1, batch_size=1)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert (result["archived"], result["batches"]) == (2, 2)
+    assert sum("row_number()" in statement for statement in statements) == 1  # expired set ranked once per run
+    assert [d.id for d in db.query(Deployment).all()] == [ids[2]]
+    assert db.query(DeploymentLogChunk).filter(DeploymentLogChunk.deployment_id.in_(ids[:2])).count() == 0
+    assert db.query(DeploymentArchive).count() == 2
+    assert archive_deployments(db, retention_days=0, keep_latest=1)["archived"] == 0
+    db.close()
+
+    archived = client.get(f"/deployments/{ids[0]}", headers=auth_headers).json()
+    assert archived["id"] == ids[0]
+    assert archived["status"] in ("success", "failed")
+    assert archived["logs"].startswith("Deployment queued...\nStarting build process...")
+
+    page = client.get(f"/projects/{project_id}/deployments", headers=auth_headers).json()
+    assert [item["id"] for item in page["items"]] == [ids[2]]
+
+    url = f"/deployments/{ids[0]}/logs"
+    full = client.get(url, headers=auth_headers).json()
+    assert full["logs"] == archived["logs"] and full["complete"]
+    first = client.get(url, params={"limit": 10}, headers=auth_headers).json()
+    assert first["logs"] == archived["logs"][:10] and first["next_cursor"]["offset"] == 10
+    assert client.get(url, params={"tail": 1}, headers=auth_headers).json()["logs"] == archived["logs"].splitlines(True)[-1]
+    response = client.get(url, headers={**auth_headers, "Range": "bytes=0-9"})
+    assert response.status_code == 206 and response.content == archived["logs"].encode()[:10]
+    assert client.get(url, params={"since": 0}, headers=auth_headers).status_code == 400
@@ -9,7 +9,13 @@ from .security import (
 )
 from .email_validator import EmailValidator
 from .logger import logger, setup_logger, log_deployment_event, log_user_event, log_error, log_system_event
-from .cache import cache, cache_response, invalidate_cache_pattern
+from .cache import (
+    cache,
+    cache_response,
+    invalidate_cache_pattern,
+    invalidate_project,
+    invalidate_deployment
+)
 from .validation import validator, Validator
 
 __all__ = [
@@ -29,6 +35,8 @@ __all__ = [
     "cache",
     "cache_response",
     "invalidate_cache_pattern",
+    "invalidate_project",
+    "invalidate_deployment",
     "validator",
     "Validator"
 ]
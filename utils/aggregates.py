@@ -0,0 +1,143 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Tuple, Union
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+from models import Deployment
+
+
+def dialect_name(db: Session) -> str:
+    return db.get_bind().dialect.name
+
+
+def duration_seconds(db: Session, started_at=Deployment.started_at, completed_at=Deployment.completed_at):
+    """SQL expression for a deployment's duration in seconds (NULL while unfinished)"""
+    if dialect_name(db) == "sqlite":
+        return (func.julianday(completed_at) - func.julianday(started_at)) * 86400.0
+    return func.extract("epoch", completed_at - started_at)
+
+
+def day_bucket(column):
+    """SQL expression truncating a timestamp to its calendar day"""
+    return func.date(column)
+
+
+def day_key(value: Union[date, str]) -> str:
+    """ISO day string from a day bucket (a date on PostgreSQL, a string on SQLite)"""
+    return value.isoformat() if isinstance(value, date) else str(value)
+
+
+def count_if(condition):
+    """Conditional aggregate: the number of rows matching condition (0 when none)"""
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def sum_if(condition, value):
+    """Conditional aggregate: the sum of value over rows matching condition (0 when none)"""
+    return func.coalesce(func.sum(case((condition, value), else_=0)), 0)
+
+
+def epoch_seconds(db: Session, column):
+    """SQL expression for a naive UTC timestamp as seconds since the Unix epoch"""
+    if dialect_name(db) == "sqlite":
+        return (func.julianday(column) - 2440587.5) * 86400.0
+    return func.extract("epoch", column)
+
+
+# Upper-open duration histogram buckets, in seconds; the last bucket is unbounded
+DURATION_HISTOGRAM_EDGES = [0, 30, 60, 120, 300, 600, 1800]
+
+
+def histogram_labels(edges=DURATION_HISTOGRAM_EDGES):
+    return [
+        f"{low}-{high}" for low, high in zip(edges, edges[1:])
+    ] + [f"{edges[-1]}+"]
+
+
+GRANULARITIES = ("hour", "day", "week", "month")
+
+# Bucket key formats: hours "2026-10-19T14:00", days and weeks (their Monday)
+# "2026-10-19", months "2026-10"
+SQLITE_BUCKET_FORMATS = {"hour": "%Y-%m-%dT%H:00", "day": "%Y-%m-%d", "week": "%Y-%m-%d", "month": "%Y-%m"}
+POSTGRES_BUCKET_FORMATS = {"hour": 'YYYY-MM-DD"T"HH24:00', "day": "YYYY-MM-DD", "week": "YYYY-MM-DD", "month": "YYYY-MM"}
+
+UTC = ZoneInfo("UTC")
+
+
+def resolve_timezone(name: str) -> ZoneInfo:
+    """ZoneInfo for an IANA time zone name; raises ValueError for unknown zones"""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        raise ValueError(f"Unknown time zone: {name}") from e
+
+
+def is_utc(tz: ZoneInfo) -> bool:
+    return tz.key in ("UTC", "Etc/UTC", "Etc/GMT", "GMT")
+
+
+def naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _offset_at(tz: ZoneInfo, moment: datetime) -> int:
+    return int(moment.replace(tzinfo=timezone.utc).astimezone(tz).utcoffset().total_seconds())
+
+
+def utc_offset_periods(tz: ZoneInfo, start: datetime, end: datetime) -> List[Tuple[datetime, int]]:
+    """
+    (naive UTC start, offset seconds) for each stretch of constant UTC offset
+    in tz between start and end; the first stretch starts at start.
+    """
+    start, end = naive_utc(start), naive_utc(end)
+    periods = [(start, _offset_at(tz, start))]
+    day = start
+    while day < end:
+        next_day = min(day + timedelta(days=1), end)
+        if _offset_at(tz, next_day) != periods[-1][1]:
+            # Narrow the transition down to the second
+            low, high = day, next_day
+            while high - low > timedelta(seconds=1):
+                middle = low + (high - low) / 2
+                if _offset_at(tz, middle) == periods[-1][1]:
+                    low = middle
+                else:
+                    high = middle
+            high = high.replace(microsecond=0)
+            periods.append((high, _offset_at(tz, high)))
+        day = next_day
+    return periods
+
+
+def local_time(db: Session, column, tz: ZoneInfo, start: datetime, end: datetime):
+    """
+    SQL expression converting a UTC timestamp column to wall-clock time in tz.
+    On PostgreSQL the columns are timestamptz, so timezone(tz, column) gives
+    local time directly; SQLite stores naive UTC and has no time zone
+    database, so each UTC offset in effect between start and end is applied
+    by range.
+    """
+    if is_utc(tz):
+        return column
+    if dialect_name(db) == "postgresql":
+        return func.timezone(tz.key, column)
+    periods = utc_offset_periods(tz, start, end)
+    shifted = [func.datetime(column, f"{offset:+d} seconds") for _, offset in periods]
+    if len(periods) == 1:
+        return shifted[0]
+    return case(
+        *((column < boundary, expression) for (boundary, _), expression in zip(periods[1:], shifted)),
+        else_=shifted[-1]
+    )
+
+
+def time_bucket(db: Session, value, granularity: str):
+    """SQL expression for the string key of the hour, day, week or month containing value"""
+    if dialect_name(db) == "postgresql":
+        return func.to_char(func.date_trunc(granularity, value), POSTGRES_BUCKET_FORMATS[granularity])
+    if granularity == "week":
+        # Weeks start on Monday, like PostgreSQL's date_trunc('week')
+        value = func.date(value, "weekday 0", "-6 days")
+    return func.strftime(SQLITE_BUCKET_FORMATS[granularity], value)
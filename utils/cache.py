@@ -1,41 +1,331 @@
 import redis
 import json
+import math
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import timedelta
-from typing import Optional, Any, Union
+from typing import Optional, Any, Union, Callable, Dict, Iterable, List, Mapping
 import pickle
 from config import settings
 
 
+# Lua script used to release a distributed lock only if we still own it
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+else
+    return 0
+end
+"""
+
+
+class CacheEntry:
+    """Cached value with the metadata needed for early refresh"""
+    
+    __slots__ = ("value", "delta", "expires_at")
+    
+    def __init__(self, value: Any, delta: float, expires_at: float):
+        self.value = value
+        self.delta = delta  # Seconds it took to compute the value
+        self.expires_at = expires_at  # Logical expiry (epoch seconds)
+
+
+def should_refresh_early(entry: CacheEntry, beta: float = 1.0, now: Optional[float] = None) -> bool:
+    """
+    Probabilistic early expiration (XFetch).
+    
+    The closer an entry is to its expiry, and the longer it took to compute,
+    the more likely a caller is elected to refresh it ahead of time.
+    """
+    if now is None:
+        now = time.time()
+    # 1 - random() lies in (0, 1], so the log is always defined
+    return now - entry.delta * beta * math.log(1.0 - random.random()) >= entry.expires_at
+
+
+class _Flight:
+    """In-process single-flight slot shared by callers computing the same key"""
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+# Upper bounds (ms) of the cache latency histogram buckets
+LATENCY_BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def key_namespace(key: str) -> str:
+    """Namespace of a cache key: everything before the first colon"""
+    return key.split(":", 1)[0] if ":" in key else "default"
+
+
+class CacheMetrics:
+    """Application-side cache counters and latency histograms per namespace"""
+    
+    COUNTERS = ("hits", "misses", "sets", "deletes", "errors", "bytes_written", "bytes_read")
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._namespaces: Dict[str, dict] = {}
+    
+    def _namespace(self, namespace: str) -> dict:
+        stats = self._namespaces.get(namespace)
+        if stats is None:
+            stats = {counter: 0 for counter in self.COUNTERS}
+            stats["latency"] = {}
+            self._namespaces[namespace] = stats
+        return stats
+    
+    def incr(self, namespace: str, counter: str, amount: int = 1):
+        """Increment a counter for a namespace"""
+        with self._lock:
+            self._namespace(namespace)[counter] += amount
+    
+    def observe(self, namespace: str, operation: str, elapsed_ms: float):
+        """Record the latency of one cache operation"""
+        with self._lock:
+            latency = self._namespace(namespace)["latency"]
+            histogram = latency.get(operation)
+            if histogram is None:
+                histogram = latency[operation] = {
+                    "count": 0,
+                    "sum_ms": 0.0,
+                    "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1)
+                }
+            histogram["count"] += 1
+            histogram["sum_ms"] += elapsed_ms
+            for index, bound in enumerate(LATENCY_BUCKETS_MS):
+                if elapsed_ms <= bound:
+                    break
+            else:
+                index = len(LATENCY_BUCKETS_MS)
+            histogram["buckets"][index] += 1
+    
+    def snapshot(self) -> dict:
+        """Return a copy of all namespace statistics"""
+        with self._lock:
+            result = {}
+            for namespace, stats in self._namespaces.items():
+                lookups = stats["hits"] + stats["misses"]
+                result[namespace] = {
+                    **{counter: stats[counter] for counter in self.COUNTERS},
+                    "hit_rate": stats["hits"] / lookups if lookups else 0,
+                    "latency_ms": {
+                        operation: {
+                            "count": histogram["count"],
+                            "avg": histogram["sum_ms"] / histogram["count"],
+                            "buckets": {
+                                **{
+                                    f"le_{bound}": count
+                                    for bound, count in zip(LATENCY_BUCKETS_MS, histogram["buckets"])
+                                },
+                                "le_inf": histogram["buckets"][-1]
+                            }
+                        }
+                        for operation, histogram in stats["latency"].items()
+                    }
+                }
+            return result
+    
+    def reset(self):
+        """Drop all recorded statistics"""
+        with self._lock:
+            self._namespaces.clear()
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker guarding Redis calls.
+    
+    The breaker opens once failure_threshold connection failures happen within
+    window seconds. While open, calls fail fast instead of waiting for socket
+    timeouts; it closes again when a reconnect probe succeeds.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int = 3, window: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.state = self.CLOSED
+        self.trips = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._failures: List[float] = []
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        """Whether calls may go through to Redis"""
+        return self.state == self.CLOSED
+    
+    def record_failure(self, error: BaseException) -> bool:
+        """
+        Record a connection failure, returning True if it opened the breaker.
+        A failed reconnect probe (half-open) reopens it straight away.
+        """
+        now = time.time()
+        with self._lock:
+            self.last_error = str(error)
+            if self.state == self.HALF_OPEN:
+                self._open(now, new_trip=False)
+                return True
+            if self.state != self.CLOSED:
+                return False
+            self._failures = [t for t in self._failures if now - t < self.window]
+            self._failures.append(now)
+            if len(self._failures) < self.failure_threshold:
+                return False
+            self._open(now)
+            return True
+    
+    def record_success(self):
+        """Close the breaker after a successful probe"""
+        with self._lock:
+            self.state = self.CLOSED
+            self.opened_at = None
+            self._failures = []
+    
+    def trip(self, error: Optional[BaseException] = None):
+        """Open the breaker immediately"""
+        with self._lock:
+            if error is not None:
+                self.last_error = str(error)
+            self._open(time.time())
+    
+    def _open(self, now: float, new_trip: bool = True):
+        self.state = self.OPEN
+        self.opened_at = now
+        if new_trip:
+            self.trips += 1
+        self._failures = []
+    
+    def half_open(self):
+        """Mark a reconnect probe as in flight"""
+        with self._lock:
+            self.state = self.HALF_OPEN
+    
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "recent_failures": len(self._failures),
+            "failure_threshold": self.failure_threshold,
+            "trips": self.trips,
+            "opened_at": self.opened_at,
+            "last_error": self.last_error
+        }
+
+
 class CacheManager:
     """Redis cache manager for the application"""
     
     def __init__(self):
         self.redis_client = None
-        self._connect()
+        self.metrics = CacheMetrics()
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.CACHE_BREAKER_FAILURE_THRESHOLD,
+            window=settings.CACHE_BREAKER_WINDOW_SECONDS
+        )
+        self._flights: Dict[str, _Flight] = {}
+        self._flights_lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._reconnect_thread: Optional[threading.Thread] = None
+        self.reconnect_backoff = 0.0
+    
+    def _create_client(self):
+        # In production, use Redis URL from environment
+        redis_url = getattr(settings, "REDIS_URL", "redis://localhost:6379/0")
+        return redis.from_url(
+            redis_url,
+            decode_responses=False,
+            socket_timeout=settings.CACHE_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.CACHE_SOCKET_TIMEOUT
+        )
     
     def _connect(self):
-        """Connect to Redis"""
-        try:
-            # In production, use Redis URL from environment
-            redis_url = getattr(settings, "REDIS_URL", "redis://localhost:6379/0")
-            self.redis_client = redis.from_url(redis_url, decode_responses=False)
+        """Connect to Redis (lazily, on first use)"""
+        with self._connect_lock:
+            if self.redis_client is not None or not self.breaker.allow():
+                return
+            try:
+                client = self._create_client()
+                
+                # Test connection
+                client.ping()
+                self.redis_client = client
+                print("✅ Connected to Redis cache")
+            except Exception as e:
+                print(f"⚠️  Redis connection failed: {e}")
+                self.breaker.trip(e)
+                self._start_reconnect()
+    
+    def _record_error(self, error: BaseException):
+        """Feed connection failures to the circuit breaker"""
+        if isinstance(error, (redis.ConnectionError, redis.TimeoutError)):
+            if self.breaker.record_failure(error):
+                print("⚠️  Redis circuit breaker opened")
+                self._start_reconnect()
+    
+    def _start_reconnect(self):
+        """Start the background reconnect loop if it is not already running"""
+        if self._reconnect_thread is not None and self._reconnect_thread.is_alive():
+            return
+        self._reconnect_thread = threading.Thread(
+            target=self._reconnect_loop, name="cache-reconnect", daemon=True
+        )
+        self._reconnect_thread.start()
+    
+    def _reconnect_loop(self):
+        """Probe Redis with exponential backoff until it answers again"""
+        backoff = settings.CACHE_RECONNECT_BASE_BACKOFF_SECONDS
+        while True:
+            self.reconnect_backoff = backoff
+            time.sleep(backoff)
+            self.breaker.half_open()
+            try:
+                with self._connect_lock:
+                    if self.redis_client is None:
+                        self.redis_client = self._create_client()
+                    client = self.redis_client
+                client.ping()
+            except Exception as e:
+                self.breaker.record_failure(e)
+                backoff = min(backoff * 2, settings.CACHE_RECONNECT_MAX_BACKOFF_SECONDS)
+                continue
             
-            # Test connection
-            self.redis_client.ping()
-            print("✅ Connected to Redis cache")
-        except Exception as e:
-            print(f"⚠️  Redis connection failed: {e}")
-            self.redis_client = None
+            self.reconnect_backoff = 0.0
+            self.breaker.record_success()
+            print("✅ Reconnected to Redis cache")
+            return
     
     def is_connected(self) -> bool:
-        """Check if Redis is connected"""
-        return self.redis_client is not None
+        """Check if Redis is connected and the circuit breaker is closed"""
+        if self.redis_client is None:
+            self._connect()
+        return self.redis_client is not None and self.breaker.allow()
+    
+    def get_health(self) -> dict:
+        """Connection and circuit breaker state"""
+        return {
+            "connected": self.is_connected(),
+            "circuit_breaker": self.breaker.snapshot(),
+            "reconnecting": self._reconnect_thread is not None and self._reconnect_thread.is_alive(),
+            "reconnect_backoff_seconds": self.reconnect_backoff
+        }
     
     def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
         """Set a value in cache"""
         if not self.is_connected():
             return False
         
+        namespace = key_namespace(key)
+        start = time.perf_counter()
         try:
             # Serialize value
             serialized_value = pickle.dumps(value)
@@ -45,35 +335,58 @@ class CacheManager:
             else:
                 self.redis_client.set(key, serialized_value)
             
+            self.metrics.incr(namespace, "sets")
+            self.metrics.incr(namespace, "bytes_written", len(serialized_value))
             return True
         except Exception as e:
             print(f"Cache set error: {e}")
+            self._record_error(e)
+            self.metrics.incr(namespace, "errors")
             return False
+        finally:
+            self.metrics.observe(namespace, "set", (time.perf_counter() - start) * 1000)
     
     def get(self, key: str) -> Optional[Any]:
         """Get a value from cache"""
         if not self.is_connected():
             return None
         
+        namespace = key_namespace(key)
+        start = time.perf_counter()
         try:
             serialized_value = self.redis_client.get(key)
             if serialized_value:
+                self.metrics.incr(namespace, "hits")
+                self.metrics.incr(namespace, "bytes_read", len(serialized_value))
                 return pickle.loads(serialized_value)
+            self.metrics.incr(namespace, "misses")
             return None
         except Exception as e:
             print(f"Cache get error: {e}")
+            self._record_error(e)
+            self.metrics.incr(namespace, "errors")
             return None
+        finally:
+            self.metrics.observe(namespace, "get", (time.perf_counter() - start) * 1000)
     
     def delete(self, key: str) -> bool:
         """Delete a key from cache"""
         if not self.is_connected():
             return False
         
+        namespace = key_namespace(key)
+        start = time.perf_counter()
         try:
-            return bool(self.redis_client.delete(key))
+            deleted = self.redis_client.delete(key)
+            self.metrics.incr(namespace, "deletes", deleted)
+            return bool(deleted)
         except Exception as e:
             print(f"Cache delete error: {e}")
+            self._record_error(e)
+            self.metrics.incr(namespace, "errors")
             return False
+        finally:
+            self.metrics.observe(namespace, "delete", (time.perf_counter() - start) * 1000)
     
     def exists(self, key: str) -> bool:
         """Check if a key exists in cache"""
@@ -84,8 +397,125 @@ class CacheManager:
             return bool(self.redis_client.exists(key))
         except Exception as e:
             print(f"Cache exists error: {e}")
+            self._record_error(e)
             return False
     
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Get several values in one round trip, omitting missing keys"""
+        keys = list(keys)
+        if not keys or not self.is_connected():
+            return {}
+        
+        start = time.perf_counter()
+        try:
+            values = self.redis_client.mget(keys)
+            result = {}
+            for key, value in zip(keys, values):
+                namespace = key_namespace(key)
+                if value is None:
+                    self.metrics.incr(namespace, "misses")
+                    continue
+                self.metrics.incr(namespace, "hits")
+                self.metrics.incr(namespace, "bytes_read", len(value))
+                result[key] = pickle.loads(value)
+            return result
+        except Exception as e:
+            print(f"Cache get_many error: {e}")
+            self._record_error(e)
+            self._record_batch_errors(keys)
+            return {}
+        finally:
+            self._observe_batch(keys, "get_many", start)
+    
+    def set_many(
+        self,
+        mapping: Mapping[str, Any],
+        ttl: Union[int, Mapping[str, Optional[int]], None] = None
+    ) -> bool:
+        """
+        Set several values in one pipelined round trip.
+        
+        ttl is either a single TTL applied to every key or a per-key mapping;
+        keys without a TTL are stored without expiry.
+        """
+        if not mapping or not self.is_connected():
+            return False
+        
+        start = time.perf_counter()
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            written = []
+            for key, value in mapping.items():
+                key_ttl = ttl.get(key) if isinstance(ttl, Mapping) else ttl
+                serialized_value = pickle.dumps(value)
+                pipe.set(key, serialized_value, ex=key_ttl or None)
+                written.append((key_namespace(key), len(serialized_value)))
+            pipe.execute()
+            for namespace, size in written:
+                self.metrics.incr(namespace, "sets")
+                self.metrics.incr(namespace, "bytes_written", size)
+            return True
+        except Exception as e:
+            print(f"Cache set_many error: {e}")
+            self._record_error(e)
+            self._record_batch_errors(mapping)
+            return False
+        finally:
+            self._observe_batch(mapping, "set_many", start)
+    
+    def delete_many(self, keys: Iterable[str]) -> int:
+        """Delete several keys in one pipelined round trip"""
+        keys = list(keys)
+        if not keys or not self.is_connected():
+            return 0
+        
+        start = time.perf_counter()
+        try:
+            # One DEL per key in a single pipeline so deletes are attributed per namespace
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key in keys:
+                pipe.delete(key)
+            results = pipe.execute()
+            for key, deleted in zip(keys, results):
+                self.metrics.incr(key_namespace(key), "deletes", deleted)
+            return sum(results)
+        except Exception as e:
+            print(f"Cache delete_many error: {e}")
+            self._record_error(e)
+            self._record_batch_errors(keys)
+            return 0
+        finally:
+            self._observe_batch(keys, "delete_many", start)
+    
+    def _record_batch_errors(self, keys: Iterable[str]):
+        for namespace in {key_namespace(key) for key in keys}:
+            self.metrics.incr(namespace, "errors")
+    
+    def _observe_batch(self, keys: Iterable[str], operation: str, start: float):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for namespace in {key_namespace(key) for key in keys}:
+            self.metrics.observe(namespace, operation, elapsed_ms)
+    
+    @contextmanager
+    def pipeline(self, transaction: bool = False):
+        """
+        Batch arbitrary commands into one round trip.
+        
+        Yields a Redis pipeline that is executed when the block exits, or None
+        when Redis is unavailable so callers can skip the batch.
+        """
+        if not self.is_connected():
+            yield None
+            return
+        
+        pipe = self.redis_client.pipeline(transaction=transaction)
+        yield pipe
+        try:
+            pipe.execute()
+        except Exception as e:
+            print(f"Cache pipeline error: {e}")
+            self._record_error(e)
+    
     def clear_pattern(self, pattern: str) -> int:
         """Clear all keys matching a pattern"""
         if not self.is_connected():
@@ -94,10 +524,13 @@ class CacheManager:
         try:
             keys = self.redis_client.keys(pattern)
             if keys:
-                return self.redis_client.delete(*keys)
+                deleted = self.redis_client.delete(*keys)
+                self.metrics.incr(key_namespace(pattern), "deletes", deleted)
+                return deleted
             return 0
         except Exception as e:
             print(f"Cache clear pattern error: {e}")
+            self._record_error(e)
             return 0
     
     def increment(self, key: str, amount: int = 1) -> Optional[int]:
@@ -109,17 +542,144 @@ class CacheManager:
             return self.redis_client.incrby(key, amount)
         except Exception as e:
             print(f"Cache increment error: {e}")
+            self._record_error(e)
+            return None
+    
+    def acquire_lock(self, name: str, ttl: int = 30) -> Optional[str]:
+        """Try to take a distributed lock, returning its token if acquired"""
+        if not self.is_connected():
+            return None
+        
+        token = uuid.uuid4().hex
+        try:
+            if self.redis_client.set(f"lock:{name}", token, nx=True, ex=ttl):
+                return token
+            return None
+        except Exception as e:
+            print(f"Cache lock error: {e}")
+            self._record_error(e)
             return None
     
+    def release_lock(self, name: str, token: str) -> bool:
+        """Release a distributed lock previously taken with acquire_lock"""
+        if not self.is_connected():
+            return False
+        
+        try:
+            return bool(self.redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, f"lock:{name}", token))
+        except Exception as e:
+            print(f"Cache unlock error: {e}")
+            self._record_error(e)
+            return False
+    
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        ttl: int = 300,
+        stale_ttl: Optional[int] = None,
+        beta: Optional[float] = None,
+    ) -> Any:
+        """
+        Return the cached value for key, computing it at most once at a time.
+        
+        Concurrent callers in this process share one computation, and a Redis
+        lock elects a single recomputing worker across processes. Entries are
+        refreshed probabilistically before they expire and kept for stale_ttl
+        seconds afterwards, so callers that lose the election are served the
+        stale value instead of recomputing it.
+        """
+        if stale_ttl is None:
+            stale_ttl = ttl
+        if beta is None:
+            beta = settings.CACHE_EARLY_REFRESH_BETA
+        
+        entry = self.get(key)
+        if not isinstance(entry, CacheEntry):
+            entry = None
+        if entry is not None and not should_refresh_early(entry, beta):
+            return entry.value
+        
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _Flight()
+                self._flights[key] = flight
+        
+        if not is_leader:
+            if entry is not None:
+                return entry.value
+            if not flight.event.wait(settings.CACHE_LOCK_TIMEOUT_SECONDS):
+                return compute()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        
+        try:
+            flight.result = self._compute_entry(key, compute, entry, ttl, stale_ttl)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+    
+    def _compute_entry(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        stale: Optional[CacheEntry],
+        ttl: int,
+        stale_ttl: int,
+    ) -> Any:
+        """Recompute key under the distributed lock, or wait for whoever holds it"""
+        lock_timeout = settings.CACHE_LOCK_TIMEOUT_SECONDS
+        token = self.acquire_lock(key, ttl=lock_timeout)
+        
+        if token is None and self.is_connected():
+            # Another worker is recomputing this key
+            if stale is not None:
+                return stale.value
+            deadline = time.time() + lock_timeout
+            while time.time() < deadline:
+                time.sleep(0.05)
+                fresh = self.get(key)
+                if isinstance(fresh, CacheEntry):
+                    return fresh.value
+                if not self.exists(f"lock:{key}"):
+                    break
+        
+        try:
+            started = time.time()
+            value = compute()
+            finished = time.time()
+            self.set(
+                key,
+                CacheEntry(value, delta=finished - started, expires_at=finished + ttl),
+                ttl + stale_ttl,
+            )
+            return value
+        finally:
+            if token is not None:
+                self.release_lock(key, token)
+    
+    def get_namespace_stats(self) -> dict:
+        """Get application-side statistics per key namespace"""
+        return self.metrics.snapshot()
+    
     def get_stats(self) -> dict:
         """Get cache statistics"""
         if not self.is_connected():
-            return {"status": "disconnected"}
+            return {"status": "disconnected", "namespaces": self.get_namespace_stats()}
         
         try:
             info = self.redis_client.info()
             return {
                 "status": "connected",
+                "namespaces": self.get_namespace_stats(),
                 "used_memory": info.get("used_memory_human", "N/A"),
                 "connected_clients": info.get("connected_clients", 0),
                 "total_commands_processed": info.get("total_commands_processed", 0),
@@ -131,6 +691,7 @@ class CacheManager:
                 )
             }
         except Exception as e:
+            self._record_error(e)
             return {"status": "error", "error": str(e)}
 
 
@@ -164,3 +725,26 @@ def cache_response(ttl: int = 300):
 def invalidate_cache_pattern(pattern: str):
     """Invalidate cache entries matching pattern"""
     cache.clear_pattern(pattern)
+
+
+def project_cache_key(project_id: int) -> str:
+    """Cache key for a project read (with its deployments)"""
+    return f"project:{project_id}"
+
+
+def deployment_cache_key(deployment_id: int) -> str:
+    """Cache key for a single deployment read"""
+    return f"deployment:{deployment_id}"
+
+
+def invalidate_project(project_id: int, deployment_ids: Optional[list] = None):
+    """Drop a cached project and, optionally, its cached deployments"""
+    cache.delete_many(
+        [project_cache_key(project_id)] +
+        [deployment_cache_key(deployment_id) for deployment_id in deployment_ids or []]
+    )
+
+
+def invalidate_deployment(deployment_id: int, project_id: int):
+    """Drop a cached deployment and the project that embeds it"""
+    cache.delete_many([deployment_cache_key(deployment_id), project_cache_key(project_id)])
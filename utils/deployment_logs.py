@@ -0,0 +1,185 @@
+from typing import List, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import DeploymentLogChunk
+
+# Retries when two writers race for the same sequence number
+APPEND_RETRIES = 3
+
+# Rows fetched per round trip when scanning chunks
+READ_BATCH_SIZE = 200
+
+
+def _next_position(db: Session, deployment_id: int) -> tuple:
+    """Next sequence number and byte offset, read from the last chunk only"""
+    last = db.query(
+        DeploymentLogChunk.seq,
+        DeploymentLogChunk.byte_offset,
+        DeploymentLogChunk.byte_length
+    ).filter(
+        DeploymentLogChunk.deployment_id == deployment_id
+    ).order_by(DeploymentLogChunk.seq.desc()).first()
+    if last is None:
+        return 0, 0
+    seq, byte_offset, byte_length = last
+    return seq + 1, byte_offset + byte_length
+
+
+def first_log_chunk(deployment_id: int, text: str) -> DeploymentLogChunk:
+    """Opening chunk of a brand-new deployment's log (no position lookup needed)"""
+    return DeploymentLogChunk(
+        deployment_id=deployment_id,
+        seq=0,
+        byte_offset=0,
+        byte_length=len(text.encode("utf-8")),
+        content=text
+    )
+
+
+def append_log(db: Session, deployment_id: int, text: str) -> Optional[DeploymentLogChunk]:
+    """
+    Append text to a deployment's log as a new chunk.
+    
+    Only the new chunk is written, so an append costs O(len(text)) no matter
+    how long the log already is. The chunk is flushed but the caller commits.
+    """
+    if not text:
+        return None
+    
+    byte_length = len(text.encode("utf-8"))
+    for attempt in range(APPEND_RETRIES):
+        seq, byte_offset = _next_position(db, deployment_id)
+        chunk = DeploymentLogChunk(
+            deployment_id=deployment_id,
+            seq=seq,
+            byte_offset=byte_offset,
+            byte_length=byte_length,
+            content=text
+        )
+        try:
+            with db.begin_nested():
+                db.add(chunk)
+            return chunk
+        except IntegrityError:
+            if attempt == APPEND_RETRIES - 1:
+                raise
+    return None
+
+
+def read_chunks(
+    db: Session,
+    deployment_id: int,
+    after_seq: int = -1,
+    limit: int = 100
+) -> List[Tuple[int, str]]:
+    """(seq, content) of the chunks following after_seq, in order"""
+    return db.query(DeploymentLogChunk.seq, DeploymentLogChunk.content).filter(
+        DeploymentLogChunk.deployment_id == deployment_id,
+        DeploymentLogChunk.seq > after_seq
+    ).order_by(DeploymentLogChunk.seq).limit(limit).all()
+
+
+def format_sse(data: str, event: Optional[str] = None, event_id: Optional[int] = None) -> str:
+    """Encode one server-sent event; multi-line data becomes several data fields"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    for line in data.split("\n"):
+        lines.append(f"data: {line}")
+    return "\n".join(lines) + "\n\n"
+
+
+def log_position(db: Session, deployment_id: int) -> Tuple[int, int]:
+    """Sequence number of the last chunk (-1 if none) and total log size in bytes"""
+    next_seq, size = _next_position(db, deployment_id)
+    return next_seq - 1, size
+
+
+def _trim_partial_utf8(data: bytes) -> bytes:
+    """Drop a multi-byte character cut off at the end of data"""
+    for cut in range(min(3, len(data)) + 1):
+        candidate = data[:len(data) - cut]
+        try:
+            candidate.decode("utf-8")
+            return candidate
+        except UnicodeDecodeError:
+            continue
+    return data
+
+
+def read_since(db: Session, deployment_id: int, since_seq: int, limit: int = 1000) -> dict:
+    """Chunks after since_seq, with the cursor to continue from"""
+    text = []
+    cursor_seq, cursor_offset = since_seq, None
+    rows = db.query(
+        DeploymentLogChunk.seq,
+        DeploymentLogChunk.byte_offset,
+        DeploymentLogChunk.byte_length,
+        DeploymentLogChunk.content
+    ).filter(
+        DeploymentLogChunk.deployment_id == deployment_id,
+        DeploymentLogChunk.seq > since_seq
+    ).order_by(DeploymentLogChunk.seq).limit(limit).yield_per(READ_BATCH_SIZE)
+    for seq, byte_offset, byte_length, content in rows:
+        text.append(content)
+        cursor_seq, cursor_offset = seq, byte_offset + byte_length
+    return {"logs": "".join(text), "since": cursor_seq, "offset": cursor_offset}
+
+
+def read_byte_range(db: Session, deployment_id: int, start: int, end: int) -> bytes:
+    """
+    Bytes [start, end) of the log, reading only the chunks that overlap them.
+    """
+    if end <= start:
+        return b""
+    parts = []
+    rows = db.query(
+        DeploymentLogChunk.byte_offset,
+        DeploymentLogChunk.content
+    ).filter(
+        DeploymentLogChunk.deployment_id == deployment_id,
+        DeploymentLogChunk.byte_offset < end,
+        DeploymentLogChunk.byte_offset + DeploymentLogChunk.byte_length > start
+    ).order_by(DeploymentLogChunk.byte_offset).yield_per(READ_BATCH_SIZE)
+    for byte_offset, content in rows:
+        data = content.encode("utf-8")
+        parts.append(data[max(start - byte_offset, 0):end - byte_offset])
+    return b"".join(parts)
+
+
+def decode_text_range(data: bytes, offset: int) -> dict:
+    """Decode bytes read from offset, dropping a trailing partial character"""
+    data = _trim_partial_utf8(data)
+    return {"logs": data.decode("utf-8", errors="replace"), "offset": offset + len(data)}
+
+
+def read_text_range(db: Session, deployment_id: int, offset: int, limit: int) -> dict:
+    """Up to limit bytes of text from offset, never splitting a character"""
+    return decode_text_range(read_byte_range(db, deployment_id, offset, offset + limit), offset)
+
+
+def tail_lines(text: str, lines: int) -> str:
+    """Last lines of text"""
+    if lines <= 0:
+        return ""
+    return "".join(text.splitlines(keepends=True)[-lines:])
+
+
+def read_tail(db: Session, deployment_id: int, lines: int) -> str:
+    """Last lines of the log, scanning chunks backwards only as far as needed"""
+    if lines <= 0:
+        return ""
+    parts = []
+    newlines = 0
+    rows = db.query(DeploymentLogChunk.content).filter(
+        DeploymentLogChunk.deployment_id == deployment_id
+    ).order_by(DeploymentLogChunk.seq.desc()).yield_per(READ_BATCH_SIZE)
+    for (content,) in rows:
+        parts.append(content)
+        newlines += content.count("\n")
+        # One extra newline covers a trailing newline at the very end
+        if newlines > lines:
+            break
+    return tail_lines("".join(reversed(parts)), lines)
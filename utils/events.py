@@ -0,0 +1,145 @@
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from config import settings
+from utils.cache import cache
+from utils.logger import log_error
+
+# Prefix of the Redis pub/sub channels used for cross-worker fan-out
+REDIS_CHANNEL_PREFIX = "events:"
+
+Callback = Callable[[dict], Any]
+
+
+class InMemoryEventBus:
+    """Process-local pub/sub; also the stand-in used in tests"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[Callback]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel: str, callback: Callback) -> Callable[[], None]:
+        """Register callback for channel and return a function that unsubscribes it"""
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                callbacks = self._subscribers.get(channel, [])
+                if callback in callbacks:
+                    callbacks.remove(callback)
+                if not callbacks:
+                    self._subscribers.pop(channel, None)
+
+        return unsubscribe
+
+    def publish(self, channel: str, event: dict):
+        """Deliver event to every subscriber of channel"""
+        self._dispatch(channel, event)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(callbacks) for callbacks in self._subscribers.values())
+
+    def _dispatch(self, channel: str, event: dict):
+        with self._lock:
+            callbacks = list(self._subscribers.get(channel, []))
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                log_error(e, f"Event subscriber on {channel}")
+
+
+class RedisEventBus(InMemoryEventBus):
+    """
+    Pub/sub that fans events out to every worker through Redis.
+
+    Events are published on a Redis channel and a listener thread in each
+    process delivers them to local subscribers. While Redis is unavailable,
+    events are delivered to this process's subscribers only.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._listener: Optional[threading.Thread] = None
+        self._listener_lock = threading.Lock()
+
+    def subscribe(self, channel: str, callback: Callback) -> Callable[[], None]:
+        unsubscribe = super().subscribe(channel, callback)
+        self._start_listener()
+        return unsubscribe
+
+    def publish(self, channel: str, event: dict):
+        if cache.is_connected():
+            try:
+                cache.redis_client.publish(REDIS_CHANNEL_PREFIX + channel, json.dumps(event))
+                return
+            except Exception as e:
+                print(f"Event publish error: {e}")
+                cache._record_error(e)
+        self._dispatch(channel, event)
+
+    def _start_listener(self):
+        with self._listener_lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(
+                target=self._listen, name="event-bus-listener", daemon=True
+            )
+            self._listener.start()
+
+    def _listen(self):
+        """Relay Redis messages to local subscribers, resubscribing after failures"""
+        while True:
+            if not cache.is_connected():
+                time.sleep(1)
+                continue
+            pubsub = cache.redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.psubscribe(REDIS_CHANNEL_PREFIX + "*")
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    channel = message["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode("utf-8")
+                    self._dispatch(channel[len(REDIS_CHANNEL_PREFIX):], json.loads(message["data"]))
+            except Exception as e:
+                print(f"Event listener error: {e}")
+                cache._record_error(e)
+                time.sleep(1)
+            finally:
+                pubsub.close()
+
+
+def create_event_bus() -> InMemoryEventBus:
+    """Build the event bus selected by EVENT_BUS_BACKEND"""
+    if settings.EVENT_BUS_BACKEND == "redis":
+        return RedisEventBus()
+    return InMemoryEventBus()
+
+
+# Global event bus instance
+event_bus = create_event_bus()
+
+
+def user_deployments_channel(user_id: int) -> str:
+    """Channel carrying deployment events for one user's projects"""
+    return f"deployments:user:{user_id}"
+
+
+def publish_deployment_status(deployment, user_id: int, previous_status=None):
+    """Publish a deployment status transition to its owner's channel"""
+    event_bus.publish(user_deployments_channel(user_id), {
+        "type": "deployment.status",
+        "deployment_id": deployment.id,
+        "project_id": deployment.project_id,
+        "status": deployment.status.value,
+        "previous_status": previous_status.value if previous_status else None,
+        "completed_at": deployment.completed_at.isoformat() if deployment.completed_at else None,
+        "timestamp": datetime.utcnow().isoformat()
+    })
@@ -0,0 +1,49 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, List, Sequence
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson"
+}
+
+
+def _cell(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return getattr(value, "value", value)
+
+
+def csv_stream(columns: Sequence[str], batches: Iterable[List[Sequence]]) -> Iterator[str]:
+    """Encode row batches as CSV, one chunk of text per batch, header first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_cell(value) for value in row] for row in batch)
+        yield buffer.getvalue()
+
+
+def ndjson_stream(columns: Sequence[str], batches: Iterable[List[Sequence]]) -> Iterator[str]:
+    """Encode row batches as newline-delimited JSON objects, one chunk of text per batch"""
+    for batch in batches:
+        yield "".join(
+            json.dumps(dict(zip(columns, (_cell(value) for value in row)))) + "\n"
+            for row in batch
+        )
+
+
+def gzip_stream(chunks: Iterable[str]) -> Iterator[bytes]:
+    """Gzip text chunks on the fly, yielding compressed bytes as they become available"""
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,69 @@
+import base64
+import json
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+from models import Deployment, DeploymentStatus
+
+
+def encode_cursor(started_at: datetime, deployment_id: int) -> str:
+    """Opaque cursor pointing just past a deployment in (started_at, id) order"""
+    payload = json.dumps({"s": started_at.isoformat(), "i": deployment_id})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(payload["s"]), int(payload["i"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def _as_naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def filter_deployments(
+    query: Query,
+    status: Optional[DeploymentStatus] = None,
+    started_after: Optional[datetime] = None,
+    started_before: Optional[datetime] = None
+) -> Query:
+    """Apply the listing filters; started_after is inclusive and started_before exclusive"""
+    if status is not None:
+        query = query.filter(Deployment.status == status)
+    if started_after is not None:
+        query = query.filter(Deployment.started_at >= _as_naive_utc(started_after))
+    if started_before is not None:
+        query = query.filter(Deployment.started_at < _as_naive_utc(started_before))
+    return query
+
+
+def paginate_deployments(query: Query, cursor: Optional[str], limit: int) -> Tuple[List[Deployment], Optional[str]]:
+    """
+    Return one page of deployments, newest first, and the cursor of the next page.
+    
+    Pages are selected by keyset on (started_at, id) rather than OFFSET, so
+    with a matching index every page is a range scan of `limit` rows no
+    matter how deep it is.
+    """
+    if cursor:
+        started_at, deployment_id = decode_cursor(cursor)
+        query = query.filter(
+            tuple_(Deployment.started_at, Deployment.id) < tuple_(started_at, deployment_id)
+        )
+    rows = query.order_by(
+        Deployment.started_at.desc(), Deployment.id.desc()
+    ).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].started_at, rows[-1].id)
+    return rows, next_cursor
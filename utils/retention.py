@@ -0,0 +1,173 @@
+import json
+import zlib
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session, selectinload
+from config import settings
+from models import (
+    Deployment,
+    DeploymentArchive,
+    DeploymentJob,
+    DeploymentLogChunk,
+    TERMINAL_DEPLOYMENT_STATUSES
+)
+from utils.cache import cache, deployment_cache_key, project_cache_key
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def encode_payload(deployment: Deployment, job: Optional[DeploymentJob]) -> bytes:
+    """Compress the parts of a deployment that aren't kept as archive columns"""
+    payload = {
+        "logs": deployment.logs,
+        "job": {
+            "attempts": job.attempts,
+            "worker_id": job.worker_id,
+            "error": job.error,
+            "enqueued_at": _isoformat(job.enqueued_at),
+            "started_at": _isoformat(job.started_at),
+            "finished_at": _isoformat(job.finished_at)
+        } if job else None
+    }
+    return zlib.compress(json.dumps(payload).encode("utf-8"))
+
+
+def decode_payload(payload: bytes) -> dict:
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+def find_expired_deployments(
+    db: Session,
+    retention_days: int,
+    keep_latest: int,
+    limit: Optional[int] = None
+) -> List[int]:
+    """
+    Ids of finished deployments that fall outside the retention policy:
+    started more than retention_days ago, or not among the keep_latest most
+    recent deployments of their project. A zero disables that rule.
+    """
+    ranked = select(
+        Deployment.id,
+        Deployment.status,
+        Deployment.started_at,
+        func.row_number().over(
+            partition_by=Deployment.project_id,
+            order_by=(Deployment.started_at.desc(), Deployment.id.desc())
+        ).label("recency")
+    ).subquery()
+
+    rules = []
+    if retention_days > 0:
+        rules.append(ranked.c.started_at < datetime.utcnow() - timedelta(days=retention_days))
+    if keep_latest > 0:
+        rules.append(ranked.c.recency > keep_latest)
+    if not rules:
+        return []
+
+    query = select(ranked.c.id).where(
+        ranked.c.status.in_(TERMINAL_DEPLOYMENT_STATUSES), or_(*rules)
+    ).order_by(ranked.c.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return list(db.execute(query).scalars())
+
+
+def archive_deployments(
+    db: Session,
+    retention_days: Optional[int] = None,
+    keep_latest: Optional[int] = None,
+    batch_size: Optional[int] = None
+) -> dict:
+    """
+    Move expired deployments, with their log chunks and jobs, into
+    deployment_archive. The expired set is computed once per run (finished
+    deployments never become unexpired), then each batch of it is copied and
+    deleted in one transaction.
+    """
+    retention_days = settings.DEPLOY_RETENTION_DAYS if retention_days is None else retention_days
+    keep_latest = settings.DEPLOY_RETENTION_KEEP_LATEST if keep_latest is None else keep_latest
+    batch_size = batch_size or settings.DEPLOY_ARCHIVE_BATCH_SIZE
+
+    expired = find_expired_deployments(db, retention_days, keep_latest)
+    db.commit()
+
+    archived = batches = 0
+    for start in range(0, len(expired), batch_size):
+        deployments = db.query(Deployment).options(
+            selectinload(Deployment.log_chunks),
+            selectinload(Deployment.project)
+        ).filter(Deployment.id.in_(expired[start:start + batch_size])).all()
+        if not deployments:
+            continue
+        # Skip ids deleted since the expired set was computed (e.g. with their project)
+        deployment_ids = [deployment.id for deployment in deployments]
+        jobs = {
+            job.deployment_id: job for job in
+            db.query(DeploymentJob).filter(DeploymentJob.deployment_id.in_(deployment_ids)).all()
+        }
+        db.add_all([
+            DeploymentArchive(
+                deployment_id=deployment.id,
+                project_id=deployment.project_id,
+                user_id=deployment.project.user_id,
+                status=deployment.status,
+                started_at=deployment.started_at,
+                completed_at=deployment.completed_at,
+                payload=encode_payload(deployment, jobs.get(deployment.id))
+            )
+            for deployment in deployments
+        ])
+        project_ids = {deployment.project_id for deployment in deployments}
+
+        for model, column in (
+            (DeploymentJob, DeploymentJob.deployment_id),
+            (DeploymentLogChunk, DeploymentLogChunk.deployment_id),
+            (Deployment, Deployment.id)
+        ):
+            db.query(model).filter(column.in_(deployment_ids)).delete(synchronize_session=False)
+        db.commit()
+        db.expunge_all()
+
+        cache.delete_many(
+            [project_cache_key(project_id) for project_id in project_ids] +
+            [deployment_cache_key(deployment_id) for deployment_id in deployment_ids]
+        )
+        archived += len(deployment_ids)
+        batches += 1
+
+    return {
+        "archived": archived,
+        "batches": batches,
+        "retention_days": retention_days,
+        "keep_latest": keep_latest
+    }
+
+
+def get_archived_deployment(db: Session, deployment_id: int, user_id: Optional[int] = None) -> Optional[dict]:
+    """An archived deployment in the shape of the Deployment schema, or None"""
+    query = db.query(DeploymentArchive).filter(DeploymentArchive.deployment_id == deployment_id)
+    if user_id is not None:
+        query = query.filter(DeploymentArchive.user_id == user_id)
+    archived = query.first()
+    if not archived:
+        return None
+
+    return {
+        "id": archived.deployment_id,
+        "project_id": archived.project_id,
+        "status": archived.status,
+        "logs": decode_payload(archived.payload)["logs"],
+        "started_at": archived.started_at,
+        "completed_at": archived.completed_at
+    }
+
+
+def delete_project_archive(db: Session, project_id: int) -> int:
+    """Drop a project's archived deployments; the caller commits"""
+    return db.query(DeploymentArchive).filter(
+        DeploymentArchive.project_id == project_id
+    ).delete(synchronize_session=False)
@@ -0,0 +1,189 @@
+from datetime import date, datetime, timezone
+from typing import List, Optional
+from sqlalchemy import func, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from models import (
+    Deployment,
+    DeploymentArchive,
+    DeploymentDailyStats,
+    DeploymentDurationBin,
+    DeploymentStatus,
+    Project
+)
+from utils.aggregates import dialect_name, duration_seconds, day_bucket, day_key
+from utils.sketches import DDSketch
+
+KEY_COLUMNS = ["user_id", "project_id", "day", "status"]
+BIN_KEY_COLUMNS = ["project_id", "day", "bin"]
+
+# Rows per fetch when streaming durations for the sketch backfill
+BACKFILL_BATCH_SIZE = 1000
+
+
+def utc_day(value: datetime) -> date:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+def _increment(db: Session, model, key_columns: List[str], values: dict, counters: List[str]):
+    """Add counter deltas to one row, creating it if needed, in a single statement"""
+    dialect_insert = postgresql.insert if dialect_name(db) == "postgresql" else sqlite.insert
+    stmt = dialect_insert(model).values(**values)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={column: getattr(model, column) + getattr(stmt.excluded, column) for column in counters}
+    ))
+
+
+def _upsert(
+    db: Session,
+    user_id: int,
+    project_id: int,
+    day: date,
+    status: DeploymentStatus,
+    count: int,
+    duration: Optional[float] = None
+):
+    """Add deltas to one rollup row"""
+    _increment(db, DeploymentDailyStats, KEY_COLUMNS, {
+        "user_id": user_id,
+        "project_id": project_id,
+        "day": day,
+        "status": status,
+        "deployment_count": count,
+        "duration_count": 1 if duration is not None else 0,
+        "duration_sum": duration or 0.0,
+        "duration_sum_sq": (duration or 0.0) ** 2
+    }, ["deployment_count", "duration_count", "duration_sum", "duration_sum_sq"])
+
+
+def _record_duration(db: Session, user_id: int, project_id: int, day: date, duration: float):
+    """Add a finished deployment's duration to its project's daily sketch"""
+    _increment(db, DeploymentDurationBin, BIN_KEY_COLUMNS, {
+        "user_id": user_id,
+        "project_id": project_id,
+        "day": day,
+        "bin": DDSketch().index(duration),
+        "count": 1
+    }, ["count"])
+
+
+def record_deployment_created(db: Session, deployment: Deployment, user_id: int):
+    """Count a new (flushed) deployment; the caller commits"""
+    _upsert(db, user_id, deployment.project_id, utc_day(deployment.started_at), deployment.status, 1)
+
+
+def record_status_change(
+    db: Session,
+    deployment: Deployment,
+    user_id: int,
+    previous_status: DeploymentStatus,
+    new_status: DeploymentStatus,
+    duration: Optional[float] = None
+):
+    """
+    Move a deployment from its previous status bucket to the new one, adding
+    its duration (and duration sketch entry) once it has finished; the caller
+    commits.
+    """
+    day = utc_day(deployment.started_at)
+    _upsert(db, user_id, deployment.project_id, day, previous_status, -1)
+    _upsert(db, user_id, deployment.project_id, day, new_status, 1, duration)
+    if duration is not None:
+        _record_duration(db, user_id, deployment.project_id, day, duration)
+
+
+def _backfill_sources(db: Session):
+    """
+    Live and archived deployments as (query, user_id, project_id, status,
+    started_at, completed_at); archived history stays counted in analytics.
+    """
+    return [
+        (
+            db.query(Deployment).join(Project),
+            Project.user_id, Deployment.project_id, Deployment.status,
+            Deployment.started_at, Deployment.completed_at
+        ),
+        (
+            db.query(DeploymentArchive),
+            DeploymentArchive.user_id, DeploymentArchive.project_id, DeploymentArchive.status,
+            DeploymentArchive.started_at, DeploymentArchive.completed_at
+        )
+    ]
+
+
+def _backfill_duration_bins(db: Session):
+    """Rebuild the duration sketches by streaming finished deployments"""
+    sketch = DDSketch()
+    bins = {}
+    for query, user_id, project_id, _, started_at, completed_at in _backfill_sources(db):
+        finished = query.with_entities(user_id, project_id, started_at, completed_at).filter(
+            completed_at.isnot(None)
+        ).yield_per(BACKFILL_BATCH_SIZE)
+        for row_user_id, row_project_id, row_started_at, row_completed_at in finished:
+            duration = (row_completed_at - row_started_at).total_seconds()
+            key = (row_user_id, row_project_id, utc_day(row_started_at), sketch.index(duration))
+            bins[key] = bins.get(key, 0) + 1
+
+    db.query(DeploymentDurationBin).delete(synchronize_session=False)
+    if bins:
+        db.execute(insert(DeploymentDurationBin), [
+            {"user_id": user_id, "project_id": project_id, "day": day, "bin": index, "count": count}
+            for (user_id, project_id, day, index), count in bins.items()
+        ])
+
+
+def backfill_daily_stats(db: Session) -> int:
+    """
+    Rebuild the rollup and duration sketches from the deployments table and
+    the archive in one transaction
+    """
+    totals = {}
+    for query, user_id, project_id, status, started_at, completed_at in _backfill_sources(db):
+        duration = duration_seconds(db, started_at, completed_at)
+        day = day_bucket(started_at)
+        rows = query.with_entities(
+            user_id,
+            project_id,
+            day,
+            status,
+            func.count(),
+            func.count(duration),
+            func.coalesce(func.sum(duration), 0.0),
+            func.coalesce(func.sum(duration * duration), 0.0)
+        ).group_by(user_id, project_id, day, status).all()
+        for row_user_id, row_project_id, bucket, row_status, *counters in rows:
+            key = (row_user_id, row_project_id, date.fromisoformat(day_key(bucket)), row_status)
+            totals[key] = [a + b for a, b in zip(totals.get(key, [0, 0, 0.0, 0.0]), counters)]
+
+    db.query(DeploymentDailyStats).delete(synchronize_session=False)
+    if totals:
+        db.execute(insert(DeploymentDailyStats), [
+            {
+                "user_id": user_id,
+                "project_id": project_id,
+                "day": day,
+                "status": status,
+                "deployment_count": count,
+                "duration_count": duration_count,
+                "duration_sum": duration_sum,
+                "duration_sum_sq": duration_sum_sq
+            }
+            for (user_id, project_id, day, status), (count, duration_count, duration_sum, duration_sum_sq)
+            in totals.items()
+        ])
+    _backfill_duration_bins(db)
+    db.commit()
+    return len(totals)
+
+
+def delete_project_rollups(db: Session, project_id: int) -> int:
+    """Drop a project's rollup rows and duration sketches; the caller commits"""
+    db.query(DeploymentDurationBin).filter(
+        DeploymentDurationBin.project_id == project_id
+    ).delete(synchronize_session=False)
+    return db.query(DeploymentDailyStats).filter(
+        DeploymentDailyStats.project_id == project_id
+    ).delete(synchronize_session=False)
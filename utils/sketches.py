@@ -0,0 +1,78 @@
+import math
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Query
+from models import DeploymentDurationBin
+
+# Relative accuracy of every stored sketch; bins written with one value can't
+# be merged with another, so changing it requires rebuilding the bins
+RELATIVE_ACCURACY = 0.01
+
+# Durations below this many seconds share the lowest bin
+MIN_INDEXABLE_VALUE = 1e-3
+
+PERCENTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+
+
+class DDSketch:
+    """
+    Mergeable quantile sketch with relative-error guarantees (DDSketch).
+
+    Each value lands in the logarithmic bin ceil(log_gamma(value)), so any
+    quantile is answered to within RELATIVE_ACCURACY. Merging sketches is
+    adding bin counts, which is why the bins can be stored as rows and merged
+    with SUM ... GROUP BY bin.
+    """
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.count = 0
+
+    def index(self, value: float) -> int:
+        return math.ceil(math.log(max(value, MIN_INDEXABLE_VALUE)) / self._log_gamma)
+
+    def add(self, value: float, count: int = 1):
+        self.add_bin(self.index(value), count)
+
+    def add_bin(self, index: int, count: int):
+        self.bins[index] = self.bins.get(index, 0) + count
+        self.count += count
+
+    def merge(self, other: "DDSketch"):
+        for index, count in other.bins.items():
+            self.add_bin(index, count)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate q-quantile (0 <= q <= 1), or None for an empty sketch"""
+        if self.count <= 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    @classmethod
+    def from_bins(cls, bins: Iterable[Tuple[int, int]]) -> "DDSketch":
+        sketch = cls()
+        for index, count in bins:
+            if count:
+                sketch.add_bin(index, count)
+        return sketch
+
+
+def duration_percentiles(bins: Query) -> Dict[str, float]:
+    """Merge the stored sketch bins selected by a filtered DeploymentDurationBin query"""
+    sketch = DDSketch.from_bins(
+        bins.with_entities(
+            DeploymentDurationBin.bin, func.sum(DeploymentDurationBin.count)
+        ).group_by(DeploymentDurationBin.bin).all()
+    )
+    return {
+        name: round(sketch.quantile(q), 2) if sketch.count else 0
+        for name, q in PERCENTILES.items()
+    }
@@ -0,0 +1,34 @@
+# Workers package initialization
+from .deployment_worker import (
+    worker_pool,
+    DeploymentWorkerPool,
+    enqueue_deployment,
+    cancel_queued_job,
+    cancel_job,
+    cancellation_registry,
+    DeploymentCancelled,
+    set_deployment_status,
+    apply_deployment_status,
+    notify_deployment_status,
+    simulate_deployment
+)
+from .snapshotter import snapshotter, DashboardSnapshotter
+from .activity import last_seen, LastSeenTracker
+
+__all__ = [
+    "worker_pool",
+    "DeploymentWorkerPool",
+    "enqueue_deployment",
+    "cancel_queued_job",
+    "cancel_job",
+    "cancellation_registry",
+    "DeploymentCancelled",
+    "set_deployment_status",
+    "apply_deployment_status",
+    "notify_deployment_status",
+    "simulate_deployment",
+    "snapshotter",
+    "DashboardSnapshotter",
+    "last_seen",
+    "LastSeenTracker"
+]
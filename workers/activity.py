@@ -0,0 +1,106 @@
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import bindparam, or_, update
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models import User
+from utils.logger import logger, log_error
+
+
+class LastSeenTracker:
+    """
+    Write-behind buffer for users' last-seen timestamps.
+
+    touch() only records the newest timestamp per user in memory; a background
+    thread writes everything buffered in one executemany UPDATE per interval,
+    so request handling never waits on the users table.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        interval: Optional[float] = None
+    ):
+        self.session_factory = session_factory
+        self.interval = interval if interval is not None else settings.LAST_SEEN_FLUSH_INTERVAL_SECONDS
+        self._pending: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def touch(self, user_id: int, seen_at: Optional[datetime] = None):
+        seen_at = seen_at or datetime.utcnow()
+        with self._lock:
+            previous = self._pending.get(user_id)
+            if previous is None or seen_at > previous:
+                self._pending[user_id] = seen_at
+
+    @property
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="last-seen-tracker", daemon=True)
+        self._thread.start()
+        logger.info(f"👣 Flushing last-seen timestamps every {self.interval}s")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+        self.flush()
+
+    def flush(self, db: Optional[Session] = None) -> int:
+        """Write all buffered timestamps in one batch; returns the number of users written"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        own_session = db is None
+        db = db or self.session_factory()
+        try:
+            # Never move a timestamp backwards (another process may have flushed a newer one)
+            users = User.__table__
+            db.execute(
+                update(users).where(
+                    users.c.id == bindparam("user_id"),
+                    or_(users.c.last_seen_at.is_(None), users.c.last_seen_at < bindparam("seen_at"))
+                ).values(last_seen_at=bindparam("seen_at")),
+                [{"user_id": user_id, "seen_at": seen_at} for user_id, seen_at in pending.items()]
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Put the batch back so the next flush retries it
+            for user_id, seen_at in pending.items():
+                self.touch(user_id, seen_at)
+            raise
+        finally:
+            if own_session:
+                db.close()
+        return len(pending)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                log_error(e, "Last-seen flush")
+
+
+# Global last-seen tracker instance
+last_seen = LastSeenTracker()
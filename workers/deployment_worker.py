@@ -0,0 +1,668 @@
+import os
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.sql import Select
+
+from config import settings
+from database import SessionLocal
+from models import Deployment, DeploymentJob, DeploymentStatus, JobStatus, TERMINAL_DEPLOYMENT_STATUSES
+from utils.cache import invalidate_deployment
+from utils.deployment_logs import append_log
+from utils.events import event_bus, publish_deployment_status
+from utils.aggregates import dialect_name
+from utils.rollups import record_deployment_created, record_status_change
+from utils.logger import logger, log_deployment_event, log_error
+
+# How many eligible queued jobs a worker tries per claim attempt
+CLAIM_BATCH_SIZE = 20
+
+# PostgreSQL advisory lock key serializing job claims across processes
+CLAIM_LOCK_KEY = 0x6465706C  # "depl"
+
+# Event bus channel carrying cancel requests to whichever process runs the deployment
+CANCEL_CHANNEL = "deployments:cancel"
+
+
+class DeploymentCancelled(Exception):
+    """Raised at a cancellation checkpoint once a running deployment is cancelled"""
+
+
+class CancellationRegistry:
+    """
+    Cancel signals for the deployments running in this process.
+    
+    Workers register each deployment they run and check its event at every
+    step; cancel requests from any process arrive through the event bus.
+    """
+    
+    def __init__(self):
+        self._events: Dict[int, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._unsubscribe: Optional[Callable[[], None]] = None
+    
+    def register(self, deployment_id: int) -> threading.Event:
+        self._listen()
+        with self._lock:
+            return self._events.setdefault(deployment_id, threading.Event())
+    
+    def unregister(self, deployment_id: int):
+        with self._lock:
+            self._events.pop(deployment_id, None)
+    
+    def is_running(self, deployment_id: int) -> bool:
+        with self._lock:
+            return deployment_id in self._events
+    
+    def running_count(self) -> int:
+        with self._lock:
+            return len(self._events)
+    
+    def cancel(self, deployment_id: int) -> bool:
+        """Signal a deployment running in this process, returning False if there is none"""
+        with self._lock:
+            cancelled = self._events.get(deployment_id)
+        if cancelled is None:
+            return False
+        cancelled.set()
+        return True
+    
+    def request_cancel(self, deployment_id: int):
+        """Signal the deployment's worker, in this process or any other"""
+        self.cancel(deployment_id)
+        event_bus.publish(CANCEL_CHANNEL, {"type": "deployment.cancel", "deployment_id": deployment_id})
+    
+    def _listen(self):
+        with self._lock:
+            if self._unsubscribe is None:
+                self._unsubscribe = event_bus.subscribe(
+                    CANCEL_CHANNEL, lambda event: self.cancel(event["deployment_id"])
+                )
+
+
+def _utcnow() -> datetime:
+    return datetime.utcnow()
+
+
+def _as_naive_utc(value: datetime) -> datetime:
+    """Normalize DB timestamps (naive on SQLite, aware on PostgreSQL) to naive UTC"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _step_delay(seconds: float, cancelled: Optional[threading.Event] = None):
+    """
+    Sleep for a simulated build step, scaled by DEPLOY_STEP_DELAY_SCALE.
+    
+    This is also the cancellation checkpoint: the wait ends early and raises
+    DeploymentCancelled as soon as the cancelled event is set.
+    """
+    delay = seconds * settings.DEPLOY_STEP_DELAY_SCALE
+    if cancelled is None:
+        if delay > 0:
+            time.sleep(delay)
+        return
+    if cancelled.wait(delay) if delay > 0 else cancelled.is_set():
+        raise DeploymentCancelled()
+
+
+def apply_deployment_status(
+    db: Session,
+    deployment: Deployment,
+    new_status: DeploymentStatus,
+    message: Optional[str] = None
+) -> Optional[DeploymentStatus]:
+    """
+    Write a deployment status transition (with an optional log line and the
+    daily rollup update) in the caller's transaction, without committing.
+    
+    The write is a compare-and-set on the status this session last saw, so a
+    concurrent transition is never lost: on a miss the deployment is re-read
+    and the transition retried from its actual status. Returns the previous
+    status, or None (writing nothing) once the deployment has finished, so a
+    cancelled deployment can't be overwritten by its worker.
+    """
+    while True:
+        previous_status = deployment.status
+        if previous_status in TERMINAL_DEPLOYMENT_STATUSES:
+            return None
+        values = {Deployment.status: new_status}
+        duration = None
+        if new_status in TERMINAL_DEPLOYMENT_STATUSES:
+            values[Deployment.completed_at] = datetime.utcnow()
+            duration = (values[Deployment.completed_at] - _as_naive_utc(deployment.started_at)).total_seconds()
+        updated = db.query(Deployment).filter(
+            Deployment.id == deployment.id,
+            Deployment.status == previous_status
+        ).update(values, synchronize_session=False)
+        if updated:
+            break
+        db.refresh(deployment)
+    record_status_change(db, deployment, deployment.project.user_id, previous_status, new_status, duration)
+    if message:
+        append_log(db, deployment.id, message)
+    return previous_status
+
+
+def notify_deployment_status(deployment: Deployment, previous_status: DeploymentStatus):
+    """After commit: invalidate cached reads and publish the transition on the event bus"""
+    invalidate_deployment(deployment.id, deployment.project_id)
+    publish_deployment_status(deployment, deployment.project.user_id, previous_status)
+
+
+def set_deployment_status(
+    db: Session,
+    deployment: Deployment,
+    new_status: DeploymentStatus,
+    message: Optional[str] = None
+) -> bool:
+    """
+    Commit a deployment status transition (see apply_deployment_status),
+    then invalidate cached reads and publish it. Returns False, rolling back
+    the session, if the deployment had already finished.
+    """
+    previous_status = apply_deployment_status(db, deployment, new_status, message)
+    if previous_status is None:
+        db.rollback()
+        db.refresh(deployment)
+        return False
+    db.commit()
+    notify_deployment_status(deployment, previous_status)
+    return True
+
+
+def simulate_deployment(deployment_id: int, db: Session, cancelled: Optional[threading.Event] = None):
+    """
+    Simulate the deployment process for a claimed job.
+    
+    Raises DeploymentCancelled at the next step once cancelled is set or the
+    deployment has been finished elsewhere.
+    """
+    def advance(new_status: DeploymentStatus, message: str):
+        if not set_deployment_status(db, deployment, new_status, message):
+            raise DeploymentCancelled()
+    
+    _step_delay(2, cancelled)  # Initial delay
+    
+    # Get deployment
+    deployment = db.query(Deployment).filter(Deployment.id == deployment_id).first()
+    if not deployment or deployment.status != DeploymentStatus.PENDING:
+        return
+    
+    # Simulate building
+    advance(DeploymentStatus.BUILDING, "Starting build process...\n")
+    
+    _step_delay(3, cancelled)
+    append_log(db, deployment.id, "✓ Dependencies installed\n✓ Building application...\n")
+    db.commit()
+    invalidate_deployment(deployment.id, deployment.project_id)
+    
+    # Simulate deploying
+    advance(DeploymentStatus.DEPLOYING, "✓ Build completed successfully\nStarting deployment...\n")
+    
+    _step_delay(2, cancelled)
+    
+    # Randomly succeed or fail
+    if random.random() > 0.2:  # 80% success rate
+        advance(DeploymentStatus.SUCCESS, "✓ Deployment completed successfully!\n")
+    else:
+        advance(DeploymentStatus.FAILED, "✗ Deployment failed: Build timeout\n")
+
+
+def enqueue_deployment(db: Session, deployment: Deployment, user_id: int) -> DeploymentJob:
+    """Add a queue entry for a flushed deployment and count it in the daily rollup; the caller commits"""
+    job = DeploymentJob(
+        deployment_id=deployment.id,
+        user_id=user_id,
+        status=JobStatus.QUEUED,
+        enqueued_at=_utcnow()
+    )
+    db.add(job)
+    record_deployment_created(db, deployment, user_id)
+    return job
+
+
+def cancel_queued_job(db: Session, deployment_id: int) -> bool:
+    """Cancel a deployment's job if no worker has claimed it yet; the caller commits"""
+    result = db.execute(
+        update(DeploymentJob)
+        .where(
+            DeploymentJob.deployment_id == deployment_id,
+            DeploymentJob.status == JobStatus.QUEUED
+        )
+        .values(status=JobStatus.CANCELLED, finished_at=_utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def cancel_job(db: Session, deployment_id: int) -> bool:
+    """
+    Cancel a deployment's job whether queued or running, freeing its
+    concurrency slot straight away; the caller commits.
+    """
+    result = db.execute(
+        update(DeploymentJob)
+        .where(
+            DeploymentJob.deployment_id == deployment_id,
+            DeploymentJob.status.in_([JobStatus.QUEUED, JobStatus.RUNNING])
+        )
+        .values(status=JobStatus.CANCELLED, finished_at=_utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def finish_job(db: Session, job_id: int, job_status: JobStatus, error: Optional[str] = None) -> bool:
+    """Record a job's outcome unless it was cancelled while running"""
+    result = db.execute(
+        update(DeploymentJob)
+        .where(DeploymentJob.id == job_id, DeploymentJob.status == JobStatus.RUNNING)
+        .values(status=job_status, error=error, finished_at=_utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def find_coalescable_deployments(db: Session, project_ids: Iterable[int]) -> Dict[int, List[Deployment]]:
+    """PENDING deployments per project whose job no worker has claimed yet, oldest first"""
+    pending: Dict[int, List[Deployment]] = {}
+    rows = db.query(Deployment).join(
+        DeploymentJob, DeploymentJob.deployment_id == Deployment.id
+    ).filter(
+        Deployment.project_id.in_(list(project_ids)),
+        Deployment.status == DeploymentStatus.PENDING,
+        DeploymentJob.status == JobStatus.QUEUED
+    ).order_by(Deployment.id).all()
+    for deployment in rows:
+        pending.setdefault(deployment.project_id, []).append(deployment)
+    return pending
+
+
+def supersede_deployments(
+    db: Session,
+    superseded: Iterable[Deployment],
+    replacement_id: int
+) -> List[Tuple[Deployment, DeploymentStatus]]:
+    """
+    Cancel pending deployments replaced by a newer one in the caller's
+    transaction, so no worker can claim them once it commits. Deployments a
+    worker claimed in the meantime are left alone. Returns the transitions
+    to pass to notify_deployment_status after the commit.
+    """
+    transitions = []
+    for deployment in superseded:
+        if not cancel_queued_job(db, deployment.id):
+            continue
+        previous_status = apply_deployment_status(
+            db, deployment, DeploymentStatus.CANCELLED,
+            f"✗ Superseded by deployment #{replacement_id}\n"
+        )
+        if previous_status is not None:
+            transitions.append((deployment, previous_status))
+    return transitions
+
+
+def claim_lock_statement(db: Session) -> Optional[Select]:
+    """
+    Statement taking the transaction-scoped claim lock, or None where the
+    database already serializes writers (SQLite holds one write lock).
+    """
+    if dialect_name(db) == "postgresql":
+        return select(func.pg_advisory_xact_lock(CLAIM_LOCK_KEY))
+    return None
+
+
+def claim_next_job(
+    db: Session,
+    worker_id: str,
+    max_concurrent: int,
+    max_per_user: int
+) -> Optional[DeploymentJob]:
+    """
+    Atomically claim the oldest queued job that fits the concurrency limits.
+    
+    The claim is a conditional UPDATE that only succeeds while the job is still
+    queued and the global and per-user running counts are under their limits.
+    Each attempt first takes the claim lock, so claims from every worker (in
+    any process) are serialized and the counts the UPDATE checks include all
+    earlier claims; without it two READ COMMITTED transactions claiming
+    different jobs could both pass the limits. The lock is released when the
+    attempt commits.
+    Users already at their per-user limit are excluded from the candidates,
+    so a backlog from one user can't hide other users' jobs.
+    """
+    running = aliased(DeploymentJob)
+    total_running = select(func.count(running.id)).where(
+        running.status == JobStatus.RUNNING
+    ).scalar_subquery()
+    capped_users = select(running.user_id).where(
+        running.status == JobStatus.RUNNING
+    ).group_by(running.user_id).having(func.count(running.id) >= max_per_user)
+    
+    candidates = db.query(DeploymentJob.id, DeploymentJob.user_id).filter(
+        DeploymentJob.status == JobStatus.QUEUED,
+        DeploymentJob.user_id.notin_(capped_users),
+        total_running < max_concurrent
+    ).order_by(DeploymentJob.enqueued_at, DeploymentJob.id).limit(CLAIM_BATCH_SIZE).all()
+    
+    lock = claim_lock_statement(db)
+    for job_id, user_id in candidates:
+        if lock is not None:
+            db.execute(lock)
+        user_running = select(func.count(running.id)).where(
+            running.status == JobStatus.RUNNING,
+            running.user_id == user_id
+        ).scalar_subquery()
+        result = db.execute(
+            update(DeploymentJob)
+            .where(
+                DeploymentJob.id == job_id,
+                DeploymentJob.status == JobStatus.QUEUED,
+                total_running < max_concurrent,
+                user_running < max_per_user
+            )
+            .values(
+                status=JobStatus.RUNNING,
+                worker_id=worker_id,
+                started_at=_utcnow(),
+                heartbeat_at=_utcnow(),
+                attempts=DeploymentJob.attempts + 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        if result.rowcount == 1:
+            return db.query(DeploymentJob).filter(DeploymentJob.id == job_id).first()
+    return None
+
+
+def heartbeat_jobs(db: Session, job_ids: Iterable[int]) -> int:
+    """Mark running jobs as still alive"""
+    job_ids = list(job_ids)
+    if not job_ids:
+        return 0
+    result = db.execute(
+        update(DeploymentJob)
+        .where(DeploymentJob.id.in_(job_ids), DeploymentJob.status == JobStatus.RUNNING)
+        .values(heartbeat_at=_utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def requeue_stale_jobs(db: Session, timeout_seconds: int) -> int:
+    """
+    Put back jobs whose worker died mid-run (no heartbeat within the timeout).
+    
+    The deployment is reset to PENDING in the same transaction so the next
+    worker runs it from the start. A deployment that finished before its
+    worker died just has its job closed.
+    """
+    cutoff = datetime.utcfromtimestamp(time.time() - timeout_seconds)
+    stale = (
+        DeploymentJob.status == JobStatus.RUNNING,
+        func.coalesce(DeploymentJob.heartbeat_at, DeploymentJob.started_at) < cutoff
+    )
+    jobs = db.query(DeploymentJob.id, DeploymentJob.deployment_id).filter(*stale).all()
+    
+    requeued = 0
+    for job_id, deployment_id in jobs:
+        result = db.execute(
+            update(DeploymentJob)
+            .where(DeploymentJob.id == job_id, *stale)
+            .values(status=JobStatus.QUEUED, worker_id=None, started_at=None, heartbeat_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            db.rollback()
+            continue
+        deployment = db.query(Deployment).filter(Deployment.id == deployment_id).first()
+        if deployment is not None and deployment.status == DeploymentStatus.PENDING:
+            db.commit()
+            requeued += 1
+        elif deployment is not None and set_deployment_status(
+            db, deployment, DeploymentStatus.PENDING, "↻ Worker lost, deployment requeued\n"
+        ):
+            requeued += 1
+        else:
+            # Finished (or deleted) before the worker died; the requeue was rolled back
+            finish_job(
+                db, job_id,
+                JobStatus.DONE if deployment is not None and deployment.status != DeploymentStatus.CANCELLED
+                else JobStatus.CANCELLED
+            )
+    return requeued
+
+
+def queue_depth(db: Session) -> dict:
+    """Current queue depth by job status and the age of the oldest queued job"""
+    counts = dict(
+        db.query(DeploymentJob.status, func.count(DeploymentJob.id))
+        .filter(DeploymentJob.status.in_([JobStatus.QUEUED, JobStatus.RUNNING]))
+        .group_by(DeploymentJob.status)
+        .all()
+    )
+    oldest = db.query(func.min(DeploymentJob.enqueued_at)).filter(
+        DeploymentJob.status == JobStatus.QUEUED
+    ).scalar()
+    return {
+        "queued": counts.get(JobStatus.QUEUED, 0),
+        "running": counts.get(JobStatus.RUNNING, 0),
+        "oldest_queued_seconds": (
+            round((_utcnow() - _as_naive_utc(oldest)).total_seconds(), 3) if oldest else 0
+        )
+    }
+
+
+class QueueMetrics:
+    """Per-process counters for the deployment worker pool"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self._lock:
+            self.claimed = 0
+            self.completed = 0
+            self.failed = 0
+            self.cancelled = 0
+            self.wait_count = 0
+            self.wait_sum = 0.0
+            self.wait_max = 0.0
+    
+    def record_claim(self, wait_seconds: float):
+        with self._lock:
+            self.claimed += 1
+            self.wait_count += 1
+            self.wait_sum += wait_seconds
+            self.wait_max = max(self.wait_max, wait_seconds)
+    
+    def record_result(self, job_status: JobStatus):
+        with self._lock:
+            if job_status == JobStatus.DONE:
+                self.completed += 1
+            elif job_status == JobStatus.CANCELLED:
+                self.cancelled += 1
+            else:
+                self.failed += 1
+    
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "claimed": self.claimed,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "wait_seconds": {
+                    "count": self.wait_count,
+                    "avg": round(self.wait_sum / self.wait_count, 3) if self.wait_count else 0,
+                    "max": round(self.wait_max, 3)
+                }
+            }
+
+
+class DeploymentWorkerPool:
+    """Pool of threads that claim deployment jobs from the queue table"""
+    
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        workers: Optional[int] = None,
+        max_concurrent: Optional[int] = None,
+        max_per_user: Optional[int] = None,
+        poll_interval: Optional[float] = None
+    ):
+        self.session_factory = session_factory
+        self.workers = workers if workers is not None else settings.DEPLOY_WORKERS
+        self.max_concurrent = max_concurrent if max_concurrent is not None else settings.DEPLOY_MAX_CONCURRENT
+        self.max_per_user = max_per_user if max_per_user is not None else settings.DEPLOY_MAX_CONCURRENT_PER_USER
+        self.poll_interval = poll_interval if poll_interval is not None else settings.DEPLOY_POLL_INTERVAL_SECONDS
+        self.metrics = QueueMetrics()
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._active_jobs = set()
+        self._active_lock = threading.Lock()
+        self._worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+    
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+    
+    def start(self):
+        """Recover abandoned jobs and start the worker and maintenance threads"""
+        if self.running:
+            return
+        self.sweep()
+        
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(
+                target=self._worker_loop,
+                args=(f"{self._worker_prefix}:{index}",),
+                name=f"deploy-worker-{index}",
+                daemon=True
+            )
+            for index in range(self.workers)
+        ] + [
+            threading.Thread(target=self._maintenance_loop, name="deploy-maintenance", daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"🛠️  Started {self.workers} deployment workers")
+    
+    def stop(self, timeout: float = 5.0):
+        """Signal the worker threads to exit and wait for them"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+    
+    def sweep(self) -> int:
+        """Heartbeat this process's running jobs, then requeue other workers' stale ones"""
+        db = self.session_factory()
+        try:
+            with self._active_lock:
+                active = list(self._active_jobs)
+            heartbeat_jobs(db, active)
+            requeued = requeue_stale_jobs(db, settings.DEPLOY_JOB_TIMEOUT_SECONDS)
+            if requeued:
+                logger.info(f"♻️  Requeued {requeued} stale deployment jobs")
+                self.wake()
+            return requeued
+        finally:
+            db.close()
+    
+    def wake(self):
+        """Tell idle workers that new jobs were enqueued"""
+        self._wake.set()
+    
+    def run_once(self, worker_id: Optional[str] = None) -> bool:
+        """Claim and run a single job, returning False if none was available"""
+        worker_id = worker_id or f"{self._worker_prefix}:{threading.current_thread().name}"
+        db = self.session_factory()
+        try:
+            job = claim_next_job(db, worker_id, self.max_concurrent, self.max_per_user)
+            if job is None:
+                return False
+            self.metrics.record_claim(
+                (_as_naive_utc(job.started_at) - _as_naive_utc(job.enqueued_at)).total_seconds()
+            )
+            self._execute(db, job)
+            return True
+        finally:
+            db.close()
+    
+    def _execute(self, db: Session, job: DeploymentJob):
+        job_id, deployment_id = job.id, job.deployment_id
+        log_deployment_event(deployment_id, "job claimed", {"job_id": job_id, "worker": job.worker_id})
+        cancelled = cancellation_registry.register(deployment_id)
+        with self._active_lock:
+            self._active_jobs.add(job_id)
+        error = None
+        try:
+            simulate_deployment(deployment_id, db, cancelled)
+            job_status = JobStatus.DONE
+        except DeploymentCancelled:
+            db.rollback()
+            log_deployment_event(deployment_id, "job cancelled", {"job_id": job_id})
+            job_status = JobStatus.CANCELLED
+        except Exception as e:
+            db.rollback()
+            log_error(e, f"Deployment job {job_id}")
+            job_status = JobStatus.FAILED
+            error = str(e)
+        finally:
+            cancellation_registry.unregister(deployment_id)
+            with self._active_lock:
+                self._active_jobs.discard(job_id)
+        finish_job(db, job_id, job_status, error)
+        self.metrics.record_result(job_status)
+    
+    def _worker_loop(self, worker_id: str):
+        while not self._stop.is_set():
+            try:
+                if self.run_once(worker_id):
+                    continue
+            except Exception as e:
+                log_error(e, f"Deployment worker {worker_id}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+    
+    def _maintenance_loop(self):
+        while not self._stop.wait(settings.DEPLOY_HEARTBEAT_INTERVAL_SECONDS):
+            try:
+                self.sweep()
+            except Exception as e:
+                log_error(e, "Deployment job sweep")
+    
+    def get_stats(self, db: Session) -> dict:
+        """Queue depth plus this process's worker metrics"""
+        return {
+            "workers": self.workers if self.running else 0,
+            "running_here": cancellation_registry.running_count(),
+            "max_concurrent": self.max_concurrent,
+            "max_concurrent_per_user": self.max_per_user,
+            **queue_depth(db),
+            **self.metrics.snapshot()
+        }
+
+
+# Global cancellation registry
+cancellation_registry = CancellationRegistry()
+
+
+# Global worker pool instance
+worker_pool = DeploymentWorkerPool()
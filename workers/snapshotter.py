@@ -0,0 +1,154 @@
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from utils.cache import cache
+from utils.logger import logger, log_error
+
+# A snapshot older than this many intervals is recomputed in the background on read
+STALE_AFTER_INTERVALS = 2
+
+Compute = Callable[[Session], dict]
+
+
+class DashboardSnapshotter:
+    """
+    Periodically recomputes expensive dashboard payloads and stores them.
+
+    Snapshots are kept in this process and in Redis, so every worker serves
+    the same copy; with Redis available only one process per interval
+    recomputes each snapshot (the others find the refresh lease taken).
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        interval: Optional[float] = None
+    ):
+        self.session_factory = session_factory
+        self.interval = interval if interval is not None else settings.ADMIN_SNAPSHOT_INTERVAL_SECONDS
+        self._computations: Dict[str, Compute] = {}
+        self._snapshots: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._name_locks: Dict[str, threading.Lock] = {}
+        self._refreshers: Dict[str, threading.Thread] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def register(self, name: str, compute: Compute):
+        """Add a payload to snapshot; compute receives a database session"""
+        self._computations[name] = compute
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="dashboard-snapshotter", daemon=True)
+        self._thread.start()
+        logger.info(f"📸 Refreshing {len(self._computations)} dashboard snapshots every {self.interval}s")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def refresh(self, name: str, db: Session) -> dict:
+        """Recompute a snapshot now and store it"""
+        snapshot = {
+            "generated_at": time.time(),
+            "data": self._computations[name](db)
+        }
+        with self._lock:
+            self._snapshots[name] = snapshot
+        if self.interval > 0:
+            cache.set(self._cache_key(name), snapshot, int(self.interval * STALE_AFTER_INTERVALS) + 1)
+        return snapshot
+
+    def get(self, name: str, db: Session, fresh: bool = False) -> dict:
+        """
+        The stored payload plus generated_at and staleness_seconds metadata.
+        Computed inline when fresh is requested, snapshots are disabled, or
+        none is stored yet (one caller per name computes, the others wait for
+        it). A snapshot that is too old is still served while a single
+        background refresh replaces it.
+        """
+        if fresh or self.interval <= 0:
+            snapshot = self.refresh(name, db)
+        else:
+            snapshot = self._load(name)
+            if snapshot is None:
+                with self._name_lock(name):
+                    snapshot = self._load(name) or self.refresh(name, db)
+            elif time.time() - snapshot["generated_at"] > self.interval * STALE_AFTER_INTERVALS:
+                self.refresh_in_background(name)
+        return {
+            **snapshot["data"],
+            "generated_at": datetime.utcfromtimestamp(snapshot["generated_at"]).isoformat(),
+            "staleness_seconds": round(max(time.time() - snapshot["generated_at"], 0), 3)
+        }
+
+    def refresh_in_background(self, name: str) -> threading.Thread:
+        """Recompute a snapshot on a background thread, unless that is already happening"""
+        with self._lock:
+            refresher = self._refreshers.get(name)
+            if refresher is None or not refresher.is_alive():
+                refresher = threading.Thread(
+                    target=self._refresh_with_session, args=(name,), name=f"snapshot-refresh-{name}", daemon=True
+                )
+                self._refreshers[name] = refresher
+                refresher.start()
+            return refresher
+
+    def _refresh_with_session(self, name: str):
+        db = self.session_factory()
+        try:
+            with self._name_lock(name):
+                self.refresh(name, db)
+        except Exception as e:
+            log_error(e, f"Dashboard snapshot {name}")
+        finally:
+            db.close()
+
+    def _name_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._name_locks.setdefault(name, threading.Lock())
+
+    def _load(self, name: str) -> Optional[dict]:
+        """The newest snapshot available, shared (Redis) or local"""
+        with self._lock:
+            local = self._snapshots.get(name)
+        shared = cache.get(self._cache_key(name))
+        candidates = [snapshot for snapshot in (local, shared) if snapshot]
+        return max(candidates, key=lambda snapshot: snapshot["generated_at"]) if candidates else None
+
+    def _cache_key(self, name: str) -> str:
+        return f"snapshot:{name}"
+
+    def _loop(self):
+        while not self._stop.is_set():
+            for name in list(self._computations):
+                # The lease expires with the interval, so exactly one process refreshes per tick
+                if cache.is_connected() and not cache.acquire_lock(f"snapshot:{name}", max(int(self.interval), 1)):
+                    continue
+                db = self.session_factory()
+                try:
+                    self.refresh(name, db)
+                except Exception as e:
+                    log_error(e, f"Dashboard snapshot {name}")
+                finally:
+                    db.close()
+            self._stop.wait(self.interval)
+
+
+# Global snapshotter instance
+snapshotter = DashboardSnapshotter()